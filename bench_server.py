@@ -0,0 +1,607 @@
+"""
+Protocol load generator and benchmark for server.py.
+
+Opens many framed connections and drives a weighted mix of GET_BALANCE,
+SEND_TRANSACTION, GET_HISTORY, LOGIN, REGISTER and block submissions,
+then reports throughput and latency percentiles per command.
+
+By default the server runs in this process against a stand-in database
+(in-memory sqlite behind the small slice of the mysql.connector API that
+server.py uses), so no MySQL is needed. Point --target at a running
+server to measure it instead.
+
+    python bench_server.py --connections 32 --duration 20 --out bench.json
+    python bench_server.py --mix GET_BALANCE=80,SEND_TRANSACTION=20
+    python bench_server.py --target 127.0.0.1:5050 --users 100
+    python bench_server.py --startup 5      # import time and time to first accept
+    python bench_server.py --chain-load 1000000   # load_blockchain time and peak memory
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import socket
+import sqlite3
+import subprocess
+import sys
+import threading
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import blake3
+
+HEADER = 64
+FORMAT = 'utf-8'
+DISCONNECT_MESSAGE = "!DISCONNECT"
+
+DEFAULT_MIX = "GET_BALANCE=40,SEND_TRANSACTION=20,GET_HISTORY=15,LOGIN=15,REGISTER=5,BLOCK=5"
+COMMANDS = ("GET_BALANCE", "SEND_TRANSACTION", "GET_HISTORY", "LOGIN", "REGISTER", "BLOCK")
+BENCH_PASSWORD = "bench-password"
+BENCH_HARDWARE = {"cpu_id": "BENCH_CPU", "ram_id": "BENCH_RAM", "disk_serial": "BENCH_DISK"}
+GENESIS_HASH = "0" * 64
+MAX_MINING_ATTEMPTS = 5_000  # past this, submit anyway and measure the rejection path
+
+# -----------------------------
+# Stand-in database
+# -----------------------------
+STANDIN_SCHEMA = [
+    """CREATE TABLE customer_info (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE NOT NULL,
+        password TEXT NOT NULL,
+        cpu_id TEXT,
+        ram_id TEXT,
+        motherboard_id TEXT,
+        time_account_created TEXT,
+        word_list TEXT,
+        balance REAL DEFAULT 0,
+        version INTEGER NOT NULL DEFAULT 0
+    )""",
+    """CREATE TABLE blocks (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        block_id INTEGER UNIQUE NOT NULL,
+        nonce TEXT NOT NULL,
+        previous_hash TEXT NOT NULL,
+        miner_id TEXT NOT NULL,
+        transactions TEXT,
+        block_hash TEXT NOT NULL,
+        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        difficulty INTEGER NOT NULL,
+        state_root TEXT,
+        tx_root TEXT
+    )""",
+    """CREATE TABLE transactions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        transaction_id TEXT UNIQUE NOT NULL,
+        from_username TEXT NOT NULL,
+        to_username TEXT NOT NULL,
+        amount REAL NOT NULL,
+        fee REAL DEFAULT 0,
+        status TEXT DEFAULT 'pending',
+        block_id INTEGER NULL,
+        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )""",
+    """CREATE TABLE balance_shards (
+        username TEXT NOT NULL,
+        shard INTEGER NOT NULL,
+        balance REAL NOT NULL DEFAULT 0,
+        version INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (username, shard)
+    )""",
+    """CREATE TABLE idempotency_keys (
+        idem_key TEXT PRIMARY KEY,
+        fingerprint TEXT NOT NULL,
+        reply TEXT NOT NULL,
+        created_at INTEGER NOT NULL
+    )""",
+    "CREATE INDEX tx_from ON transactions (from_username)",
+    "CREATE INDEX tx_to ON transactions (to_username)",
+]
+
+class StandInCursor:
+    """mysql.connector-style cursor over sqlite ('%s' placeholders)."""
+    def __init__(self, db):
+        self._db = db
+        self._cur = db._conn.cursor()
+
+    def execute(self, query, params=()):
+        with self._db._lock:
+            self._cur.execute(query.replace("%s", "?"), tuple(params))
+
+    def executemany(self, query, rows):
+        with self._db._lock:
+            self._cur.executemany(query.replace("%s", "?"), [tuple(row) for row in rows])
+
+    def fetchone(self):
+        with self._db._lock:
+            return self._cur.fetchone()
+
+    def fetchall(self):
+        with self._db._lock:
+            return self._cur.fetchall()
+
+    def fetchmany(self, size=1):
+        with self._db._lock:
+            return self._cur.fetchmany(size)
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    @property
+    def lastrowid(self):
+        return self._cur.lastrowid
+
+    @property
+    def rowcount(self):
+        return self._cur.rowcount
+
+    def close(self):
+        self._cur.close()
+
+class StandInDatabase:
+    """In-memory stand-in for a mysql.connector connection."""
+    IntegrityError = sqlite3.IntegrityError  # PEP 249 connection attribute, read by server.use_database
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(":memory:", check_same_thread=False,
+                                     detect_types=sqlite3.PARSE_DECLTYPES)
+        for ddl in STANDIN_SCHEMA:
+            self._conn.execute(ddl)
+
+    def cursor(self, **_kwargs):
+        return StandInCursor(self)
+
+    def is_connected(self):
+        return True
+
+    def start_transaction(self):
+        pass
+
+    def commit(self):
+        with self._lock:
+            self._conn.commit()
+
+    def rollback(self):
+        with self._lock:
+            self._conn.rollback()
+
+    def close(self):
+        pass
+
+def start_local_server():
+    """Run server.py in this process on its configured port, backed by StandInDatabase."""
+    import server
+
+    server.use_database(StandInDatabase())
+    server.load_blockchain()
+    thread = threading.Thread(target=server.start, daemon=True)
+    thread.start()
+    for _ in range(100):
+        try:
+            socket.create_connection(server.ADDR, timeout=0.2).close()
+            return server, server.ADDR
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError("Local server did not start listening")
+
+# -----------------------------
+# Framed protocol client
+# -----------------------------
+class BenchConnection:
+    def __init__(self, addr, timeout=30.0):
+        self.sock = socket.create_connection(addr, timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def _recv_exact(self, n):
+        chunks, remaining = [], n
+        while remaining > 0:
+            chunk = self.sock.recv(remaining)
+            if not chunk:
+                raise ConnectionError("Socket closed while receiving data")
+            chunks.append(chunk)
+            remaining -= len(chunk)
+        return b"".join(chunks)
+
+    def _skip_block_broadcast(self, head):
+        """Consume an unframed 'NEW_BLOCK|||<block>|||<hash>' push that began in head."""
+        data = bytearray(head)
+        while True:
+            parts = data.split(b"|||")
+            if len(parts) >= 3 and len(parts[2]) >= 64:
+                return bytes(parts[2][64:])
+            data.extend(self._recv_exact(1))
+
+    def _read_header(self):
+        head = self._recv_exact(HEADER)
+        # The server pushes accepted blocks to every connection without framing.
+        while head.startswith(b"NEW_BLOCK|||"):
+            rest = self._skip_block_broadcast(head)
+            head = rest + self._recv_exact(HEADER - len(rest)) if len(rest) < HEADER else rest[:HEADER]
+        return head
+
+    def request(self, msg):
+        payload = msg.encode(FORMAT)
+        header = str(len(payload)).encode(FORMAT)
+        self.sock.sendall(header + b" " * (HEADER - len(header)) + payload)
+        length = int(self._read_header().decode(FORMAT).strip())
+        return self._recv_exact(length).decode(FORMAT)
+
+    def close(self):
+        try:
+            payload = DISCONNECT_MESSAGE.encode(FORMAT)
+            header = str(len(payload)).encode(FORMAT)
+            self.sock.sendall(header + b" " * (HEADER - len(header)) + payload)
+        except OSError:
+            pass
+        self.sock.close()
+
+def parse_reply(resp):
+    """(code, message) from a structured reply (connections use PROTOCOL|JSON)."""
+    try:
+        body = json.loads(resp)
+        return int(body.get("code", 500)), body.get("message") or ""
+    except (ValueError, AttributeError, TypeError):
+        return 500, resp
+
+# -----------------------------
+# Workload
+# -----------------------------
+class ChainTip:
+    """Client-side view of the chain tip so submitted blocks can be accepted."""
+    def __init__(self, block_id=0, block_hash=GENESIS_HASH, difficulty=2):
+        self.lock = threading.Lock()
+        self.block_id = block_id
+        self.block_hash = block_hash
+        self.difficulty = difficulty
+
+    def snapshot(self):
+        with self.lock:
+            return self.block_id, self.block_hash, self.difficulty
+
+    def advance(self, block_id, block_hash):
+        with self.lock:
+            if block_id > self.block_id:
+                self.block_id, self.block_hash = block_id, block_hash
+
+    def observe_rejection(self, message):
+        # e.g. "Hash doesn't meet difficulty requirement: 0000"
+        if "difficulty requirement:" in message:
+            zeros = message.rsplit(":", 1)[1].strip()
+            with self.lock:
+                self.difficulty = max(self.difficulty, len(zeros))
+
+def mine_block(tip, miner_id, rng):
+    """Find a block for the next height (mining time is not part of the measured latency)."""
+    last_id, prev_hash, difficulty = tip.snapshot()
+    block_id = last_id + 1
+    prefix = "0" * difficulty
+    for _ in range(MAX_MINING_ATTEMPTS):
+        nonce = str(rng.getrandbits(96))
+        block_data = (f"ID: {block_id}.Nonce: {nonce}.PreviousHash: {prev_hash}."
+                      f"MinerPublicID: {miner_id}.Transactions: {miner_id}+100.")
+        block_hash = blake3.blake3(block_data.encode(FORMAT)).hexdigest()
+        if block_hash.startswith(prefix):
+            break
+    return block_id, block_hash, f"{block_data}|||{block_hash}"
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {cmd: [] for cmd in COMMANDS}
+        self.outcomes = {cmd: {"ok": 0, "rejected": 0, "error": 0} for cmd in COMMANDS}
+
+    def record(self, cmd, seconds, code):
+        outcome = "ok" if code < 300 else ("rejected" if code < 500 else "error")
+        with self.lock:
+            self.latencies[cmd].append(seconds)
+            self.outcomes[cmd][outcome] += 1
+
+def parse_mix(text):
+    mix = {}
+    for item in text.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip().upper()
+        if name not in COMMANDS:
+            raise SystemExit(f"Unknown command in --mix: {name} (choose from {', '.join(COMMANDS)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+def setup_users(addr, count, prefix, funds):
+    users = [f"{prefix}{i}" for i in range(count)]
+    conn = BenchConnection(addr)
+    conn.request("PROTOCOL|JSON")
+    hw = json.dumps(BENCH_HARDWARE)
+    for user in users:
+        conn.request(f"REGISTER|{user}|{BENCH_PASSWORD}|[]|{hw}")
+        conn.request(f"AIR_DROP|{user}|{funds}")
+    conn.close()
+    return users
+
+def worker(addr, users, mix, deadline, ops_limit, recorder, tip, seed, counter):
+    rng = random.Random(seed)
+    names = list(mix)
+    weights = [mix[n] for n in names]
+    hw = json.dumps(BENCH_HARDWARE)
+    conn = BenchConnection(addr)
+    conn.request("PROTOCOL|JSON")
+    try:
+        while time.perf_counter() < deadline:
+            if ops_limit:
+                with counter["lock"]:
+                    if counter["n"] >= ops_limit:
+                        break
+                    counter["n"] += 1
+            cmd = rng.choices(names, weights)[0]
+            user = rng.choice(users)
+            block = None
+            if cmd == "GET_BALANCE":
+                msg = f"GET_BALANCE|{user}"
+            elif cmd == "SEND_TRANSACTION":
+                msg = f"SEND_TRANSACTION|{user}|{rng.choice(users)}|{rng.randint(1, 100) / 100}"
+            elif cmd == "GET_HISTORY":
+                msg = f"GET_HISTORY|{user}"
+            elif cmd == "LOGIN":
+                msg = f"LOGIN|{user}|{BENCH_PASSWORD}|[]|{hw}"
+            elif cmd == "REGISTER":
+                msg = f"REGISTER|bench-new-{seed}-{rng.getrandbits(48)}|{BENCH_PASSWORD}|[]|{hw}"
+            else:
+                block = mine_block(tip, user, rng)
+                msg = block[2]
+
+            start = time.perf_counter()
+            try:
+                resp = conn.request(msg)
+            except (OSError, ValueError) as e:
+                recorder.record(cmd, time.perf_counter() - start, 599)
+                print(f"[BENCH] connection error on {cmd}: {e}; reconnecting")
+                conn.sock.close()
+                conn = BenchConnection(addr)
+                conn.request("PROTOCOL|JSON")
+                continue
+            elapsed = time.perf_counter() - start
+            code, message = parse_reply(resp)
+            recorder.record(cmd, elapsed, code)
+            if block is not None:
+                if code < 300:
+                    tip.advance(block[0], block[1])
+                else:
+                    tip.observe_rejection(message)
+    finally:
+        conn.close()
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, max(0, int(round(pct / 100.0 * (len(sorted_values) - 1)))))
+    return sorted_values[k]
+
+def summarize(recorder, elapsed):
+    commands = {}
+    all_latencies = []
+    for cmd in COMMANDS:
+        lat = sorted(recorder.latencies[cmd])
+        if not lat:
+            continue
+        all_latencies.extend(lat)
+        commands[cmd] = {
+            "count": len(lat),
+            **recorder.outcomes[cmd],
+            "throughput_ops": len(lat) / elapsed,
+            "latency_ms": {
+                "mean": sum(lat) / len(lat) * 1000,
+                "p50": percentile(lat, 50) * 1000,
+                "p90": percentile(lat, 90) * 1000,
+                "p99": percentile(lat, 99) * 1000,
+                "max": lat[-1] * 1000,
+            },
+        }
+    all_latencies.sort()
+    total = {
+        "count": len(all_latencies),
+        "throughput_ops": len(all_latencies) / elapsed if elapsed else 0.0,
+        "latency_ms": {
+            "p50": percentile(all_latencies, 50) * 1000,
+            "p99": percentile(all_latencies, 99) * 1000,
+        },
+    }
+    return commands, total
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def print_report(results):
+    print(f"\n{'command':<18}{'count':>8}{'ok':>8}{'rej':>6}{'err':>6}{'ops/s':>10}"
+          f"{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for cmd, row in results["commands"].items():
+        lat = row["latency_ms"]
+        print(f"{cmd:<18}{row['count']:>8}{row['ok']:>8}{row['rejected']:>6}{row['error']:>6}"
+              f"{row['throughput_ops']:>10.1f}{lat['p50']:>9.2f}{lat['p90']:>9.2f}{lat['p99']:>9.2f}{lat['max']:>9.2f}")
+    total = results["total"]
+    print(f"{'TOTAL':<18}{total['count']:>8}{'':>20}{total['throughput_ops']:>10.1f}"
+          f"{total['latency_ms']['p50']:>9.2f}{'':>9}{total['latency_ms']['p99']:>9.2f}")
+
+# -----------------------------
+# Startup measurement
+# -----------------------------
+SERVER_CHILD = "import time, bench_server; bench_server.start_local_server(); time.sleep(60)"
+
+def _median_ms(samples):
+    samples = sorted(samples)
+    return samples[len(samples) // 2] * 1000
+
+def measure_startup(runs):
+    """Median wall time, from spawning a fresh interpreter, to (a) exit after
+    'import server' and (b) the first accepted connection of a stand-in server."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    bare, imported, accepted = [], [], []
+    for _ in range(runs):
+        for code, bucket in (("pass", bare), ("import server", imported)):
+            started = time.perf_counter()
+            subprocess.run([sys.executable, "-c", code], cwd=here, check=True,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            bucket.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        child = subprocess.Popen([sys.executable, "-c", SERVER_CHILD], cwd=here,
+                                 stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            while True:
+                try:
+                    socket.create_connection(("127.0.0.1", 5050), timeout=0.2).close()
+                    break
+                except OSError:
+                    if child.poll() is not None:
+                        raise RuntimeError("server exited before accepting a connection")
+                    time.sleep(0.002)
+            accepted.append(time.perf_counter() - started)
+        finally:
+            child.kill()
+            child.wait()
+    print(f"bare interpreter      {_median_ms(bare):8.1f} ms")
+    print(f"import server         {_median_ms(imported):8.1f} ms")
+    print(f"first accept          {_median_ms(accepted):8.1f} ms   (median of {runs})")
+
+# -----------------------------
+# Chain load measurement
+# -----------------------------
+def fill_standin_chain(db, first_id, count, batch=50_000):
+    """Insert count synthetic blocks (ids first_id..) straight into the stand-in tables."""
+    base = datetime(2024, 1, 1).timestamp()
+    block_id = first_id
+    while block_id < first_id + count:
+        rows = []
+        for i in range(block_id, min(block_id + batch, first_id + count)):
+            rows.append((i, str(i), "0" * 64, "miner", "", blake3.blake3(str(i).encode()).hexdigest(),
+                         datetime.fromtimestamp(base + i * 10), 2))
+        with db._lock:
+            db._conn.executemany(
+                "INSERT INTO blocks (block_id, nonce, previous_hash, miner_id, transactions, block_hash, timestamp, difficulty)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            db._conn.commit()
+        block_id += len(rows)
+
+def _timed_load(server):
+    started = time.perf_counter()
+    server.load_blockchain()
+    elapsed = time.perf_counter() - started
+    tracemalloc.start()
+    server.load_blockchain()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+def measure_chain_load(blocks, replay=1000):
+    """Time load_blockchain() over a stand-in chain: full load, then restart from a checkpoint."""
+    import server
+
+    db = StandInDatabase()
+    fill_standin_chain(db, 1, blocks)
+    server.use_database(db)
+    checkpoint_dir = tempfile.mkdtemp()
+    if hasattr(server, "CHECKPOINT_FILE"):
+        server.CHECKPOINT_FILE = ""
+    elapsed, peak = _timed_load(server)
+    print(f"full load        {len(server.blockchain):>9} blocks {elapsed * 1000:9.0f} ms  peak {peak / 2**20:7.1f} MiB")
+    if not hasattr(server, "CHECKPOINT_FILE"):
+        return
+    server.CHECKPOINT_FILE = os.path.join(checkpoint_dir, "chain_checkpoint.bin")
+    server.save_checkpoint()
+    fill_standin_chain(db, blocks + 1, replay)
+    started = time.perf_counter()
+    server.load_blockchain()
+    elapsed = time.perf_counter() - started
+    print(f"from checkpoint  {len(server.blockchain):>9} blocks {elapsed * 1000:9.0f} ms  ({replay} replayed)")
+    os.remove(server.CHECKPOINT_FILE)
+
+def main():
+    parser = argparse.ArgumentParser(description="VanillaCoin server load generator")
+    parser.add_argument("--target", help="host:port of a running server (default: start one in-process)")
+    parser.add_argument("--connections", type=int, default=16, help="concurrent framed connections")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds to run")
+    parser.add_argument("--ops", type=int, default=0, help="stop after this many requests (0 = duration only)")
+    parser.add_argument("--users", type=int, default=50, help="accounts created before the run")
+    parser.add_argument("--funds", type=float, default=1_000_000, help="airdrop per account before the run")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="weighted command mix, e.g. GET_BALANCE=80,LOGIN=20")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", help="write JSON results to this file ('-' for stdout)")
+    parser.add_argument("--startup", type=int, metavar="RUNS", help="measure import time and time to first accept, then exit")
+    parser.add_argument("--chain-load", type=int, metavar="BLOCKS", help="measure load_blockchain over a stand-in chain, then exit")
+    args = parser.parse_args()
+
+    if args.chain_load:
+        measure_chain_load(args.chain_load)
+        return
+
+    if args.startup:
+        measure_startup(args.startup)
+        return
+
+    mix = parse_mix(args.mix)
+    local_server = None
+    if args.target:
+        host, _, port = args.target.rpartition(":")
+        addr = (host or "127.0.0.1", int(port))
+    else:
+        local_server, addr = start_local_server()
+
+    prefix = f"bench{args.seed}-{int(time.time())}-"
+    users = setup_users(addr, args.users, prefix, args.funds)
+    tip = ChainTip()
+    if local_server is not None and local_server.blockchain:
+        last = local_server.blockchain[-1]
+        tip = ChainTip(last['block_id'], last['block_hash'], local_server.get_current_difficulty())
+
+    recorder = Recorder()
+    counter = {"lock": threading.Lock(), "n": 0}
+    start = time.perf_counter()
+    deadline = start + args.duration
+    threads = [
+        threading.Thread(target=worker, args=(addr, users, mix, deadline, args.ops, recorder, tip,
+                                              args.seed * 1000 + i, counter))
+        for i in range(args.connections)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    commands, total = summarize(recorder, elapsed)
+    results = {
+        "meta": {
+            "target": "local-standin" if local_server is not None else args.target,
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "connections": args.connections,
+            "duration_s": elapsed,
+            "users": args.users,
+            "mix": mix,
+            "seed": args.seed,
+            "timestamp": int(time.time()),
+        },
+        "commands": commands,
+        "total": total,
+    }
+
+    if local_server is not None:
+        local_server.server_running = False
+
+    print_report(results)
+    if args.out == "-":
+        print(json.dumps(results, indent=2))
+    elif args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Block verification pipeline for catch-up and bulk import.
+
+    check_blocks(records)   parse each (block_data, block_hash, difficulty)
+                            record, recompute its hash and check the
+                            difficulty prefix; large batches are spread
+                            over a process pool (open_pool() keeps one
+                            alive across calls)
+    link_errors(checked)    the cheap sequential pass: ids consecutive and
+                            every previous_hash naming the block before it
+
+Nothing here touches the database or server state, so pool workers only
+import this module. server.py feeds it rows from the blocks table
+(verify_stored_blocks) or lines of a block file (import_blocks).
+"""
+import multiprocessing
+import os
+import signal
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import hashing
+
+VERIFY_CHUNK = 2000  # records per pool task
+VERIFY_WORKERS = os.cpu_count() or 1
+# Pools are opened from server threads; start workers clean instead of forking a threaded process
+POOL_CONTEXT = multiprocessing.get_context("forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn")
+FORMAT = "utf-8"
+
+CheckedBlock = namedtuple("CheckedBlock", "block_id previous_hash miner_id transactions nonce block_hash difficulty error")
+
+def block_text(block_id, nonce, previous_hash, miner_id, transactions):
+    """The header text a block's hash covers, as miners build it."""
+    return f"ID: {block_id}.Nonce: {nonce}.PreviousHash: {previous_hash}.MinerPublicID: {miner_id}.Transactions: {transactions}."
+
+def check_block(block_data, block_hash, difficulty):
+    """Parse one block and check its hash and difficulty; error is None when both hold."""
+    try:
+        parts = block_data.split('.')
+        if len(parts) < 5:
+            return CheckedBlock(None, None, None, None, None, block_hash, difficulty, "Invalid block format")
+        block_id = int(parts[0].split(': ')[1])
+        nonce = parts[1].split(': ')[1]
+        previous_hash = parts[2].split(': ')[1]
+        miner_id = parts[3].split(': ')[1]
+        transactions = parts[4].split(': ')[1]
+    except (IndexError, ValueError) as e:
+        return CheckedBlock(None, None, None, None, None, block_hash, difficulty, f"Invalid block format: {e}")
+    error = None
+    if hashing.digest(block_data.encode(FORMAT)).hex() != block_hash:
+        error = "Hash mismatch"
+    elif not block_hash.startswith("0" * difficulty):
+        error = f"Hash doesn't meet difficulty requirement: {'0' * difficulty}"
+    return CheckedBlock(block_id, previous_hash, miner_id, transactions, nonce, block_hash, difficulty, error)
+
+def _check_chunk(records):
+    return [check_block(*record) for record in records]
+
+def _ignore_interrupts():
+    # Ctrl-C belongs to the parent, which stops the run and keeps its progress
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+def open_pool(workers=None):
+    """A process pool for check_blocks calls that share one, or None when workers < 2."""
+    workers = VERIFY_WORKERS if workers is None else workers
+    if workers < 2:
+        return None
+    return ProcessPoolExecutor(max_workers=workers, mp_context=POOL_CONTEXT, initializer=_ignore_interrupts)
+
+def check_blocks(records, workers=None, pool=None):
+    """CheckedBlock for each record, in input order; pool (from open_pool) is used instead of a new one."""
+    records = list(records)
+    workers = VERIFY_WORKERS if workers is None else workers
+    if (pool is None and workers < 2) or len(records) <= VERIFY_CHUNK:
+        return _check_chunk(records)
+    chunks = [records[i:i + VERIFY_CHUNK] for i in range(0, len(records), VERIFY_CHUNK)]
+    if pool is not None:
+        return [checked for part in pool.map(_check_chunk, chunks) for checked in part]
+    with ProcessPoolExecutor(max_workers=min(workers, len(chunks)), mp_context=POOL_CONTEXT,
+                             initializer=_ignore_interrupts) as pool:
+        return [checked for part in pool.map(_check_chunk, chunks) for checked in part]
+
+def link_errors(checked, previous_id=None, previous_hash=None):
+    """
+    (block_id, message) for each break in id order or hash linkage across
+    checked, which must be sorted by block_id. previous_id/previous_hash
+    describe the block before the first one (None: checked starts the chain).
+    """
+    errors = []
+    for block in checked:
+        if previous_id is not None and block.block_id != previous_id + 1:
+            errors.append((block.block_id, f"Expected block {previous_id + 1}"))
+        elif previous_hash is not None and block.previous_hash != previous_hash:
+            errors.append((block.block_id, "Invalid previous hash"))
+        previous_id, previous_hash = block.block_id, block.block_hash
+    return errors
@@ -0,0 +1,35 @@
+"""
+Proof-of-work nonce search for server-side mining.
+
+    search(prefix, suffix, difficulty, start, seconds)
+        hash prefix + nonce + suffix for nonces start, start + 1, ...
+        until a hash has `difficulty` leading hex zeros or `seconds` pass;
+        returns (nonce, block_hash, hashes), nonce None when none was found
+
+Like chain_verify, nothing here touches the database or server state, so
+pool workers only import this module. server.py's MiningEngine cuts MINE|
+jobs into short searches and stores what they find through the normal
+block path.
+"""
+import time
+
+import hashing
+
+SEARCH_CLOCK_EVERY = 2048  # nonces between deadline checks
+FORMAT = "utf-8"
+
+def search(prefix, suffix, difficulty, start, seconds):
+    head = prefix.encode(FORMAT)
+    tail = suffix.encode(FORMAT)
+    target = "0" * difficulty
+    digest = hashing.digest
+    deadline = time.monotonic() + seconds
+    nonce = start
+    while True:
+        for nonce in range(nonce, nonce + SEARCH_CLOCK_EVERY):
+            block_hash = digest(head + str(nonce).encode(FORMAT) + tail).hex()
+            if block_hash.startswith(target):
+                return nonce, block_hash, nonce - start + 1
+        nonce += 1
+        if time.monotonic() >= deadline:
+            return None, None, nonce - start
@@ -1,18 +1,28 @@
-import socket
-import threading
+import argparse
+import atexit
+import bisect
 import hashlib
-import pytz
 import json
-import mysql.connector
-import blake3
-import smtplib
-import pandas as pd
 import os
-from mysql.connector import Error
-from datetime import datetime, timedelta
-from random_word import RandomWords
+import queue
+import random
+import re
+import secrets
+import socket
+import sys
+import threading
 import time
 import uuid
+import zlib
+from array import array
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+
+import chain_verify
+import hashing
+import mining
 
 # ALL CONST VAR GO HERE
 HEADER = 64
@@ -40,57 +50,463 @@ DIFFICULTY_ADJUSTMENT_INTERVAL = 10
 INITIAL_DIFFICULTY = 2
 BLOCK_REWARD = 100
 TRANSACTION_FEE = 0.01
+BLOCK_TX_LIMIT = 1000  # confirmed transactions per block template
+TX_TEMPLATE_CACHE = 64  # recent templates whose roots a submitted block may name
+TX_TREE_CACHE = 32  # recent blocks' transaction trees kept for TX_PROOF
+
+# Chain loading constants
+LOAD_CHUNK_SIZE = 10000  # rows per fetchmany() while streaming the block index
+CHECKPOINT_FILE = os.environ.get("VANILLACOIN_CHECKPOINT", "chain_checkpoint.bin")  # "" disables
+CHECKPOINT_MIN_REPLAY = 1000  # rewrite the checkpoint after replaying at least this many blocks
+CHECKPOINT_VERSION = 1
+WARMUP = os.environ.get("VANILLACOIN_WARMUP", "1") != "0"  # accept connections while the chain loads
+WARMUP_RETRY_AFTER = 5  # seconds suggested to block submitters before a load-rate estimate exists
+VERIFY_BATCH = 50000  # stored blocks per pass of the verification pipeline
+VERIFY_MAX_REPORTED = 100  # verification errors listed in a reply; the rest are only counted
+VERIFY_PROGRESS_FILE = os.environ.get("VANILLACOIN_VERIFY_PROGRESS", "chain_verify.progress")  # "" disables resuming
+VERIFY_PROGRESS_VERSION = 1
+MINING_WORKERS = int(os.environ.get("VANILLACOIN_MINING_WORKERS", str(os.cpu_count() or 1)))  # nonce search processes
+MINING_SLICE_SECONDS = 0.5  # one pool task; users take turns for workers between slices
+MINE_MAX_SECONDS = 60  # longest MINE| job accepted; it holds its connection's handler thread throughout
+
+# Balance update constants
+# "optimistic": compare-and-swap on customer_info.version; "locks": in-process striped locks
+BALANCE_MODE = os.environ.get("VANILLACOIN_BALANCE_MODE", "optimistic")
+ACCOUNT_LOCK_STRIPES = 256
+CAS_MAX_ATTEMPTS = 8
+CAS_BACKOFF_BASE = 0.0005  # seconds; doubles per conflict, with jitter
+CAS_BACKOFF_MAX = 0.02
+CAS_TRACKED_ACCOUNTS = 1024  # accounts with per-account retry counters
+# Hot accounts (the bridge's FAUCET, busy miners): credits land on one of
+# BALANCE_SHARDS balance_shards rows instead of the single customer_info row.
+# Taking a name off the list hides its shard rows; fold them into
+# customer_info.balance first.
+SHARDED_ACCOUNTS = frozenset(name for name in os.environ.get("VANILLACOIN_SHARDED_ACCOUNTS", "FAUCET").split(",") if name)
+BALANCE_SHARDS = int(os.environ.get("VANILLACOIN_BALANCE_SHARDS", "16"))
+
+# Idempotency keys (optional last field of SEND_TRANSACTION| and AIR_DROP|)
+IDEMPOTENCY_TTL = 24 * 3600  # seconds a key's result is replayed
+IDEMPOTENCY_MAX_ENTRIES = 100000  # in memory; older keys are still found in MySQL
+IDEMPOTENCY_KEY_MAX = 128
+IDEMPOTENCY_PURGE_EVERY = 1000  # stored keys between DELETEs of expired rows
 
-# Hash test constants
-VERIFY_HASH = 'test'
-SINGLE_TEST = "4878ca0425c739fa427f7eda20fe845f6b2e46ba5fe2a14df5b1e32f50603215"
-DOUBLE_TEST = "55beb65d3293549b07cf215978375cf674d82de8657775da6c0f697b4e6b5e0b"
-TRIPLE_TEST = "1af8e96926a936cce32a1e304a068a3379968fd28c0843dcb08186adfaba1441"
+# Logging constants (levels: DEBUG, INFO, WARNING, ERROR, OFF)
+# INFO logs startup/shutdown and errors only; per-request lines are DEBUG.
+LOG_LEVEL = os.environ.get("VANILLACOIN_LOG_LEVEL", "INFO")
+LOG_FORMAT = os.environ.get("VANILLACOIN_LOG_FORMAT", "text")  # text | json
+LOG_QUEUE_SIZE = 10000
+LOG_BATCH_SIZE = 512
+LOG_SAMPLE_EVERY = int(os.environ.get("VANILLACOIN_LOG_SAMPLE_EVERY", "1"))  # 1 in N incoming frames
+
+# Profiling constants (PROFILE| admin command)
+ADMIN_HOSTS = ("127.0.0.1", "::1")
+PROFILE_DIR = os.environ.get("VANILLACOIN_PROFILE_DIR", "profiles")
+PROFILE_SAMPLE_INTERVAL = 0.005  # seconds between stack samples
+PROFILE_MAX_SECONDS = 600
+
+# Query accounting constants
+SLOW_QUERY_MS = float(os.environ.get("VANILLACOIN_SLOW_QUERY_MS", "50"))
+SLOW_QUERY_LOG_SIZE = 100  # most recent slow queries kept for QUERY_STATS
 
 # Global variables
 server_running = True
 connected_clients = []
-blockchain = []
+request_clients = set()  # negotiated PROTOCOL|JSON: framed replies only, so no unframed broadcasts
+blockchain = None  # ChainIndex, set by load_blockchain()
 current_difficulty = INITIAL_DIFFICULTY
+difficulty_adjusted_at = None  # chain length current_difficulty was last adjusted for
 mydb = None
 mycursor = None
+database_factory = None  # opens another connection (the chain loader streams on its own)
 pending_transactions = []
 
-# Server setup
-server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-server.bind(ADDR)
+# Server setup (the listening socket is created and bound in start())
+server = None
+
+# Security word list (loaded on first registration)
+SECURITY_WORDS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "security_words.txt")
+SECURITY_WORD_COUNT = 5
+security_words = None
+
+# Replaced with mysql.connector.Error once setup_database() loads the driver;
+# until then it is never raised, so "except Error" clauses are inert
+class Error(Exception):
+    pass
+
+# Duplicate-key errors; the driver's IntegrityError once a database is installed
+class IntegrityError(Error):
+    pass
+
+# ---- Logging: leveled, sampled, written off the request threads ----
+DEBUG, INFO, WARNING, ERROR, OFF = 10, 20, 30, 40, 100
+LOG_LEVELS = {"DEBUG": DEBUG, "INFO": INFO, "WARNING": WARNING, "ERROR": ERROR, "OFF": OFF}
+LEVEL_NAMES = {level: name for name, level in LOG_LEVELS.items()}
+
+# Frame fields after the username that carry credentials (password, security
+# words, hardware fingerprint) and must never reach the log
+CREDENTIAL_COMMANDS = ("REGISTER", "LOGIN")
+
+def redact_frame(msg):
+    """Replace everything after the username in REGISTER/LOGIN frames."""
+    for command in CREDENTIAL_COMMANDS:
+        if command + "|" in msg:
+            head, _, rest = msg.partition(command + "|")
+            username = rest.split("|", 1)[0]
+            return f"{head}{command}|{username}|<redacted>"
+    return msg
+
+class ServerLog:
+    """Leveled logger: callers enqueue records, a writer thread formats and writes them in batches"""
+    def __init__(self, level=LOG_LEVEL, fmt=LOG_FORMAT, maxsize=LOG_QUEUE_SIZE, stream=None):
+        self.level = LOG_LEVELS[level.upper()]
+        self.fmt = fmt
+        self.stream = stream
+        self.queue = queue.Queue(maxsize)
+        self.lock = threading.Lock()
+        self.samples = {}
+        self.dropped = 0
+        self.reported_drops = 0
+        self.writer = None
+
+    def set_level(self, level):
+        self.level = LOG_LEVELS[level.upper()]
+
+    def enabled(self, level):
+        return level >= self.level
+
+    def log(self, level, tag, message, *args, every=1):
+        if level < self.level:
+            return
+        if every > 1:
+            with self.lock:
+                seen = self.samples.get(tag, 0)
+                self.samples[tag] = seen + 1
+            if seen % every:
+                return
+        if self.writer is None:
+            self._start_writer()
+        try:
+            self.queue.put_nowait((time.time(), level, tag, message, args))
+        except queue.Full:
+            with self.lock:
+                self.dropped += 1
+
+    def debug(self, tag, message, *args, every=1):
+        self.log(DEBUG, tag, message, *args, every=every)
+
+    def info(self, tag, message, *args, every=1):
+        self.log(INFO, tag, message, *args, every=every)
+
+    def warning(self, tag, message, *args, every=1):
+        self.log(WARNING, tag, message, *args, every=every)
+
+    def error(self, tag, message, *args, every=1):
+        self.log(ERROR, tag, message, *args, every=every)
+
+    def flush(self):
+        """Block until everything queued so far has been written."""
+        if self.writer is not None:
+            self.queue.join()
+
+    def close(self):
+        if self.writer is not None:
+            self.queue.put(None)
+            self.writer.join(timeout=2)
+            self.writer = None
+
+    def stats(self):
+        with self.lock:
+            return {"level": LEVEL_NAMES[self.level], "queued": self.queue.qsize(), "dropped": self.dropped}
+
+    def _start_writer(self):
+        with self.lock:
+            if self.writer is None:
+                self.writer = threading.Thread(target=self._write_loop, name="log-writer", daemon=True)
+                self.writer.start()
+
+    def _format(self, record):
+        stamp, level, tag, message, args = record
+        if args:
+            try:
+                message = message % args
+            except (TypeError, ValueError):
+                message = f"{message} {args!r}"
+        if self.fmt == "json":
+            return json.dumps({"ts": round(stamp, 3), "level": LEVEL_NAMES[level], "tag": tag, "msg": message})
+        clock = time.strftime("%H:%M:%S", time.localtime(stamp))
+        return f"{clock}.{int(stamp % 1 * 1000):03d} {LEVEL_NAMES[level]:<7} [{tag}] {message}"
+
+    def _write_loop(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < LOG_BATCH_SIZE:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            records = [record for record in batch if record is not None]
+            lines = [self._format(record) for record in records]
+            with self.lock:
+                dropped = self.dropped - self.reported_drops
+                self.reported_drops = self.dropped
+            if dropped:
+                lines.append(self._format((time.time(), WARNING, "LOG", "Dropped %s messages (queue full)", (dropped,))))
+            stream = self.stream or sys.stdout
+            try:
+                stream.write("\n".join(lines) + "\n" if lines else "")
+                stream.flush()
+            except Exception:
+                pass
+            for _ in batch:
+                self.queue.task_done()
+            if len(records) < len(batch):
+                return
+
+log = ServerLog()
+atexit.register(log.close)
+
+# Per-request accounting shared by the metrics and the DB wrappers below
+_request_local = threading.local()
+
+def _statement_key(statement):
+    return " ".join(str(statement).split())[:200]
+
+class QueryStats:
+    """Per-statement time and row counts; parameters are never recorded"""
+    def __init__(self, slow_ms=SLOW_QUERY_MS):
+        self.lock = threading.Lock()
+        self.slow_ms = slow_ms
+        self.statements = {}  # key -> [count, total_ms, max_ms, rows]
+        self.slow = deque(maxlen=SLOW_QUERY_LOG_SIZE)
+
+    def begin(self, statement):
+        self.finish()
+        _request_local.query = [_statement_key(statement), 0.0, 0]
+        if getattr(_request_local, "active", False):
+            _request_local.db_queries += 1
+
+    def charge(self, seconds, rows=0):
+        query = getattr(_request_local, "query", None)
+        if query is not None:
+            query[1] += seconds
+            query[2] += rows
+        if getattr(_request_local, "active", False):
+            _request_local.db_seconds += seconds
+
+    def finish(self):
+        query = getattr(_request_local, "query", None)
+        if query is None:
+            return
+        _request_local.query = None
+        key, seconds, rows = query
+        ms = seconds * 1000
+        with self.lock:
+            entry = self.statements.get(key)
+            if entry is None:
+                entry = self.statements[key] = [0, 0.0, 0.0, 0]
+            entry[0] += 1
+            entry[1] += ms
+            entry[2] = max(entry[2], ms)
+            entry[3] += rows
+            slow = ms >= self.slow_ms
+            if slow:
+                command = getattr(_request_local, "command", None)
+                self.slow.append({"at": round(time.time(), 3), "ms": round(ms, 3), "rows": rows,
+                                  "command": command, "statement": key})
+        if slow:
+            log.warning("SLOW QUERY", "%.1f ms, %s rows: %s", ms, rows, key)
+
+    def snapshot(self):
+        with self.lock:
+            statements = sorted(self.statements.items(), key=lambda item: item[1][1], reverse=True)
+            return {
+                "slow_ms": self.slow_ms,
+                "statements": [
+                    {"statement": key, "count": count, "total_ms": round(total, 3),
+                     "avg_ms": round(total / count, 3), "max_ms": round(worst, 3), "rows": rows}
+                    for key, (count, total, worst, rows) in statements
+                ],
+                "slow": list(self.slow),
+            }
+
+query_stats = QueryStats()
+
+class TimedCursor:
+    """Cursor proxy that feeds every statement through query_stats."""
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, statement, *args, **kwargs):
+        return self._timed(self._cursor.execute, statement, *args, **kwargs)
+
+    def executemany(self, statement, *args, **kwargs):
+        return self._timed(self._cursor.executemany, statement, *args, **kwargs)
+
+    def _timed(self, run, statement, *args, **kwargs):
+        query_stats.begin(statement)
+        started = time.perf_counter()
+        try:
+            return run(statement, *args, **kwargs)
+        finally:
+            # SELECT rows are counted as they are fetched; writes report rowcount
+            rowcount = getattr(self._cursor, "rowcount", -1)
+            is_write = not str(statement).lstrip()[:6].upper() == "SELECT"
+            query_stats.charge(time.perf_counter() - started, rowcount if is_write and rowcount > 0 else 0)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = self._cursor.fetchone()
+        query_stats.charge(time.perf_counter() - started, 1 if row is not None else 0)
+        return row
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = self._cursor.fetchall()
+        query_stats.charge(time.perf_counter() - started, len(rows))
+        return rows
+
+    def fetchmany(self, size=1):
+        started = time.perf_counter()
+        rows = self._cursor.fetchmany(size)
+        query_stats.charge(time.perf_counter() - started, len(rows))
+        return rows
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+class TimedConnection:
+    """Connection proxy whose cursors go through TimedCursor; commits are charged to the last statement."""
+    def __init__(self, connection):
+        self._connection = connection
+
+    def cursor(self, *args, **kwargs):
+        return TimedCursor(self._connection.cursor(*args, **kwargs))
+
+    def commit(self):
+        started = time.perf_counter()
+        try:
+            return self._connection.commit()
+        finally:
+            query_stats.charge(time.perf_counter() - started)
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+class ThreadLocalDatabase:
+    """Stands in for mydb with its own timed connection and cursor per thread"""
+    def __init__(self, connection, factory):
+        self.factory = factory
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.connections = []
+        self._adopt(TimedConnection(connection))
+
+    def _adopt(self, connection):
+        self.local.connection = connection
+        self.local.cursor = connection.cursor()
+        with self.lock:
+            self.connections.append(connection)
+        return connection
+
+    def connection(self):
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = self._adopt(TimedConnection(self.factory()))
+        return connection
 
-# Word list setup
-r = RandomWords()
+    def thread_cursor(self):
+        self.connection()
+        return self.local.cursor
+
+    def release(self):
+        """Close the calling thread's connection (handler threads call this on disconnect)."""
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            return
+        self.local.connection = self.local.cursor = None
+        with self.lock:
+            if connection in self.connections:
+                self.connections.remove(connection)
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def cursor(self, *args, **kwargs):
+        return self.connection().cursor(*args, **kwargs)
+
+    def commit(self):
+        return self.connection().commit()
+
+    def close(self):
+        with self.lock:
+            connections, self.connections = self.connections, []
+        for connection in connections:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+    def __getattr__(self, name):
+        return getattr(self.connection(), name)
+
+class ThreadLocalCursor:
+    """mycursor for ThreadLocalDatabase: forwards to the calling thread's cursor."""
+    def __init__(self, database):
+        self._database = database
+
+    def __getattr__(self, name):
+        return getattr(self._database.thread_cursor(), name)
+
+def use_database(connection, factory=None):
+    """Install a DB-API connection (MySQL or a stand-in); factory, if given, opens one per thread"""
+    global mydb, mycursor, database_factory, IntegrityError
+    database_factory = factory
+    # PEP 249 drivers may expose their exception classes on the connection
+    IntegrityError = getattr(connection, "IntegrityError", IntegrityError)
+    if factory is None:
+        mydb = TimedConnection(connection)
+        mycursor = mydb.cursor()
+    else:
+        mydb = ThreadLocalDatabase(connection, factory)
+        mycursor = ThreadLocalCursor(mydb)
+
+def release_database():
+    if isinstance(mydb, ThreadLocalDatabase):
+        mydb.release()
 
 def setup_database():
     """Setup database and tables if they don't exist"""
-    global mydb, mycursor
+    global mydb, mycursor, Error, IntegrityError
     
     try:
+        import mysql.connector
+        Error = mysql.connector.Error
+        IntegrityError = mysql.connector.IntegrityError
+        
         connection_config = {
             'host': DB_CONFIG['host'],
             'user': DB_CONFIG['user'],
             'password': DB_CONFIG['password']
         }
         
-        print(f"[DATABASE] Attempting to connect to MySQL server at {DB_CONFIG['host']} with user '{DB_CONFIG['user']}'...")
+        log.info("DATABASE", "Attempting to connect to MySQL server at %s with user '%s'...", DB_CONFIG['host'], DB_CONFIG['user'])
         
         mydb = mysql.connector.connect(**connection_config)
         mycursor = mydb.cursor()
         
         mycursor.execute("CREATE DATABASE IF NOT EXISTS vanillacoin")
-        print("[DATABASE] Database 'vanillacoin' created or already exists")
+        log.info("DATABASE", "Database 'vanillacoin' created or already exists")
         
         mycursor.close()
         mydb.close()
         
-        print("[DATABASE] Connecting to vanillacoin database...")
-        mydb = mysql.connector.connect(**DB_CONFIG)
-        mycursor = mydb.cursor()
+        log.info("DATABASE", "Connecting to vanillacoin database...")
+        # Autocommit: per-thread sessions must not keep serving a stale REPEATABLE READ snapshot
+        use_database(mysql.connector.connect(autocommit=True, **DB_CONFIG),
+                     lambda: mysql.connector.connect(autocommit=True, **DB_CONFIG))
         
-        print("[DATABASE] Creating tables...")
+        log.info("DATABASE", "Creating tables...")
         
         mycursor.execute("""
             CREATE TABLE IF NOT EXISTS customer_info (
@@ -102,7 +518,8 @@ def setup_database():
                 motherboard_id VARCHAR(256),
                 time_account_created VARCHAR(256),
                 word_list JSON,
-                balance DECIMAL(20,8) DEFAULT 0.00000000
+                balance DECIMAL(20,8) DEFAULT 0.00000000,
+                version BIGINT NOT NULL DEFAULT 0
             )
         """)
         
@@ -116,10 +533,24 @@ def setup_database():
                 transactions TEXT,
                 block_hash VARCHAR(256) NOT NULL,
                 timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                difficulty INT NOT NULL
+                difficulty INT NOT NULL,
+                state_root CHAR(64) NULL,
+                tx_root CHAR(64) NULL
             )
         """)
         
+        # Tables created before these columns existed get them added
+        for table, column, definition in (("customer_info", "version", "BIGINT NOT NULL DEFAULT 0"),
+                                          ("blocks", "state_root", "CHAR(64) NULL"),
+                                          ("blocks", "tx_root", "CHAR(64) NULL")):
+            mycursor.execute("""
+                SELECT COUNT(*) FROM information_schema.COLUMNS
+                WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s
+            """, (table, column))
+            if mycursor.fetchone()[0] == 0:
+                mycursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+                log.info("DATABASE", "Added %s column to %s", column, table)
+        
         mycursor.execute("""
             CREATE TABLE IF NOT EXISTS transactions (
                 id INT AUTO_INCREMENT PRIMARY KEY,
@@ -135,6 +566,26 @@ def setup_database():
             )
         """)
         
+        mycursor.execute("""
+            CREATE TABLE IF NOT EXISTS balance_shards (
+                username VARCHAR(256) NOT NULL,
+                shard INT NOT NULL,
+                balance DECIMAL(20,8) NOT NULL DEFAULT 0.00000000,
+                version BIGINT NOT NULL DEFAULT 0,
+                PRIMARY KEY (username, shard)
+            )
+        """)
+        
+        mycursor.execute("""
+            CREATE TABLE IF NOT EXISTS idempotency_keys (
+                idem_key VARCHAR(128) PRIMARY KEY,
+                fingerprint CHAR(64) NOT NULL,
+                reply JSON NOT NULL,
+                created_at BIGINT NOT NULL,
+                INDEX idx_idempotency_created (created_at)
+            )
+        """)
+        
         mycursor.execute("""
             CREATE TABLE IF NOT EXISTS wallets (
                 id INT AUTO_INCREMENT PRIMARY KEY,
@@ -145,66 +596,87 @@ def setup_database():
         """)
         
         mydb.commit()
-        print("[DATABASE] Database and tables setup complete")
+        log.info("DATABASE", "Database and tables setup complete")
         return True
         
     except Error as e:
-        print(f"[DATABASE ERROR] {e}")
-        print(f"[DATABASE ERROR] Error code: {e.errno}")
+        log.error("DATABASE ERROR", "%s", e)
+        log.error("DATABASE ERROR", "Error code: %s", e.errno)
         if e.errno == 1045:
-            print("[DATABASE ERROR] Access denied - Please check your MySQL username and password in DB_CONFIG")
+            log.error("DATABASE ERROR", "Access denied - Please check your MySQL username and password in DB_CONFIG")
         elif e.errno == 2003:
-            print("[DATABASE ERROR] Can't connect to MySQL server - Make sure MySQL is running")
+            log.error("DATABASE ERROR", "Can't connect to MySQL server - Make sure MySQL is running")
         
         return False
     except Exception as e:
-        print(f"[DATABASE ERROR] Unexpected error: {e}")
+        log.error("DATABASE ERROR", "Unexpected error: %s", e)
         return False
 
 def singleHash(content):
-    return blake3.blake3(f"{content}".encode('utf-8')).hexdigest()
+    return hashing.chain_hex(f"{content}".encode(FORMAT), 1)
     
 def doubleHash(content):
-    single = blake3.blake3(f"{content}".encode('utf-8')).hexdigest()
-    double = blake3.blake3(f"{single}".encode('utf-8')).hexdigest()
-    return double
+    return hashing.chain_hex(f"{content}".encode(FORMAT), 2)
 
 def tripleHash(content):
-    single = blake3.blake3(f"{content}".encode('utf-8')).hexdigest()
-    double = blake3.blake3(f"{single}".encode('utf-8')).hexdigest()
-    triple = blake3.blake3(f"{double}".encode('utf-8')).hexdigest()
-    return triple
+    return hashing.chain_hex(f"{content}".encode(FORMAT), 3)
+
+def singleHashes(contents):
+    """singleHash of each item in one batch."""
+    return hashing.chain_hex_many([f"{c}".encode(FORMAT) for c in contents], 1)
 
 def verifyHash():
-    """Verify hash functions are working correctly"""
-    try:
-        if singleHash(VERIFY_HASH) == SINGLE_TEST:
-            print("{HASH TEST} Single hash working.")
-        else:
-            print("{ERROR!!!} SINGLE HASH TEST FAILED.")
-            return False
-        
-        if doubleHash(VERIFY_HASH) == DOUBLE_TEST:
-            print("{HASH TEST} Double hash working.")
-        else:
-            print("{ERROR!!!} DOUBLE HASH TEST FAILED.")
-            return False
-        
-        if tripleHash(VERIFY_HASH) == TRIPLE_TEST:
-            print("{HASH TEST} Triple hash working.")
-        else:
-            print("{ERROR!!!} TRIPLE HASH TEST FAILED.")
-            return False
-            
-        return True
-    except Exception as e:
-        print(f"[ERROR] Hash verification failed: {e}")
+    """Run the hashing module's self-test (once, at startup)"""
+    failures = hashing.self_test()
+    if failures:
+        log.error("HASH TEST", "HASH SELF-TEST FAILED: %s", ", ".join(failures))
         return False
+    log.info("HASH TEST", "%s hash vectors passed.", len(hashing.SELF_TEST_VECTORS))
+    return True
+
+# ---- Timestamps: integer epoch seconds internally, formatted only at the edges ----
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+ACCOUNT_TIMEZONE = "America/Los_Angeles"
+_account_zone = None
+_account_time_cache = (None, "")  # (epoch second, formatted), refreshed once per second
+
+def now_epoch():
+    return int(time.time())
+
+def account_zone():
+    """pytz zone for account timestamps, constructed once."""
+    global _account_zone
+    if _account_zone is None:
+        import pytz
+        _account_zone = pytz.timezone(ACCOUNT_TIMEZONE)
+    return _account_zone
+
+def format_timestamp(epoch, zone=None):
+    """Epoch seconds -> TIMESTAMP_FORMAT, in zone or the server's local time."""
+    if zone is None:
+        return time.strftime(TIMESTAMP_FORMAT, time.localtime(epoch))
+    return datetime.fromtimestamp(epoch, zone).strftime(TIMESTAMP_FORMAT)
+
+def to_epoch(value):
+    """Epoch seconds from a DB DATETIME (naive, server local time), a TIMESTAMP_FORMAT string or a number."""
+    if isinstance(value, datetime):
+        return int(value.timestamp())
+    if isinstance(value, str):
+        return int(time.mktime(time.strptime(value, TIMESTAMP_FORMAT)))
+    return int(value)
+
+def to_db_datetime(epoch):
+    """Naive local datetime for DATETIME columns, which is what datetime.now() stored before."""
+    return datetime.fromtimestamp(epoch)
 
 def getTime():
-    pst_timezone = pytz.timezone("America/Los_Angeles")
-    current_pst_time = datetime.now(pst_timezone)
-    return current_pst_time.strftime("%Y-%m-%d %H:%M:%S")
+    global _account_time_cache
+    epoch = now_epoch()
+    cached_epoch, formatted = _account_time_cache
+    if cached_epoch != epoch:
+        formatted = format_timestamp(epoch, account_zone())
+        _account_time_cache = (epoch, formatted)
+    return formatted
 
 def get_user_balance(username):
     """Get user's current balance from database"""
@@ -214,9 +686,11 @@ def get_user_balance(username):
     try:
         mycursor.execute("SELECT balance FROM customer_info WHERE username = %s", (username,))
         result = mycursor.fetchone()
+        if result and username in SHARDED_ACCOUNTS:
+            return float(result[0]) + sharded_balance(username)
         return float(result[0]) if result else 0.0
     except Exception as e:
-        print(f"[BALANCE ERROR] {e}")
+        log.error("BALANCE ERROR", "%s", e)
         return 0.0
 
 def update_user_balance(username, new_balance):
@@ -225,58 +699,565 @@ def update_user_balance(username, new_balance):
         return False
         
     try:
-        mycursor.execute("UPDATE customer_info SET balance = %s WHERE username = %s", (new_balance, username))
+        mycursor.execute("UPDATE customer_info SET balance = %s, version = version + 1 WHERE username = %s", (new_balance, username))
         mydb.commit()
+        state_tree.refresh(username)
         return True
     except Exception as e:
-        print(f"[BALANCE UPDATE ERROR] {e}")
+        log.error("BALANCE UPDATE ERROR", "%s", e)
+        return False
+
+# ---- Account locks: striped, so unrelated accounts never wait on each other ----
+class StripedLocks:
+    """Account locks striped over ACCOUNT_LOCK_STRIPES, taken in stripe order, with contention counters"""
+    def __init__(self, stripes=ACCOUNT_LOCK_STRIPES):
+        self.locks = [threading.Lock() for _ in range(stripes)]
+        self.acquisitions = [0] * stripes
+        self.contended = [0] * stripes
+        self.wait_seconds = [0.0] * stripes
+
+    def stripe(self, username):
+        return zlib.crc32(username.encode(FORMAT)) % len(self.locks)
+
+    def _acquire(self, index):
+        lock = self.locks[index]
+        if lock.acquire(blocking=False):
+            self.acquisitions[index] += 1
+            return
+        started = time.perf_counter()
+        lock.acquire()
+        self.acquisitions[index] += 1
+        self.contended[index] += 1
+        self.wait_seconds[index] += time.perf_counter() - started
+
+    @contextmanager
+    def hold(self, *usernames):
+        stripes = sorted({self.stripe(username) for username in usernames})
+        for index in stripes:
+            self._acquire(index)
+        try:
+            yield
+        finally:
+            for index in reversed(stripes):
+                self.locks[index].release()
+
+    def snapshot(self, top=10):
+        contended = sorted((i for i in range(len(self.locks)) if self.contended[i]),
+                           key=lambda i: self.contended[i], reverse=True)
+        return {
+            "stripes": len(self.locks),
+            "acquisitions": sum(self.acquisitions),
+            "contended": sum(self.contended),
+            "wait_ms": round(sum(self.wait_seconds) * 1000, 3),
+            "hottest": [
+                {"stripe": i, "acquisitions": self.acquisitions[i], "contended": self.contended[i],
+                 "wait_ms": round(self.wait_seconds[i] * 1000, 3)}
+                for i in contended[:top]
+            ],
+        }
+
+account_locks = StripedLocks()
+
+# ---- Optimistic balance updates: compare-and-swap on customer_info.version ----
+class CasStats:
+    """Update and conflict counts, overall and for the most-contended accounts."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.updates = 0
+        self.conflicts = 0
+        self.exhausted = 0
+        self.accounts = {}  # username -> [updates, conflicts, exhausted]
+
+    def record(self, username, conflicts, succeeded):
+        with self.lock:
+            self.updates += 1
+            self.conflicts += conflicts
+            self.exhausted += 0 if succeeded else 1
+            entry = self.accounts.get(username)
+            if entry is None:
+                if not conflicts or len(self.accounts) >= CAS_TRACKED_ACCOUNTS:
+                    return
+                entry = self.accounts[username] = [0, 0, 0]
+            entry[0] += 1
+            entry[1] += conflicts
+            entry[2] += 0 if succeeded else 1
+
+    def snapshot(self, top=10):
+        with self.lock:
+            hottest = sorted(self.accounts.items(), key=lambda item: item[1][1], reverse=True)[:top]
+            return {
+                "mode": BALANCE_MODE,
+                "sharded_accounts": {name: BALANCE_SHARDS for name in sorted(SHARDED_ACCOUNTS)},
+                "updates": self.updates,
+                "conflicts": self.conflicts,
+                "exhausted": self.exhausted,
+                "retry_rate": round(self.conflicts / self.updates, 4) if self.updates else 0.0,
+                "hottest": [
+                    {"account": name, "updates": updates, "conflicts": conflicts, "exhausted": exhausted,
+                     "retry_rate": round(conflicts / updates, 4) if updates else 0.0}
+                    for name, (updates, conflicts, exhausted) in hottest
+                ],
+            }
+
+cas_stats = CasStats()
+
+def read_balance_version(username):
+    """(balance, version) for username, or None if the account does not exist."""
+    mycursor.execute("SELECT balance, version FROM customer_info WHERE username = %s", (username,))
+    row = mycursor.fetchone()
+    return (float(row[0]), row[1]) if row else None
+
+def cas_balance(username, expected_version, new_balance):
+    """Write new_balance only if nobody changed the row since expected_version was read."""
+    mycursor.execute(
+        "UPDATE customer_info SET balance = %s, version = version + 1 WHERE username = %s AND version = %s",
+        (new_balance, username, expected_version))
+    return mycursor.rowcount == 1
+
+def cas_backoff(attempt):
+    time.sleep(random.uniform(0.5, 1.0) * min(CAS_BACKOFF_MAX, CAS_BACKOFF_BASE * (2 ** attempt)))
+
+def cas_update(username, change):
+    """Apply change(balance) (new balance, or None to give up) by compare-and-swap; returns (status, balance_read)"""
+    conflicts = 0
+    balance = 0.0
+    for attempt in range(CAS_MAX_ATTEMPTS):
+        row = read_balance_version(username)
+        if row is None:
+            return "missing", 0.0
+        balance, version = row
+        new_balance = change(balance)
+        if new_balance is None:
+            cas_stats.record(username, conflicts, True)
+            return "declined", balance
+        if cas_balance(username, version, new_balance):
+            cas_stats.record(username, conflicts, True)
+            state_tree.set(username, new_balance, version + 1)
+            return "ok", balance
+        conflicts += 1
+        cas_backoff(attempt)
+    cas_stats.record(username, conflicts, False)
+    log.warning("BALANCE", "Gave up updating %s after %s version conflicts", username, conflicts)
+    return "conflict", balance
+
+# ---- Sharded balances: hot accounts spread over balance_shards rows ----
+# A sharded account's balance is its customer_info.balance plus all of its
+# shard rows. Credits add to one random shard with a single UPDATE, so
+# concurrent credits only meet when they pick the same shard; debits draw
+# from the customer_info row and then the shards.
+_shards_ready = set()
+
+def sharded_balance(username):
+    mycursor.execute("SELECT COALESCE(SUM(balance), 0) FROM balance_shards WHERE username = %s", (username,))
+    return float(mycursor.fetchone()[0])
+
+def read_balance_state(username):
+    """(balance, version) as the state tree sees it: a sharded account adds up its shard rows' balances and versions."""
+    row = read_balance_version(username)
+    if row is None or username not in SHARDED_ACCOUNTS:
+        return row
+    mycursor.execute("SELECT COALESCE(SUM(balance), 0), COALESCE(SUM(version), 0) FROM balance_shards WHERE username = %s",
+                     (username,))
+    total, versions = mycursor.fetchone()
+    return row[0] + float(total), row[1] + int(versions)
+
+def ensure_balance_shards(username):
+    """Create username's missing shard rows; False if the account does not exist."""
+    if username in _shards_ready:
+        return True
+    mycursor.execute("SELECT username FROM customer_info WHERE username = %s", (username,))
+    if mycursor.fetchone() is None:
+        return False
+    mycursor.execute("SELECT shard FROM balance_shards WHERE username = %s", (username,))
+    existing = {row[0] for row in mycursor.fetchall()}
+    for shard in range(BALANCE_SHARDS):
+        if shard not in existing:
+            try:
+                mycursor.execute("INSERT INTO balance_shards (username, shard, balance) VALUES (%s, %s, 0)",
+                                 (username, shard))
+            except IntegrityError:
+                pass  # another thread created it first
+    _shards_ready.add(username)
+    return True
+
+def shard_credit(username, amount):
+    if not ensure_balance_shards(username):
+        return False
+    mycursor.execute(
+        "UPDATE balance_shards SET balance = balance + %s, version = version + 1 WHERE username = %s AND shard = %s",
+        (amount, username, random.randrange(BALANCE_SHARDS)))
+    if mycursor.rowcount != 1:
+        cas_stats.record(username, 0, False)
         return False
+    cas_stats.record(username, 0, True)
+    state_tree.refresh(username)
+    return True
+
+def shard_debit(username, amount):
+    """Take amount from the customer_info row, then the shards; returns (status, balance_read) like cas_update"""
+    conflicts = 0
+    remaining = amount
+    available = 0.0
+    balance_read = 0.0  # the balance as of the last read, counting what earlier passes took
+    for attempt in range(CAS_MAX_ATTEMPTS):
+        home = read_balance_version(username)
+        if home is None:
+            return "missing", 0.0
+        mycursor.execute("SELECT shard, balance FROM balance_shards WHERE username = %s AND balance > 0", (username,))
+        shards = [(row[0], float(row[1])) for row in mycursor.fetchall()]
+        random.shuffle(shards)
+        available = home[0] + sum(balance for _, balance in shards)
+        balance_read = round(available + amount - remaining, 8)
+        if available < remaining:
+            break
+        if home[0] > 0:
+            take = min(remaining, home[0])
+            if cas_balance(username, home[1], home[0] - take):
+                remaining = round(remaining - take, 8)
+            else:
+                conflicts += 1
+        for shard, balance in shards:
+            if remaining <= 0:
+                break
+            take = min(remaining, balance)
+            mycursor.execute(
+                "UPDATE balance_shards SET balance = balance - %s, version = version + 1 "
+                "WHERE username = %s AND shard = %s AND balance >= %s",
+                (take, username, shard, take))
+            if mycursor.rowcount == 1:
+                remaining = round(remaining - take, 8)
+            else:
+                conflicts += 1
+        if remaining <= 0:
+            cas_stats.record(username, conflicts, True)
+            state_tree.refresh(username)
+            return "ok", balance_read
+        cas_backoff(attempt)
+    taken = round(amount - remaining, 8)
+    if taken > 0:
+        try:
+            refunded, reason = shard_credit(username, taken), "no shard row updated"
+        except Exception as e:
+            refunded, reason = False, str(e)
+        if not refunded:
+            log.error("BALANCE", "Putting back %.8f VNC to %s after an unfinished debit of %.8f failed (%s); reconcile by hand",
+                      taken, username, amount, reason)
+    if available < remaining:
+        cas_stats.record(username, conflicts, True)
+        return "declined", balance_read
+    cas_stats.record(username, conflicts, False)
+    log.warning("BALANCE", "Gave up debiting %s after %s conflicts", username, conflicts)
+    return "conflict", balance_read
+
+def debit_account(username, amount):
+    """Take amount if the balance covers it; returns (status, balance_read) like cas_update."""
+    if username in SHARDED_ACCOUNTS:
+        return shard_debit(username, amount)
+    if BALANCE_MODE == "locks":
+        with account_locks.hold(username):
+            balance = get_user_balance(username)
+            if balance < amount:
+                return "declined", balance
+            return ("ok" if update_user_balance(username, balance - amount) else "conflict"), balance
+    return cas_update(username, lambda balance: balance - amount if balance >= amount else None)
+
+def credit_account(username, amount):
+    """Add amount to username's balance (mining rewards, airdrops)."""
+    if username in SHARDED_ACCOUNTS:
+        return shard_credit(username, amount)
+    if BALANCE_MODE == "locks":
+        with account_locks.hold(username):
+            return update_user_balance(username, get_user_balance(username) + amount)
+    status, _ = cas_update(username, lambda balance: balance + amount)
+    return status == "ok"
+
+# ---- Merkle hashing, shared by the state tree and block transaction trees ----
+# Leaves and branches hash with distinct prefixes, so a branch can never be
+# passed off as a leaf.
+MERKLE_LEAF_PREFIX = b"\x00"
+MERKLE_BRANCH_PREFIX = b"\x01"
+
+def merkle_branch_hash(left, right):
+    return hashing.digest(MERKLE_BRANCH_PREFIX + left + right)
+
+# ---- Account state: sparse Merkle tree over balances ----
+# Keys are BLAKE3(username), walked most significant bit first. A subtree
+# holding one account is just that account's leaf, so paths are about
+# log2(accounts) long. An empty subtree hashes to 32 zero bytes.
+STATE_EMPTY = bytes(32)
+STATE_KEY_BITS = 256
+
+def state_key(username):
+    return int.from_bytes(hashing.digest(username.encode(FORMAT)), "big")
+
+def state_leaf_hash(username, balance_text):
+    return hashing.digest(MERKLE_LEAF_PREFIX + username.encode(FORMAT) + b"|" + balance_text.encode(FORMAT))
+
+def verify_state_proof(proof, root=None):
+    """True if proof (from StateTree.proof) shows its username holding its balance under root (default: the proof's own)."""
+    key = state_key(proof["username"])
+    node = state_leaf_hash(proof["username"], proof["balance"])
+    siblings = proof["siblings"]
+    for depth in range(len(siblings) - 1, -1, -1):
+        sibling = bytes.fromhex(siblings[depth])
+        if (key >> (STATE_KEY_BITS - 1 - depth)) & 1:
+            node = merkle_branch_hash(sibling, node)
+        else:
+            node = merkle_branch_hash(node, sibling)
+    return node.hex() == (root or proof["root"])
+
+class _StateLeaf:
+    __slots__ = ("key", "username", "balance", "version", "hash")
+
+    def __init__(self, key, username, balance, version):
+        self.key = key
+        self.username = username
+        self.balance = balance
+        self.version = version
+        self.hash = state_leaf_hash(username, balance)
+
+class _StateBranch:
+    __slots__ = ("left", "right", "hash")
+
+    def __init__(self):
+        self.left = None
+        self.right = None
+        self.hash = None  # None until computed, and again after a change below
+
+class StateTree:
+    """Sparse Merkle tree over account balances; set() ignores versions older than the leaf's"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.root = None
+        self.accounts = 0
+        self.updates = 0
+
+    def _hash(self, node):
+        if node is None:
+            return STATE_EMPTY
+        if node.hash is None:
+            node.hash = merkle_branch_hash(self._hash(node.left), self._hash(node.right))
+        return node.hash
+
+    def set(self, username, balance, version, force=False):
+        """Record username's balance as of version; older versions are ignored unless force (after a rollback)."""
+        key = state_key(username)
+        with self.lock:
+            path, node, depth = [], self.root, 0
+            while isinstance(node, _StateBranch):
+                path.append(node)
+                node = node.right if (key >> (STATE_KEY_BITS - 1 - depth)) & 1 else node.left
+                depth += 1
+            if not force and node is not None and node.key == key and node.version >= version:
+                return
+            for branch in path:
+                branch.hash = None
+            self.updates += 1
+            self._attach(path, node, depth, _StateLeaf(key, username, f"{balance:.8f}", version))
+
+    def _attach(self, path, node, depth, leaf):
+        # caller holds self.lock; node is what sits at leaf's position below path
+        key = leaf.key
+        if node is not None and node.key != key:
+            # Split: branch down until the two keys' bits differ
+            top = branch = _StateBranch()
+            while True:
+                old_bit = (node.key >> (STATE_KEY_BITS - 1 - depth)) & 1
+                new_bit = (leaf.key >> (STATE_KEY_BITS - 1 - depth)) & 1
+                if old_bit != new_bit:
+                    branch.left, branch.right = (leaf, node) if old_bit else (node, leaf)
+                    break
+                child = _StateBranch()
+                if old_bit:
+                    branch.right = child
+                else:
+                    branch.left = child
+                branch = child
+                depth += 1
+            self.accounts += 1
+            leaf = top
+        elif node is None:
+            self.accounts += 1
+        if not path:
+            self.root = leaf
+        elif (key >> (STATE_KEY_BITS - len(path))) & 1:
+            path[-1].right = leaf
+        else:
+            path[-1].left = leaf
+
+    def refresh(self, username, force=False):
+        """Re-read username's balance after a write that did not see the new version."""
+        state = read_balance_state(username)
+        if state is not None:
+            self.set(username, *state, force=force)
+
+    def load(self, connection):
+        """Add every account read over connection (customer_info plus balance_shards)."""
+        cursor = connection.cursor()
+        try:
+            cursor.execute("SELECT username, SUM(balance), SUM(version) FROM balance_shards GROUP BY username")
+            sharded = {name: (float(total), int(versions)) for name, total, versions in cursor.fetchall()
+                       if name in SHARDED_ACCOUNTS}
+            cursor.execute("SELECT username, balance, version FROM customer_info")
+            while True:
+                rows = cursor.fetchmany(LOAD_CHUNK_SIZE)
+                if not rows:
+                    break
+                for username, balance, version in rows:
+                    shard_total, shard_versions = sharded.get(username, (0.0, 0))
+                    self.set(username, float(balance or 0) + shard_total, version + shard_versions)
+        finally:
+            cursor.close()
+        log.info("STATE", "State tree holds %s accounts, root %s", self.accounts, self.root_hex())
+
+    def root_hex(self):
+        with self.lock:
+            return self._hash(self.root).hex()
+
+    def proof(self, username):
+        """Inclusion proof for username's balance, or None if the account is not in the tree."""
+        key = state_key(username)
+        siblings = []
+        with self.lock:
+            root = self._hash(self.root).hex()
+            node, depth = self.root, 0
+            while isinstance(node, _StateBranch):
+                if (key >> (STATE_KEY_BITS - 1 - depth)) & 1:
+                    siblings.append(self._hash(node.left).hex())
+                    node = node.right
+                else:
+                    siblings.append(self._hash(node.right).hex())
+                    node = node.left
+                depth += 1
+            if node is None or node.key != key:
+                return None
+            return {"username": username, "balance": node.balance, "root": root, "siblings": siblings}
+
+    def stats(self):
+        with self.lock:
+            return {"accounts": self.accounts, "updates": self.updates}
+
+state_tree = StateTree()
 
 def create_transaction(from_user, to_user, amount):
-    """Create a new transaction"""
+    """Create a new transaction; returns (success, message, details)"""
     if not mydb or not mycursor:
-        return False, "No database connection"
+        return False, "No database connection", {}
     
     try:
         mycursor.execute("SELECT username FROM customer_info WHERE username IN (%s, %s)", (from_user, to_user))
         users = mycursor.fetchall()
         
         if len(users) != 2:
-            return False, "One or both users not found"
-        
-        sender_balance = get_user_balance(from_user)
-        fee = amount * TRANSACTION_FEE
-        total_required = amount + fee
+            return False, "One or both users not found", {}
         
-        if sender_balance < total_required:
-            return False, f"Insufficient balance. Required: {total_required:.8f}, Available: {sender_balance:.8f}"
-        
-        transaction_id = str(uuid.uuid4())
+        if BALANCE_MODE != "locks" or from_user in SHARDED_ACCOUNTS or to_user in SHARDED_ACCOUNTS:
+            return _apply_transaction_optimistic(from_user, to_user, amount)
+        with account_locks.hold(from_user, to_user):
+            return _apply_transaction(from_user, to_user, amount)
         
+    except Exception as e:
+        log.error("TRANSACTION ERROR", "%s", e)
+        return False, str(e), {}
+
+def _insufficient(total_required, available):
+    return False, f"Insufficient balance. Required: {total_required:.8f}, Available: {available:.8f}", {
+        "required": round(total_required, 8),
+        "available": round(available, 8),
+    }
+
+def _apply_transaction_optimistic(from_user, to_user, amount):
+    """Debit the sender, then credit the receiver; the sender is refunded if the credit does not land"""
+    fee = amount * TRANSACTION_FEE
+    total_required = amount + fee
+    
+    status, sender_balance = debit_account(from_user, total_required)
+    if status == "declined":
+        return _insufficient(total_required, sender_balance)
+    if status != "ok":
+        return False, "Sender balance is busy, try again", {}
+    
+    transaction_id = str(uuid.uuid4())
+    try:
         mycursor.execute("""
             INSERT INTO transactions (transaction_id, from_username, to_username, amount, fee, status)
             VALUES (%s, %s, %s, %s, %s, 'pending')
         """, (transaction_id, from_user, to_user, amount, fee))
-        
-        new_sender_balance = sender_balance - total_required
-        receiver_balance = get_user_balance(to_user)
-        new_receiver_balance = receiver_balance + amount
-        
-        update_user_balance(from_user, new_sender_balance)
-        update_user_balance(to_user, new_receiver_balance)
-        
+        credited = credit_account(to_user, amount)
+    except Exception as e:
+        _refund_sender(from_user, total_required, transaction_id, e)
+        raise
+    
+    if not credited:
+        _refund_sender(from_user, total_required, transaction_id, "receiver balance busy")
+        mycursor.execute("UPDATE transactions SET status = 'failed' WHERE transaction_id = %s", (transaction_id,))
+        mydb.commit()
+        return False, "Receiver balance is busy, try again", {}
+    
+    # The coins have moved; refunding now would mint them, so a failed status update is only logged
+    try:
         mycursor.execute("""
             UPDATE transactions SET status = 'confirmed' WHERE transaction_id = %s
         """, (transaction_id,))
-        
         mydb.commit()
-        
-        print(f"[TRANSACTION] {from_user} sent {amount:.8f} VNC to {to_user} (fee: {fee:.8f})")
-        return True, f"Transaction successful. ID: {transaction_id}"
-        
     except Exception as e:
-        print(f"[TRANSACTION ERROR] {e}")
-        return False, str(e)
+        log.error("TRANSACTION ERROR", "Transaction %s (%s -> %s, %.8f VNC) applied but left pending: %s",
+                  transaction_id, from_user, to_user, amount, e)
+    
+    log.debug("TRANSACTION", "%s sent %.8f VNC to %s (fee: %.8f)", from_user, amount, to_user, fee)
+    return True, f"Transaction successful. ID: {transaction_id}", {
+        "transaction_id": transaction_id,
+        "amount": amount,
+        "fee": fee,
+    }
+
+def _refund_sender(from_user, total_required, transaction_id, reason):
+    """Return a debited sender's coins; False (and an error log to reconcile from) if that fails too."""
+    try:
+        refunded = credit_account(from_user, total_required)
+    except Exception as e:
+        refunded = False
+        reason = f"{reason}; refund raised {e}"
+    if not refunded:
+        log.error("TRANSACTION ERROR", "Refund of %.8f VNC to %s for transaction %s failed (%s); reconcile by hand",
+                  total_required, from_user, transaction_id, reason)
+    return refunded
+
+def _apply_transaction(from_user, to_user, amount):
+    """Balance check and transfer; the caller holds both accounts' stripes."""
+    sender_balance = get_user_balance(from_user)
+    fee = amount * TRANSACTION_FEE
+    total_required = amount + fee
+    
+    if sender_balance < total_required:
+        return _insufficient(total_required, sender_balance)
+    
+    transaction_id = str(uuid.uuid4())
+    
+    mycursor.execute("""
+        INSERT INTO transactions (transaction_id, from_username, to_username, amount, fee, status)
+        VALUES (%s, %s, %s, %s, %s, 'pending')
+    """, (transaction_id, from_user, to_user, amount, fee))
+    
+    new_sender_balance = sender_balance - total_required
+    receiver_balance = get_user_balance(to_user)
+    new_receiver_balance = receiver_balance + amount
+    
+    update_user_balance(from_user, new_sender_balance)
+    update_user_balance(to_user, new_receiver_balance)
+    
+    mycursor.execute("""
+        UPDATE transactions SET status = 'confirmed' WHERE transaction_id = %s
+    """, (transaction_id,))
+    
+    mydb.commit()
+    
+    log.debug("TRANSACTION", "%s sent %.8f VNC to %s (fee: %.8f)", from_user, amount, to_user, fee)
+    return True, f"Transaction successful. ID: {transaction_id}", {
+        "transaction_id": transaction_id,
+        "amount": amount,
+        "fee": fee,
+    }
 
 def get_transaction_history(username, limit=50):
     """Get transaction history for a user"""
@@ -301,7 +1282,7 @@ def get_transaction_history(username, limit=50):
                 'amount': float(row[3]),
                 'fee': float(row[4]),
                 'status': row[5],
-                'timestamp': row[6].strftime("%Y-%m-%d %H:%M:%S") if row[6] else None,
+                'timestamp': row[6].strftime(TIMESTAMP_FORMAT) if row[6] else None,
                 'type': 'sent' if row[1] == username else 'received'
             }
             transactions.append(transaction)
@@ -309,80 +1290,414 @@ def get_transaction_history(username, limit=50):
         return transactions
         
     except Exception as e:
-        print(f"[TRANSACTION HISTORY ERROR] {e}")
+        log.error("TRANSACTION HISTORY ERROR", "%s", e)
         return []
 
+# ---- Block transactions: Merkle root in the header, inclusion proofs by transaction_id ----
+# A block built from a TEMPLATE| reply carries "merkle=<root>" in its
+# Transactions field. The root covers the template's confirmed transactions
+# in id order; storing the block claims them (transactions.block_id).
+# Blocks without a marker (older miners) carry no transaction list.
+TX_ROOT_PATTERN = re.compile(r"merkle=([0-9a-f]{64})")
+
+def tx_leaf_hash(transaction_id, from_user, to_user, amount, fee):
+    text = f"{transaction_id}|{from_user}|{to_user}|{float(amount):.8f}|{float(fee):.8f}"
+    return hashing.digest(MERKLE_LEAF_PREFIX + text.encode(FORMAT))
+
+class TxMerkleTree:
+    """Merkle tree over (transaction_id, from, to, amount, fee) rows; an odd node moves up unpaired"""
+    def __init__(self, rows):
+        self.ids = []
+        leaves = []
+        for transaction_id, from_user, to_user, amount, fee in rows:
+            self.ids.append(transaction_id)
+            leaves.append(tx_leaf_hash(transaction_id, from_user, to_user, amount, fee))
+        self.levels = [leaves]
+        while len(self.levels[-1]) > 1:
+            below = self.levels[-1]
+            level = [merkle_branch_hash(below[i], below[i + 1]) for i in range(0, len(below) - 1, 2)]
+            if len(below) % 2:
+                level.append(below[-1])
+            self.levels.append(level)
+        self.positions = {transaction_id: i for i, transaction_id in enumerate(self.ids)}
+
+    @property
+    def root(self):
+        return self.levels[-1][0].hex() if self.ids else STATE_EMPTY.hex()
+
+    def proof(self, transaction_id):
+        """Sibling hashes from leaf to root, each with the side it sits on; None if absent."""
+        index = self.positions.get(transaction_id)
+        if index is None:
+            return None
+        steps = []
+        for level in self.levels[:-1]:
+            sibling = index ^ 1
+            if sibling < len(level):
+                steps.append({"side": "left" if sibling < index else "right", "hash": level[sibling].hex()})
+            index //= 2
+        return steps
+
+def verify_tx_proof(proof, root=None):
+    """True if proof (from transaction_proof) places its transaction under root (default: the proof's tx_root)."""
+    tx = proof["transaction"]
+    node = tx_leaf_hash(tx["id"], tx["from"], tx["to"], tx["amount"], tx["fee"])
+    for step in proof["siblings"]:
+        sibling = bytes.fromhex(step["hash"])
+        node = merkle_branch_hash(sibling, node) if step["side"] == "left" else merkle_branch_hash(node, sibling)
+    return node.hex() == (root or proof["tx_root"])
+
+class TxTemplates:
+    """Recent template trees by root, and recent blocks' trees by block_id."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.templates = OrderedDict()  # root -> TxMerkleTree
+        self.blocks = OrderedDict()  # block_id -> TxMerkleTree
+
+    @staticmethod
+    def _remember(cache, key, tree, limit):
+        cache[key] = tree
+        cache.move_to_end(key)
+        while len(cache) > limit:
+            cache.popitem(last=False)
+
+    def create(self):
+        """Tree over confirmed transactions not yet in a block, oldest first."""
+        mycursor.execute("""
+            SELECT transaction_id, from_username, to_username, amount, fee FROM transactions
+            WHERE status = 'confirmed' AND block_id IS NULL
+            ORDER BY id LIMIT %s
+        """, (BLOCK_TX_LIMIT,))
+        tree = TxMerkleTree(mycursor.fetchall())
+        if tree.ids:
+            with self.lock:
+                self._remember(self.templates, tree.root, tree, TX_TEMPLATE_CACHE)
+        return tree
+
+    def for_block(self, transactions):
+        """(found, tree) for a block's Transactions field; tree is None when it names no root."""
+        match = TX_ROOT_PATTERN.search(transactions)
+        if match is None:
+            return True, None
+        with self.lock:
+            tree = self.templates.get(match.group(1))
+        return tree is not None, tree
+
+    def block_tree(self, block_id):
+        with self.lock:
+            tree = self.blocks.get(block_id)
+            if tree is not None:
+                self.blocks.move_to_end(block_id)
+                return tree
+        mycursor.execute("""
+            SELECT transaction_id, from_username, to_username, amount, fee FROM transactions
+            WHERE block_id = %s ORDER BY id
+        """, (block_id,))
+        tree = TxMerkleTree(mycursor.fetchall())
+        with self.lock:
+            self._remember(self.blocks, block_id, tree, TX_TREE_CACHE)
+        return tree
+
+    def claimed(self, block_id, tree):
+        with self.lock:
+            self._remember(self.blocks, block_id, tree, TX_TREE_CACHE)
+
+tx_templates = TxTemplates()
+
+def claim_block_transactions(block_id, tree):
+    """Point the template's transactions at block_id; False if another block took any of them."""
+    placeholders = ", ".join(["%s"] * len(tree.ids))
+    mycursor.execute(f"UPDATE transactions SET block_id = %s WHERE block_id IS NULL AND transaction_id IN ({placeholders})",
+                     (block_id, *tree.ids))
+    return mycursor.rowcount == len(tree.ids)
+
+def transaction_proof(transaction_id):
+    """Inclusion proof for a transaction against its block's tx_root, or None if it is not in a block yet."""
+    mycursor.execute("""
+        SELECT t.transaction_id, t.from_username, t.to_username, t.amount, t.fee, b.block_id, b.block_hash, b.tx_root
+        FROM transactions t JOIN blocks b ON b.block_id = t.block_id
+        WHERE t.transaction_id = %s
+    """, (transaction_id,))
+    row = mycursor.fetchone()
+    if row is None or row[7] is None:
+        return None
+    tree = tx_templates.block_tree(row[5])
+    if tree.root != row[7]:
+        log.error("TX PROOF", "Block %s transactions no longer match its root %s", row[5], row[7])
+        return None
+    return {
+        "transaction": {"id": row[0], "from": row[1], "to": row[2],
+                        "amount": f"{float(row[3]):.8f}", "fee": f"{float(row[4]):.8f}"},
+        "block_id": row[5],
+        "block_hash": row[6],
+        "tx_root": row[7],
+        "siblings": tree.proof(transaction_id),
+    }
+
+# ---- Block index: compact in-memory chain, streamed from MySQL, checkpointed to disk ----
+class ChainIndex:
+    """Per-block id, hash, timestamp and difficulty in flat arrays; indexing returns small dicts"""
+    HASH_BYTES = 32
+
+    def __init__(self):
+        self.ids = array('q')
+        self.timestamps = array('q')
+        self.difficulties = array('i')
+        self.hashes = bytearray()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def append(self, block_id, block_hash, timestamp, difficulty):
+        self.ids.append(block_id)
+        self.timestamps.append(timestamp)
+        self.difficulties.append(difficulty)
+        self.hashes += bytes.fromhex(block_hash)
+
+    def _block(self, i):
+        return {
+            'block_id': self.ids[i],
+            'block_hash': self.hashes[i * self.HASH_BYTES:(i + 1) * self.HASH_BYTES].hex(),
+            'timestamp': self.timestamps[i],
+            'difficulty': self.difficulties[i],
+        }
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [self._block(i) for i in range(*key.indices(len(self)))]
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError("block index out of range")
+        return self._block(key)
+
+    def save(self, path):
+        """Write atomically: a JSON header line, then the raw arrays."""
+        header = {
+            "version": CHECKPOINT_VERSION,
+            "byteorder": sys.byteorder,
+            "count": len(self),
+            "tip_block_id": self.ids[-1] if len(self) else None,
+            "tip_hash": self[-1]['block_hash'] if len(self) else None,
+        }
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(json.dumps(header).encode(FORMAT) + b"\n")
+            self.ids.tofile(f)
+            self.timestamps.tofile(f)
+            self.difficulties.tofile(f)
+            f.write(self.hashes)
+        os.replace(tmp_path, path)
+        return header
+
+    @classmethod
+    def load(cls, path):
+        """Read a checkpoint written by save(); returns (index, header) or None if unusable."""
+        try:
+            with open(path, "rb") as f:
+                header = json.loads(f.readline())
+                if header.get("version") != CHECKPOINT_VERSION or header.get("byteorder") != sys.byteorder:
+                    return None
+                count = header["count"]
+                index = cls()
+                index.ids.fromfile(f, count)
+                index.timestamps.fromfile(f, count)
+                index.difficulties.fromfile(f, count)
+                index.hashes = bytearray(f.read(count * cls.HASH_BYTES))
+                if len(index.hashes) != count * cls.HASH_BYTES:
+                    return None
+        except (OSError, ValueError, KeyError, EOFError):
+            return None
+        return index, header
+
+def stream_block_index(index, after_block_id=None, connection=None, progress=None):
+    """Append blocks after after_block_id (all when None) to index, LOAD_CHUNK_SIZE rows at a time."""
+    cursor = (connection or mydb).cursor()  # mysql.connector's default cursor is unbuffered: rows stream from the server
+    loaded = 0
+    try:
+        if after_block_id is None:
+            cursor.execute("SELECT block_id, block_hash, timestamp, difficulty FROM blocks ORDER BY block_id")
+        else:
+            cursor.execute("SELECT block_id, block_hash, timestamp, difficulty FROM blocks WHERE block_id > %s ORDER BY block_id",
+                           (after_block_id,))
+        while True:
+            rows = cursor.fetchmany(LOAD_CHUNK_SIZE)
+            if not rows:
+                break
+            for block_id, block_hash, stamp, difficulty in rows:
+                index.append(block_id, block_hash, to_epoch(stamp) if stamp else 0, difficulty)
+            loaded += len(rows)
+            if progress is not None:
+                progress(len(index))
+    finally:
+        query_stats.finish()  # startup runs outside any request
+        cursor.close()
+    return loaded
+
+def load_checkpoint(connection=None):
+    """The checkpointed index if its tip block is still in the database with the same hash."""
+    if not CHECKPOINT_FILE:
+        return None
+    loaded = ChainIndex.load(CHECKPOINT_FILE)
+    if loaded is None:
+        return None
+    index, header = loaded
+    if header["count"] == 0:
+        return None
+    cursor = (connection or mydb).cursor()
+    try:
+        cursor.execute("SELECT block_hash FROM blocks WHERE block_id = %s", (header["tip_block_id"],))
+        row = cursor.fetchone()
+    finally:
+        query_stats.finish()
+        cursor.close()
+    if row is None or row[0] != header["tip_hash"]:
+        log.warning("BLOCKCHAIN", "Checkpoint %s does not match the database; doing a full load", CHECKPOINT_FILE)
+        return None
+    return index
+
+def save_checkpoint():
+    if not CHECKPOINT_FILE or blockchain is None or len(blockchain) == 0:
+        return
+    try:
+        header = blockchain.save(CHECKPOINT_FILE)
+        log.info("BLOCKCHAIN", "Checkpoint written: %s blocks, tip %s", header["count"], header["tip_block_id"])
+    except OSError as e:
+        log.error("BLOCKCHAIN ERROR", "Failed to write checkpoint: %s", e)
+
+# ---- Readiness: connections are served while the block index loads ----
+class Readiness:
+    """Load phase of the block index, reported by STATUS and used to hold off block submissions."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.phase = "starting"  # starting -> loading -> ready | failed
+        self.blocks_loaded = 0
+        self.blocks_expected = None
+        self.started_at = None
+        self.ready_at = None
+        self.error = None
+
+    @property
+    def ready(self):
+        return self.phase == "ready"
+
+    def loading(self):
+        with self.lock:
+            self.phase = "loading"
+            self.blocks_loaded = 0
+            self.blocks_expected = None
+            self.started_at = time.time()
+            self.ready_at = None
+            self.error = None
+
+    def progress(self, loaded, expected=None):
+        with self.lock:
+            self.blocks_loaded = loaded
+            if expected is not None:
+                self.blocks_expected = expected
+
+    def finish(self, error=None):
+        with self.lock:
+            self.phase = "failed" if error else "ready"
+            self.error = error
+            self.ready_at = time.time()
+
+    def retry_after(self):
+        """Seconds until the index should be ready, from the load rate so far."""
+        with self.lock:
+            elapsed = time.time() - (self.started_at or time.time())
+            if not self.blocks_expected or not self.blocks_loaded or elapsed <= 0:
+                return WARMUP_RETRY_AFTER
+            remaining = max(0, self.blocks_expected - self.blocks_loaded)
+            return max(1, int(remaining / (self.blocks_loaded / elapsed)) + 1)
+
+    def snapshot(self):
+        with self.lock:
+            snapshot = {
+                "ready": self.phase == "ready",
+                "phase": self.phase,
+                "blocks_loaded": self.blocks_loaded,
+                "blocks_expected": self.blocks_expected,
+                "load_seconds": round((self.ready_at or time.time()) - self.started_at, 3) if self.started_at else None,
+                "error": self.error,
+            }
+        if not snapshot["ready"]:
+            snapshot["retry_after"] = self.retry_after()
+        return snapshot
+
+readiness = Readiness()
+
 def load_blockchain():
-    """Load blockchain from database"""
+    """Load the block index, replaying only blocks after the checkpoint when one is usable"""
     global blockchain
     
+    blockchain = ChainIndex()
+    readiness.loading()
     if not mydb or not mycursor:
-        print("[BLOCKCHAIN ERROR] No database connection available")
+        log.error("BLOCKCHAIN ERROR", "No database connection available")
+        readiness.finish("No database connection available")
         return
-        
+    
+    # Request threads share mydb; the streaming read gets its own connection when possible
+    loader = TimedConnection(database_factory()) if database_factory else mydb
     try:
-        mycursor.execute("SELECT * FROM blocks ORDER BY block_id")
-        blocks = mycursor.fetchall()
-        blockchain = []
-        for block in blocks:
-            blockchain.append({
-                'block_id': block[1],
-                'nonce': block[2],
-                'previous_hash': block[3],
-                'miner_id': block[4],
-                'transactions': block[5],
-                'block_hash': block[6],
-                'timestamp': block[7],
-                'difficulty': block[8]
-            })
-        print(f"[BLOCKCHAIN] Loaded {len(blockchain)} blocks")
+        index = load_checkpoint(loader)
+        from_checkpoint = len(index) if index is not None else 0
+        if index is None:
+            index = ChainIndex()
+        cursor = loader.cursor()
+        try:
+            cursor.execute("SELECT MAX(block_id) FROM blocks")
+            top = cursor.fetchone()
+        finally:
+            cursor.close()
+        expected = from_checkpoint + max(0, (top[0] or 0) - (index.ids[-1] if len(index) else 0))
+        readiness.progress(from_checkpoint, expected)
+        replayed = stream_block_index(index, index.ids[-1] if len(index) else None, loader, readiness.progress)
+        state_tree.load(loader)
+        blockchain = index
+        readiness.finish()
+        log.info("BLOCKCHAIN", "Loaded %s blocks (%s from checkpoint, %s replayed)", len(blockchain), from_checkpoint, replayed)
+        if replayed >= CHECKPOINT_MIN_REPLAY:
+            save_checkpoint()
     except Error as e:
-        print(f"[BLOCKCHAIN ERROR] Failed to load blockchain: {e}")
-        blockchain = []
+        log.error("BLOCKCHAIN ERROR", "Failed to load blockchain: %s", e)
+        blockchain = ChainIndex()
+        readiness.finish(str(e))
+    finally:
+        if loader is not mydb:
+            loader.close()
 
 def get_current_difficulty():
-    """Calculate current mining difficulty"""
-    global current_difficulty
+    """Calculate current mining difficulty (adjusted at most once per new block)"""
+    global current_difficulty, difficulty_adjusted_at
     
     try:
-        if len(blockchain) < DIFFICULTY_ADJUSTMENT_INTERVAL:
+        if len(blockchain) < DIFFICULTY_ADJUSTMENT_INTERVAL or len(blockchain) == difficulty_adjusted_at:
             return current_difficulty
+        difficulty_adjusted_at = len(blockchain)
         
         recent_blocks = blockchain[-DIFFICULTY_ADJUSTMENT_INTERVAL:]
-        
-        time_taken = 0
-        for i in range(1, len(recent_blocks)):
-            try:
-                if isinstance(recent_blocks[i-1]['timestamp'], str):
-                    prev_time = datetime.strptime(recent_blocks[i-1]['timestamp'], "%Y-%m-%d %H:%M:%S")
-                else:
-                    prev_time = recent_blocks[i-1]['timestamp']
-                
-                if isinstance(recent_blocks[i]['timestamp'], str):
-                    curr_time = datetime.strptime(recent_blocks[i]['timestamp'], "%Y-%m-%d %H:%M:%S")
-                else:
-                    curr_time = recent_blocks[i]['timestamp']
-                
-                time_taken += (curr_time - prev_time).total_seconds()
-                
-            except (ValueError, TypeError, AttributeError) as e:
-                print(f"[DIFFICULTY WARNING] Error processing timestamp: {e}")
-                time_taken += BLOCK_TIME_TARGET
-        
-        avg_time = time_taken / (len(recent_blocks) - 1)
-        
-        if avg_time < BLOCK_TIME_TARGET:
-            current_difficulty += 1
-        elif avg_time > BLOCK_TIME_TARGET * 2:
-            current_difficulty = max(1, current_difficulty - 1)
-        
-        print(f"[DIFFICULTY] Adjusted to {current_difficulty} (avg time: {avg_time}s)")
+        current_difficulty = adjusted_difficulty(current_difficulty, [block['timestamp'] for block in recent_blocks])
+        log.debug("DIFFICULTY", "Adjusted to %s", current_difficulty)
         return current_difficulty
         
     except (IndexError, KeyError, ZeroDivisionError) as e:
-        print(f"[DIFFICULTY ERROR] Failed to calculate difficulty: {e}")
+        log.error("DIFFICULTY ERROR", "Failed to calculate difficulty: %s", e)
         return current_difficulty
 
+def adjusted_difficulty(difficulty, timestamps):
+    """One step of the difficulty rule, given the last DIFFICULTY_ADJUSTMENT_INTERVAL blocks' timestamps."""
+    if len(timestamps) < DIFFICULTY_ADJUSTMENT_INTERVAL:
+        return difficulty
+    # Block timestamps are epoch seconds, so the summed gaps telescope
+    avg_time = (timestamps[-1] - timestamps[0]) / (len(timestamps) - 1)
+    if avg_time < BLOCK_TIME_TARGET:
+        return difficulty + 1
+    if avg_time > BLOCK_TIME_TARGET * 2:
+        return max(1, difficulty - 1)
+    return difficulty
+
 def validate_block(block_data, block_hash):
     """Validate a mined block"""
     try:
@@ -400,8 +1715,18 @@ def validate_block(block_data, block_hash):
             mycursor.execute("SELECT * FROM blocks WHERE block_id = %s", (block_id,))
             if mycursor.fetchone():
                 return False, "Block already exists"
-        
-        calculated_hash = blake3.blake3(block_data.encode('utf-8')).hexdigest()
+            
+            found, tree = tx_templates.for_block(transactions)
+            if not found:
+                return False, "Unknown transaction root; request a new TEMPLATE"
+            if tree is not None:
+                placeholders = ", ".join(["%s"] * len(tree.ids))
+                mycursor.execute(f"SELECT COUNT(*) FROM transactions WHERE block_id IS NULL AND transaction_id IN ({placeholders})",
+                                 tuple(tree.ids))
+                if mycursor.fetchone()[0] != len(tree.ids):
+                    return False, "Template transactions are already in a block; request a new TEMPLATE"
+        
+        calculated_hash = hashing.digest(block_data.encode(FORMAT)).hex()
         if calculated_hash != block_hash:
             return False, "Hash mismatch"
         
@@ -419,10 +1744,16 @@ def validate_block(block_data, block_hash):
     except Exception as e:
         return False, f"Validation error: {e}"
 
+def discard_block(block_id):
+    """Remove a block stored by store_block before it was accepted, releasing its claimed transactions."""
+    mycursor.execute("UPDATE transactions SET block_id = NULL WHERE block_id = %s", (block_id,))
+    mycursor.execute("DELETE FROM blocks WHERE block_id = %s", (block_id,))
+    mydb.commit()
+
 def store_block(block_data, block_hash, miner_id):
     """Store validated block in database and update balances"""
     if not mydb or not mycursor:
-        print("[BLOCKCHAIN ERROR] No database connection available")
+        log.error("BLOCKCHAIN ERROR", "No database connection available")
         return False
         
     try:
@@ -436,36 +1767,404 @@ def store_block(block_data, block_hash, miner_id):
             INSERT INTO blocks (block_id, nonce, previous_hash, miner_id, transactions, block_hash, timestamp, difficulty)
             VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
         """
-        values = (block_id, nonce, previous_hash, miner_id, transactions, block_hash, datetime.now(), get_current_difficulty())
+        stamp = now_epoch()
+        difficulty = get_current_difficulty()
+        values = (block_id, nonce, previous_hash, miner_id, transactions, block_hash, to_db_datetime(stamp), difficulty)
         mycursor.execute(insert_query, values)
         
-        miner_balance = get_user_balance(miner_id)
-        new_balance = miner_balance + BLOCK_REWARD
-        update_user_balance(miner_id, new_balance)
+        _, tree = tx_templates.for_block(transactions)
+        if tree is not None and not claim_block_transactions(block_id, tree):
+            # Another block already holds some of them: undo this one
+            discard_block(block_id)
+            log.warning("BLOCKCHAIN", "Block %s rejected: its template's transactions are already in a block", block_id)
+            return False
+        
+        if not credit_account(miner_id, BLOCK_REWARD):
+            # A block whose miner went unpaid must not be committed with a state_root missing the reward
+            discard_block(block_id)
+            log.warning("BLOCKCHAIN", "Block %s rejected: could not credit the reward to %s", block_id, miner_id)
+            return False
+        
+        # Commit the balances after the reward, and the claimed transactions, to this block
+        mycursor.execute("UPDATE blocks SET state_root = %s, tx_root = %s WHERE block_id = %s",
+                         (state_tree.root_hex(), tree.root if tree is not None else None, block_id))
         
         mydb.commit()
         
-        blockchain.append({
-            'block_id': block_id,
-            'nonce': nonce,
-            'previous_hash': previous_hash,
-            'miner_id': miner_id,
-            'transactions': transactions,
-            'block_hash': block_hash,
-            'timestamp': datetime.now(),
-            'difficulty': get_current_difficulty()
-        })
-        
-        print(f"[BLOCKCHAIN] Block {block_id} stored successfully. Miner {miner_id} rewarded {BLOCK_REWARD} coins")
+        blockchain.append(block_id, block_hash, stamp, difficulty)
+        if tree is not None:
+            tx_templates.claimed(block_id, tree)
+        
+        log.debug("BLOCKCHAIN", "Block %s stored successfully. Miner %s rewarded %s coins", block_id, miner_id, BLOCK_REWARD)
         return True
         
     except Error as e:
-        print(f"[BLOCKCHAIN ERROR] Failed to store block: {e}")
+        log.error("BLOCKCHAIN ERROR", "Failed to store block: %s", e)
         return False
 
+def submit_block(block_data, block_hash):
+    """Validate and store a mined block; (status, detail) for the reply."""
+    miner_id = block_data.split("MinerPublicID: ")[1].split(".")[0]
+    is_valid, validation_msg = validate_block(block_data, block_hash)
+    if not is_valid:
+        return "BLOCK REJECTED", validation_msg
+    if not store_block(block_data, block_hash, miner_id):
+        return "BLOCK REJECTED", "Storage failed"
+    broadcast_to_clients(f"NEW_BLOCK|||{block_data}|||{block_hash}")
+    return "BLOCK ACCEPTED", validation_msg
+
+def block_template(miner_id):
+    """What a miner should build on: tip, difficulty and the pending transactions' root."""
+    tree = tx_templates.create()
+    tip = blockchain[-1] if len(blockchain) else None
+    return {
+        "block_id": tip["block_id"] + 1 if tip else 1,
+        "previous_hash": tip["block_hash"] if tip else "0" * 64,
+        "miner_id": miner_id,
+        "difficulty": get_current_difficulty(),
+        "transactions": f"{miner_id}+{BLOCK_REWARD}, merkle={tree.root}" if tree.ids else f"{miner_id}+{BLOCK_REWARD}",
+        "tx_root": tree.root if tree.ids else None,
+        "transaction_ids": tree.ids,
+    }
+
+# ---- Server-side mining: MINE| jobs searched on a process pool ----
+class MiningEngine:
+    """Runs MINE| jobs as nonce searches on a process pool, one slice per turn so users share it fairly"""
+    def __init__(self, workers):
+        self.workers = max(1, workers)
+        self.cond = threading.Condition()
+        self.free = self.workers
+        self.waiting = OrderedDict()  # username -> slices waiting, in turn order
+        self.pool = None
+        self.jobs = 0
+        self.active = 0
+        self.hashes = 0
+        self.blocks = 0
+        self.stale = 0
+
+    def _executor(self):
+        with self.cond:
+            if self.pool is None:
+                # Same start method as the verification pools: no fork of this threaded process
+                self.pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=chain_verify.POOL_CONTEXT)
+            return self.pool
+
+    def start(self):
+        """Start the workers now, so the first MINE| doesn't wait for them."""
+        executor = self._executor()
+        for future in [executor.submit(mining.search, "", "", 0, 0, 0) for _ in range(self.workers)]:
+            future.result()
+
+    def _take_turn(self, username, deadline):
+        """Wait for a worker and for username's turn; False if the deadline passes first."""
+        with self.cond:
+            self.waiting[username] = self.waiting.get(username, 0) + 1
+            while not (self.free > 0 and next(iter(self.waiting)) == username):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._leave_queue(username)
+                    return False
+                self.cond.wait(remaining)
+            self.free -= 1
+            self._leave_queue(username)
+            return True
+
+    def _leave_queue(self, username):
+        waiting = self.waiting.pop(username) - 1
+        if waiting:
+            self.waiting[username] = waiting  # back of the rotation
+        self.cond.notify_all()
+
+    def _end_turn(self):
+        with self.cond:
+            self.free += 1
+            self.cond.notify_all()
+
+    def run(self, username, seconds):
+        """Mine for username for `seconds`; returns the job's report."""
+        with self.cond:
+            self.jobs += 1
+            self.active += 1
+        started = time.monotonic()
+        deadline = started + seconds
+        hashes = blocks = stale = 0
+        template = None
+        try:
+            while server_running and time.monotonic() < deadline:
+                if not self._take_turn(username, deadline):
+                    break
+                try:
+                    tip_id = blockchain[-1]['block_id'] if len(blockchain) else 0
+                    if template is None or template["block_id"] != tip_id + 1:
+                        template = block_template(username)
+                        prefix = f"ID: {template['block_id']}.Nonce: "
+                        suffix = (f".PreviousHash: {template['previous_hash']}.MinerPublicID: {username}"
+                                  f".Transactions: {template['transactions']}.")
+                    budget = min(MINING_SLICE_SECONDS, max(0.0, deadline - time.monotonic()))
+                    nonce, block_hash, done = self._executor().submit(
+                        mining.search, prefix, suffix, template["difficulty"], secrets.randbits(62), budget).result()
+                finally:
+                    self._end_turn()
+                hashes += done
+                if nonce is None:
+                    continue
+                status, detail = submit_block(f"{prefix}{nonce}{suffix}", block_hash)
+                if status == "BLOCK ACCEPTED":
+                    blocks += 1
+                else:
+                    stale += 1  # another block took the height first
+                    log.debug("MINING", "Block found for %s not stored: %s", username, detail)
+        finally:
+            with self.cond:
+                self.active -= 1
+                self.hashes += hashes
+                self.blocks += blocks
+                self.stale += stale
+        elapsed = time.monotonic() - started
+        report = {
+            "username": username,
+            "seconds": seconds,
+            "elapsed": round(elapsed, 3),
+            "hashes": hashes,
+            "hashrate": round(hashes / elapsed, 1) if elapsed > 0 else 0.0,
+            "blocks_found": blocks,
+            "stale_blocks": stale,
+            "reward": blocks * BLOCK_REWARD,
+        }
+        log.info("MINING", "%s mined %s blocks in %.1fs (%.0f H/s)", username, blocks, elapsed, report["hashrate"])
+        return report
+
+    def stats(self):
+        with self.cond:
+            return {"workers": self.workers, "busy": self.workers - self.free, "jobs": self.jobs,
+                    "active_jobs": self.active, "waiting_users": len(self.waiting), "hashes": self.hashes,
+                    "blocks": self.blocks, "stale_blocks": self.stale}
+
+mining_engine = MiningEngine(MINING_WORKERS)
+
+# ---- Bulk verification: stored-chain replay and block file import ----
+def load_verify_progress(connection=None):
+    """The saved progress of an interrupted verification, if its last block is still stored with the same hash."""
+    if not VERIFY_PROGRESS_FILE:
+        return None
+    try:
+        with open(VERIFY_PROGRESS_FILE, encoding=FORMAT) as f:
+            progress = json.load(f)
+        if progress.get("version") != VERIFY_PROGRESS_VERSION:
+            return None
+        block_id, block_hash = progress["block_id"], progress["block_hash"]
+    except (OSError, ValueError, KeyError):
+        return None
+    cursor = (connection or mydb).cursor()
+    try:
+        cursor.execute("SELECT block_hash FROM blocks WHERE block_id = %s", (block_id,))
+        row = cursor.fetchone()
+    finally:
+        cursor.close()
+    if row is None or row[0] != block_hash:
+        log.warning("VERIFY", "Progress file %s does not match the database; verifying from the start", VERIFY_PROGRESS_FILE)
+        return None
+    return progress
+
+def save_verify_progress(progress):
+    if not VERIFY_PROGRESS_FILE:
+        return
+    tmp_path = VERIFY_PROGRESS_FILE + ".tmp"
+    try:
+        with open(tmp_path, "w", encoding=FORMAT) as f:
+            json.dump(progress, f)
+        os.replace(tmp_path, VERIFY_PROGRESS_FILE)
+    except OSError as e:
+        log.error("VERIFY", "Failed to write progress file: %s", e)
+
+def verify_stored_blocks(workers=None, resume=False):
+    """Re-check every stored block in batches and return a summary; resume carries on after an interrupted run"""
+    started = time.perf_counter()
+    loader = TimedConnection(database_factory()) if database_factory else mydb
+    progress = load_verify_progress(loader) if resume else None
+    if progress is None:
+        progress = {"version": VERIFY_PROGRESS_VERSION, "block_id": None, "block_hash": None,
+                    "checked": 0, "error_count": 0, "errors": []}
+    else:
+        log.info("VERIFY", "Resuming verification after block %s", progress["block_id"])
+    resumed_from = progress["block_id"]
+    pool = chain_verify.open_pool(workers)
+    cursor = loader.cursor()  # unbuffered: rows stream from the server batch by batch
+    complete = False
+    try:
+        columns = "SELECT block_id, nonce, previous_hash, miner_id, transactions, block_hash, difficulty FROM blocks"
+        if resumed_from is None:
+            cursor.execute(columns + " ORDER BY block_id")
+        else:
+            cursor.execute(columns + " WHERE block_id > %s ORDER BY block_id", (resumed_from,))
+        while server_running:
+            rows = cursor.fetchmany(VERIFY_BATCH)
+            if not rows:
+                complete = True
+                break
+            records = [(chain_verify.block_text(block_id, nonce, prev, miner, transactions), block_hash, difficulty)
+                       for block_id, nonce, prev, miner, transactions, block_hash, difficulty in rows]
+            # Link on the stored columns, not on what parsing the block text recovered
+            batch = [block._replace(block_id=row[0], previous_hash=row[2])
+                     for row, block in zip(rows, chain_verify.check_blocks(records, workers, pool))]
+            found = [(block.block_id, block.error) for block in batch if block.error]
+            found += chain_verify.link_errors(batch, progress["block_id"], progress["block_hash"])
+            found.sort()
+            # Swapped in whole, so an interrupt never leaves a half-counted batch behind
+            progress = dict(progress, block_id=batch[-1].block_id, block_hash=batch[-1].block_hash,
+                            checked=progress["checked"] + len(batch), error_count=progress["error_count"] + len(found),
+                            errors=progress["errors"] + found[:VERIFY_MAX_REPORTED - len(progress["errors"])])
+            save_verify_progress(progress)
+    except KeyboardInterrupt:
+        save_verify_progress(progress)
+        log.warning("VERIFY", "Interrupted after block %s; progress saved for --resume", progress["block_id"])
+    finally:
+        cursor.close()
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+        if loader is not mydb:
+            loader.close()
+    if complete and VERIFY_PROGRESS_FILE:
+        try:
+            os.remove(VERIFY_PROGRESS_FILE)
+        except OSError:
+            pass
+    seconds = time.perf_counter() - started
+    log.info("VERIFY", "Checked %s stored blocks (%s), %.2fs this run: %s errors",
+             progress["checked"], "complete" if complete else "interrupted", seconds, progress["error_count"])
+    reported = [{"block_id": block_id, "error": error} for block_id, error in progress["errors"]]
+    return {"checked": progress["checked"], "complete": complete, "resumed_from": resumed_from,
+            "last_block_id": progress["block_id"], "error_count": progress["error_count"],
+            "first_error": reported[0] if reported else None, "errors": reported,
+            "seconds": round(seconds, 3)}
+
+def read_block_file(path):
+    """(block_data, block_hash, timestamp or None) per block_data|||block_hash[|||timestamp] line"""
+    with open(path, encoding=FORMAT) as handle:
+        for line in handle:
+            line = line.strip()
+            if not line:
+                continue
+            fields = line.split("|||")
+            yield fields[0], fields[1], int(fields[2]) if len(fields) > 2 else None
+
+def import_blocks(records, workers=None):
+    """Verify records against the replayed difficulty rule and store them in one transaction"""
+    global current_difficulty, difficulty_adjusted_at
+    if not mydb or not mycursor:
+        return False, "No database connection", {}
+    started = time.perf_counter()
+    records = list(records)
+    stamps = {}
+    # Difficulty 0: the pool only recomputes hashes; the required difficulty is replayed below
+    batch = chain_verify.check_blocks([(block_data, block_hash, 0) for block_data, block_hash, _ in records], workers)
+    if not batch:
+        return False, "No blocks to import", {}
+    bad = [{"block_id": block.block_id, "error": block.error} for block in batch if block.error]
+    if bad:
+        return False, f"{len(bad)} blocks failed verification", {"errors": bad[:VERIFY_MAX_REPORTED]}
+    for block, (_, _, stamp) in zip(batch, records):
+        stamps[block.block_id] = stamp
+    batch.sort(key=lambda block: block.block_id)
+    tip = blockchain[-1] if len(blockchain) else None
+    if tip is None and batch[0].block_id != 1:
+        return False, "The chain is empty; the import must start at block 1", {}
+    links = chain_verify.link_errors(batch, tip["block_id"] if tip else None, tip["block_hash"] if tip else None)
+    if links:
+        return False, f"{len(links)} blocks do not link", {
+            "errors": [{"block_id": block_id, "error": error} for block_id, error in links[:VERIFY_MAX_REPORTED]]}
+    
+    now = now_epoch()
+    recent = deque((block['timestamp'] for block in blockchain[-DIFFICULTY_ADJUSTMENT_INTERVAL:]),
+                   maxlen=DIFFICULTY_ADJUSTMENT_INTERVAL)
+    difficulty = get_current_difficulty()
+    bad = []
+    accepted = []  # (block, timestamp, difficulty)
+    for block in batch:
+        if accepted:
+            difficulty = adjusted_difficulty(difficulty, list(recent))
+        stamp = stamps[block.block_id]
+        stamp = now if stamp is None else stamp
+        if TX_ROOT_PATTERN.search(block.transactions):
+            bad.append({"block_id": block.block_id, "error": "Blocks with transaction roots cannot be imported"})
+        elif (recent and stamp < recent[-1]) or stamp > now:
+            bad.append({"block_id": block.block_id, "error": f"Timestamp {stamp} is out of order or in the future"})
+        elif not block.block_hash.startswith("0" * difficulty):
+            bad.append({"block_id": block.block_id, "error": f"Hash doesn't meet difficulty requirement: {'0' * difficulty}"})
+        recent.append(stamp)
+        accepted.append((block, stamp, difficulty))
+    if bad:
+        return False, f"{len(bad)} blocks failed verification", {"errors": bad[:VERIFY_MAX_REPORTED]}
+    
+    miners = {block.miner_id for block in batch}
+    # Rewards are plain increments inside the transaction; in "locks" mode the
+    # miners' stripes keep read-modify-write updates from overwriting them.
+    with account_locks.hold(*miners) if BALANCE_MODE == "locks" else nullcontext():
+        mydb.start_transaction()
+        try:
+            rows = []
+            for block, stamp, required in accepted:
+                mycursor.execute("UPDATE customer_info SET balance = balance + %s, version = version + 1 WHERE username = %s",
+                                 (BLOCK_REWARD, block.miner_id))
+                if mycursor.rowcount != 1:
+                    raise ValueError(f"Block {block.block_id}: unknown miner {block.miner_id}")
+                # Read back on this connection, which sees the uncommitted reward
+                state_tree.set(block.miner_id, *read_balance_state(block.miner_id))
+                rows.append((block.block_id, block.nonce, block.previous_hash, block.miner_id, block.transactions,
+                             block.block_hash, to_db_datetime(stamp), required, state_tree.root_hex()))
+            mycursor.executemany("""
+                INSERT INTO blocks (block_id, nonce, previous_hash, miner_id, transactions, block_hash, timestamp, difficulty, state_root)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+            """, rows)
+            mydb.commit()
+        except Exception as e:
+            mydb.rollback()
+            for miner_id in miners:
+                state_tree.refresh(miner_id, force=True)
+            log.error("IMPORT", "Block import rolled back: %s", e)
+            return False, f"Import failed: {e}", {}
+    
+    for block, stamp, required in accepted:
+        blockchain.append(block.block_id, block.block_hash, stamp, required)
+    # As if each block had been stored live: the next call adjusts for the new length
+    current_difficulty, difficulty_adjusted_at = accepted[-1][2], len(blockchain) - 1
+    seconds = time.perf_counter() - started
+    log.info("IMPORT", "Imported blocks %s-%s in %.2fs", batch[0].block_id, batch[-1].block_id, seconds)
+    return True, f"Imported {len(batch)} blocks", {
+        "first_block_id": batch[0].block_id, "last_block_id": batch[-1].block_id,
+        "count": len(batch), "seconds": round(seconds, 3)}
+
+def handle_chain_command(conn, addr, msg, structured):
+    """CHAIN|VERIFY[|RESUME], CHAIN|IMPORT|<path> (localhost only)."""
+    if addr[0] not in ADMIN_HOSTS:
+        send_reply(conn, structured, "FORBIDDEN", "Admin commands are only accepted from localhost")
+        return
+    if not readiness.ready:
+        send_reply(conn, structured, "NOT_READY", "Chain index is still loading",
+                   data={"retry_after": readiness.retry_after()})
+        return
+    parts = msg.split("|")
+    action = parts[1].upper() if len(parts) > 1 else ""
+    if action == "VERIFY":
+        summary = verify_stored_blocks(resume=len(parts) > 2 and parts[2].upper() == "RESUME")
+        send_reply(conn, structured, "CHAIN_VERIFIED", f"{summary['checked']} blocks, {summary['error_count']} errors",
+                   data=summary)
+    elif action == "IMPORT" and len(parts) > 2:
+        try:
+            records = list(read_block_file(parts[2]))
+        except (OSError, ValueError, IndexError) as e:
+            send_reply(conn, structured, "CHAIN_FAILED", f"Cannot read block file: {e}")
+            return
+        success, message, details = import_blocks(records)
+        send_reply(conn, structured, "CHAIN_IMPORTED" if success else "CHAIN_FAILED", message, data=details)
+    else:
+        send_reply(conn, structured, "CHAIN_FAILED", f"Unknown chain action: {action}")
+
 def broadcast_to_clients(message):
     """Broadcast message to all connected clients"""
     for client in connected_clients[:]:
+        if client in request_clients:
+            continue
         try:
             client.send(message.encode(FORMAT))
         except:
@@ -486,7 +2185,9 @@ def Add_User(username, password, cpu_id, ram_id, motherboard_id, word_list, hard
         if mycursor.fetchone():
             return False, "Username already exists"
         
-        hashed_words = [singleHash(word) for word in (word_list or [])]
+        word_list = word_list or []
+        hashed = singleHashes([*word_list, cpu_id or '', ram_id or '', motherboard_id or ''])
+        hashed_words, (cpu_hash, ram_hash, motherboard_hash) = hashed[:len(word_list)], hashed[len(word_list):]
         
         insert_query = """
             INSERT INTO customer_info (
@@ -496,9 +2197,9 @@ def Add_User(username, password, cpu_id, ram_id, motherboard_id, word_list, hard
         values = (
             username,
             doubleHash(password),
-            singleHash(cpu_id or ''),
-            singleHash(ram_id or ''),
-            singleHash(motherboard_id or ''),
+            cpu_hash,
+            ram_hash,
+            motherboard_hash,
             getTime(),
             json.dumps(hashed_words),
             0.00000000
@@ -506,11 +2207,12 @@ def Add_User(username, password, cpu_id, ram_id, motherboard_id, word_list, hard
         
         mycursor.execute(insert_query, values)
         mydb.commit()
-        print(f"[USER] Added user: {username} to database. ID: {mycursor.lastrowid}")
+        log.debug("USER", "Added user: %s to database. ID: %s", username, mycursor.lastrowid)
+        state_tree.refresh(username)
         return True, "User created successfully"
         
     except Error as e:
-        print(f"[USER ERROR] {e}")
+        log.error("USER ERROR", "%s", e)
         return False, str(e)
 
 def verify_hardware_match(username, current_hardware):
@@ -527,20 +2229,14 @@ def verify_hardware_match(username, current_hardware):
             
         stored_cpu, stored_ram, stored_motherboard = result
         
-        matches = 0
-        total_checks = 3
-        
-        if singleHash(current_hardware.get('cpu_id', '')) == stored_cpu:
-            matches += 1
-        if singleHash(current_hardware.get('ram_id', '')) == stored_ram:
-            matches += 1
-        if singleHash(current_hardware.get('disk_serial', '')) == stored_motherboard:
-            matches += 1
+        current = singleHashes([current_hardware.get('cpu_id', ''), current_hardware.get('ram_id', ''),
+                                current_hardware.get('disk_serial', '')])
+        matches = sum(a == b for a, b in zip(current, (stored_cpu, stored_ram, stored_motherboard)))
             
         return matches >= 2
         
     except Exception as e:
-        print(f"[HARDWARE CHECK ERROR] {e}")
+        log.error("HARDWARE CHECK ERROR", "%s", e)
         return True
 
 def verify_user_login(username, password, word_list=None, hardware_info=None):
@@ -567,42 +2263,39 @@ def verify_user_login(username, password, word_list=None, hardware_info=None):
                 if not word_list:
                     return False, "HARDWARE_MISMATCH"
                 
-                hashed_input_words = [singleHash(word) for word in word_list]
+                hashed_input_words = singleHashes(word_list)
                 stored_words = json.loads(stored_word_list)
                 
                 if hashed_input_words != stored_words:
                     return False, "Invalid security words"
                 
-                print(f"[LOGIN] User {username} authenticated with security words due to hardware changes")
+                log.debug("LOGIN", "User %s authenticated with security words due to hardware changes", username)
             else:
-                print(f"[LOGIN] User {username} authenticated with hardware verification")
+                log.debug("LOGIN", "User %s authenticated with hardware verification", username)
         
         return True, "Login successful"
         
     except Exception as e:
-        print(f"[LOGIN ERROR] {e}")
+        log.error("LOGIN ERROR", "%s", e)
         return False, str(e)
 
+def load_security_words():
+    """Read the bundled word list (3-6 letter words, one per line) into a tuple once."""
+    global security_words
+    if security_words is None:
+        with open(SECURITY_WORDS_FILE, encoding=FORMAT) as f:
+            security_words = tuple(line.strip() for line in f if line.strip())
+    return security_words
+
 def generate_word_security():
     """Generate 5 unique random words for security"""
+    words = load_security_words()
     word_list = []
-    attempts = 0
-    max_attempts = 100
-    
-    while len(word_list) < 5 and attempts < max_attempts:
-        try:
-            word = r.get_random_word()
-            if word and len(word) <= 6 and word not in word_list:
-                word_list.append(word)
-        except:
-            pass
-        attempts += 1
-    
-    if len(word_list) < 5:
-        fallback_words = ['cat', 'dog', 'sun', 'moon', 'tree', 'rock', 'fish', 'bird', 'car', 'book']
-        word_list.extend(fallback_words[:5-len(word_list)])
-    
-    return word_list[:5]
+    while len(word_list) < SECURITY_WORD_COUNT:
+        word = secrets.choice(words)
+        if word not in word_list:
+            word_list.append(word)
+    return word_list
 
 # ---- FIXED: send_response helper ----
 def send_response(conn, response_text):
@@ -613,10 +2306,489 @@ def send_response(conn, response_text):
         send_length = str(msg_length).encode(FORMAT)
         send_length += b' ' * (HEADER - len(send_length))
         
-        conn.sendall(send_length)
-        conn.sendall(message)
+        # One write: header and body in separate segments stall on Nagle + delayed ACK.
+        conn.sendall(send_length + message)
     except Exception as e:
-        print(f"[SEND RESPONSE ERROR] {e}")
+        log.error("SEND RESPONSE ERROR", "%s", e)
+
+# Structured replies: a connection that sends PROTOCOL|JSON gets
+# {"code", "status", "message", "data"} instead of "STATUS: message" text.
+STATUS_CODES = {
+    "BALANCE": 200,
+    "HISTORY": 200,
+    "PROTOCOL_OK": 200,
+    "PROTOCOL_FAILED": 400,
+    "METRICS": 200,
+    "PROFILE_STARTED": 200,
+    "PROFILE_STOPPED": 200,
+    "PROFILE_STATUS": 200,
+    "PROFILE_FAILED": 400,
+    "FORBIDDEN": 403,
+    "QUERY_STATS": 200,
+    "STATUS": 200,
+    "NOT_READY": 503,
+    "IDEMPOTENCY_KEY_INVALID": 400,
+    "IDEMPOTENCY_KEY_REUSED": 409,
+    "QUERY_STATS_FAILED": 400,
+    "STATE_PROOF": 200,
+    "STATE_PROOF_FAILED": 404,
+    "TEMPLATE": 200,
+    "CHAIN_VERIFIED": 200,
+    "CHAIN_IMPORTED": 200,
+    "CHAIN_FAILED": 400,
+    "TX_PROOF": 200,
+    "TX_PROOF_FAILED": 404,
+    "SEND_SUCCESS": 200,
+    "TRANSACTION_FAILED": 400,
+    "MINE_SUCCESS": 200,
+    "MINE_FAILED": 400,
+    "AIR_DROP_SUCCESS": 200,
+    "AIR_DROP_FAILED": 400,
+    "USERNAME_AVAILABLE": 200,
+    "USERNAME_TAKEN": 200,
+    "REGISTRATION_SUCCESS": 200,
+    "REGISTRATION_FAILED": 400,
+    "LOGIN_SUCCESS": 200,
+    "LOGIN_FAILED": 401,
+    "BLOCK ACCEPTED": 200,
+    "BLOCK REJECTED": 400,
+    "UNKNOWN_COMMAND": 400,
+}
+
+def send_reply(conn, structured, status, message="", data=None, code=None, legacy=None):
+    """Send one reply as JSON (structured connections) or legacy text, "STATUS: message" unless legacy is given"""
+    if code is None:
+        code = STATUS_CODES.get(status, 500)
+    _request_local.code = code
+    if structured:
+        send_response(conn, json.dumps({"code": code, "status": status, "message": message, "data": data}))
+    elif legacy is not None:
+        send_response(conn, legacy)
+    else:
+        send_response(conn, f"{status}: {message}")
+
+# ---- Metrics: per-command counters, in-flight gauges and latency histograms ----
+LATENCY_BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+COMMAND_PREFIXES = (
+    "GET_BALANCE|", "SEND_TRANSACTION|", "GET_HISTORY|", "MINE|", "AIR_DROP|",
+    "CHECK_USERNAME|", "REGISTER|", "LOGIN|",
+)
+
+def command_name(msg):
+    """Metrics label for a message, following handle_message's dispatch order."""
+    if msg.startswith("PROTOCOL|"):
+        return "PROTOCOL"
+    if msg.startswith("METRICS"):
+        return "METRICS"
+    if msg.startswith("PROFILE|"):
+        return "PROFILE"
+    if msg.startswith("QUERY_STATS"):
+        return "QUERY_STATS"
+    if msg.startswith("STATUS"):
+        return "STATUS"
+    if msg.startswith("STATE_PROOF|"):
+        return "STATE_PROOF"
+    if msg.startswith("TEMPLATE|"):
+        return "TEMPLATE"
+    if msg.startswith("CHAIN|"):
+        return "CHAIN"
+    if msg.startswith("TX_PROOF|"):
+        return "TX_PROOF"
+    for prefix in COMMAND_PREFIXES:
+        if prefix in msg:
+            return prefix[:-1]
+    if ID_CODE in msg:
+        return "HARDWARE_ID"
+    if "|||" in msg:
+        return "BLOCK"
+    return "UNKNOWN"
+
+class Histogram:
+    __slots__ = ("counts", "total_ms")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)  # last bucket is +Inf
+        self.total_ms = 0.0
+
+    def observe(self, ms):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS_MS, ms)] += 1
+        self.total_ms += ms
+
+    def snapshot(self):
+        return {"counts": list(self.counts), "sum_ms": round(self.total_ms, 3)}
+
+class CommandStats:
+    __slots__ = ("count", "errors", "failures", "in_flight", "latency", "db", "db_queries")
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0      # 5xx replies or exceptions
+        self.failures = 0    # 4xx replies (bad input, insufficient funds, ...)
+        self.in_flight = 0
+        self.latency = Histogram()
+        self.db = Histogram()
+        self.db_queries = 0
+
+class ServerMetrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.commands = {}
+        self.started_at = time.time()
+
+    def _stats(self, command):
+        stats = self.commands.get(command)
+        if stats is None:
+            stats = self.commands[command] = CommandStats()
+        return stats
+
+    def begin(self, command):
+        _request_local.active = True
+        _request_local.command = command
+        _request_local.db_seconds = 0.0
+        _request_local.db_queries = 0
+        _request_local.code = None
+        with self.lock:
+            self._stats(command).in_flight += 1
+
+    def end(self, command, seconds):
+        query_stats.finish()
+        _request_local.active = False
+        _request_local.command = None
+        code = _request_local.code
+        db_ms = _request_local.db_seconds * 1000
+        with self.lock:
+            stats = self._stats(command)
+            stats.in_flight -= 1
+            stats.count += 1
+            if code is None or code >= 500:
+                stats.errors += 1
+            elif code >= 400:
+                stats.failures += 1
+            stats.latency.observe(seconds * 1000)
+            stats.db.observe(db_ms)
+            stats.db_queries += _request_local.db_queries
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "uptime_s": round(time.time() - self.started_at, 3),
+                "buckets_ms": list(LATENCY_BUCKETS_MS),
+                "connections": len(connected_clients),
+                "log": log.stats(),
+                "account_locks": account_locks.snapshot(),
+                "balance_cas": cas_stats.snapshot(),
+                "state_tree": state_tree.stats(),
+                "idempotency": idempotency.stats(),
+                "mining": mining_engine.stats(),
+                "commands": {
+                    name: {
+                        "count": st.count,
+                        "errors": st.errors,
+                        "failures": st.failures,
+                        "in_flight": st.in_flight,
+                        "latency": st.latency.snapshot(),
+                        "db": st.db.snapshot(),
+                        "db_queries": st.db_queries,
+                    }
+                    for name, st in self.commands.items()
+                },
+            }
+
+metrics = ServerMetrics()
+
+# ---- Profiling: on-demand sampling / cProfile sessions (PROFILE| command) ----
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+class ProfileSession:
+    """One profiling run: sampled handler stacks, plus per-request cProfile in "cprofile" mode"""
+    def __init__(self, mode, seconds):
+        self.mode = mode
+        self.seconds = seconds
+        self.started_at = time.time()
+        self.deadline = self.started_at + seconds
+        self.stop_event = threading.Event()
+        self.lock = threading.Lock()
+        self.stacks = {}
+        self.samples = 0
+        self.thread_profiles = {}  # thread id -> (Profile, Lock)
+        self.skipped_requests = 0
+        self.result = None
+        self.sampler = threading.Thread(target=self._sample_loop, name="profile-sampler", daemon=True)
+
+    @property
+    def profiles_requests(self):
+        return self.mode == "cprofile"
+
+    def run(self, func, *args):
+        """Run one request under this thread's cProfile.Profile."""
+        entry = self.thread_profiles.get(threading.get_ident())
+        if entry is None:
+            import cProfile
+            entry = (cProfile.Profile(), threading.Lock())
+            with self.lock:
+                self.thread_profiles[threading.get_ident()] = entry
+        profile, profile_lock = entry
+        with profile_lock:
+            if self.stop_event.is_set():
+                return func(*args)
+            try:
+                profile.enable()
+            except ValueError:
+                # Another profiler owns this interpreter (Python 3.12+ allows one)
+                self.skipped_requests += 1
+                return func(*args)
+            try:
+                return func(*args)
+            finally:
+                profile.disable()
+
+    def _sample_loop(self):
+        own = threading.get_ident()
+        while not self.stop_event.wait(PROFILE_SAMPLE_INTERVAL):
+            if time.time() >= self.deadline:
+                break
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(frame.f_code)
+                    frame = frame.f_back
+                if not any(code is handle_client.__code__ for code in stack):
+                    continue
+                key = ";".join(_frame_label(code) for code in reversed(stack))
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+                self.samples += 1
+        self.stop_event.set()
+        self.result = self._write_files()
+        log.info("PROFILE", "%s session finished: %s samples -> %s", self.mode, self.samples, ", ".join(self.result["files"]))
+
+    def _write_files(self):
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        base = os.path.join(PROFILE_DIR, time.strftime("profile-%Y%m%d-%H%M%S", time.localtime(self.started_at)))
+        files = []
+        collapsed = base + ".collapsed"
+        with open(collapsed, "w") as f:
+            for key, count in sorted(self.stacks.items()):
+                f.write(f"{key} {count}\n")
+        files.append(collapsed)
+        if self.thread_profiles:
+            import pstats
+            stats = None
+            for profile, profile_lock in list(self.thread_profiles.values()):
+                with profile_lock:
+                    profile.create_stats()
+                    if stats is None:
+                        stats = pstats.Stats(profile)
+                    else:
+                        stats.add(profile)
+            stats.dump_stats(base + ".prof")
+            files.append(base + ".prof")
+        return {"mode": self.mode, "samples": self.samples, "stacks": len(self.stacks),
+                "threads_profiled": len(self.thread_profiles), "skipped_requests": self.skipped_requests,
+                "files": files}
+
+class Profiler:
+    """Holds at most one ProfileSession; handler threads only read .session."""
+    def __init__(self):
+        self.session = None
+        self.last_result = None
+        self.lock = threading.Lock()
+
+    def start(self, mode, seconds):
+        if mode not in ("sample", "cprofile"):
+            return False, f"Unknown profile mode: {mode}"
+        if not 0 < seconds <= PROFILE_MAX_SECONDS:
+            return False, f"Duration must be between 1 and {PROFILE_MAX_SECONDS} seconds"
+        with self.lock:
+            if self.session is not None and not self.session.stop_event.is_set():
+                return False, "A profile session is already running"
+            self.session = ProfileSession(mode, seconds)
+            self.session.sampler.start()
+        log.info("PROFILE", "%s session started for %ss", mode, seconds)
+        return True, f"Profiling ({mode}) for {seconds}s"
+
+    def stop(self):
+        with self.lock:
+            session = self.session
+            self.session = None
+        if session is None:
+            return None
+        session.stop_event.set()
+        session.sampler.join()
+        self.last_result = session.result
+        return session.result
+
+    def status(self):
+        session = self.session
+        if session is None or session.stop_event.is_set():
+            return {"active": False, "last": session.result if session else self.last_result}
+        return {"active": True, "mode": session.mode, "samples": session.samples,
+                "remaining_s": round(max(0.0, session.deadline - time.time()), 1)}
+
+profiler = Profiler()
+
+def handle_profile_command(conn, addr, msg, structured):
+    """PROFILE|START|<sample|cprofile>|<seconds>, PROFILE|STOP, PROFILE|STATUS (localhost only)."""
+    if addr[0] not in ADMIN_HOSTS:
+        send_reply(conn, structured, "FORBIDDEN", "Admin commands are only accepted from localhost")
+        return
+    parts = msg.split("|")
+    action = parts[1].upper() if len(parts) > 1 else ""
+    if action == "START":
+        try:
+            mode = parts[2] if len(parts) > 2 else "sample"
+            seconds = float(parts[3]) if len(parts) > 3 else 30
+        except ValueError:
+            send_reply(conn, structured, "PROFILE_FAILED", "Invalid duration")
+            return
+        ok, message = profiler.start(mode, seconds)
+        send_reply(conn, structured, "PROFILE_STARTED" if ok else "PROFILE_FAILED", message)
+    elif action == "STOP":
+        result = profiler.stop()
+        if result is None:
+            send_reply(conn, structured, "PROFILE_FAILED", "No profile session")
+        else:
+            send_reply(conn, structured, "PROFILE_STOPPED", ", ".join(result["files"]), data=result)
+    elif action == "STATUS":
+        status = profiler.status()
+        send_reply(conn, structured, "PROFILE_STATUS", data=status, legacy=json.dumps(status))
+    else:
+        send_reply(conn, structured, "PROFILE_FAILED", f"Unknown profile action: {action}")
+
+# ---- Idempotency: replay the first result of a keyed SEND_TRANSACTION / AIR_DROP ----
+class IdempotencyTable:
+    """Successful replies by idempotency key: a TTL LRU written through to idempotency_keys"""
+    def __init__(self, ttl=IDEMPOTENCY_TTL, max_entries=IDEMPOTENCY_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # key -> (expires_at, fingerprint, reply)
+        self.pending = {}  # key -> threading.Event
+        self.stored = 0
+        self.replays = 0
+        self.conflicts = 0
+
+    def _remember(self, key, fingerprint, reply, created_at):
+        # caller holds self.lock
+        self.entries[key] = (created_at + self.ttl, fingerprint, reply)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def _cached(self, key):
+        # caller holds self.lock
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.time():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return entry
+
+    def _load(self, key):
+        if not mydb or not mycursor:
+            return None
+        mycursor.execute("SELECT fingerprint, reply, created_at FROM idempotency_keys WHERE idem_key = %s", (key,))
+        row = mycursor.fetchone()
+        if row is None or row[2] + self.ttl < time.time():
+            return None
+        return row[0], json.loads(row[1]), row[2]
+
+    def begin(self, key, fingerprint):
+        """("run", None) to execute the request, or ("replay", reply) / ("conflict", None)."""
+        while True:
+            with self.lock:
+                entry = self._cached(key)
+                if entry is None:
+                    waiter = self.pending.get(key)
+                    if waiter is None:
+                        self.pending[key] = threading.Event()
+                        break
+            if entry is not None:
+                return self._outcome(entry[1], entry[2], fingerprint)
+            waiter.wait(timeout=30)
+        try:
+            stored = self._load(key)
+        except Exception:
+            self.complete(key, fingerprint, None)
+            raise
+        if stored is None:
+            return "run", None
+        stored_fingerprint, reply, created_at = stored
+        with self.lock:
+            self._remember(key, stored_fingerprint, reply, created_at)
+            self.pending.pop(key).set()
+        return self._outcome(stored_fingerprint, reply, fingerprint)
+
+    def _outcome(self, stored_fingerprint, reply, fingerprint):
+        with self.lock:
+            if stored_fingerprint != fingerprint:
+                self.conflicts += 1
+                return "conflict", None
+            self.replays += 1
+        return "replay", reply
+
+    def complete(self, key, fingerprint, reply):
+        """Store reply (None: nothing to store) and release requests waiting on key."""
+        created_at = now_epoch()
+        try:
+            if reply is not None and mydb and mycursor:
+                # REPLACE: an expired row for this key may not have been purged yet
+                mycursor.execute("REPLACE INTO idempotency_keys (idem_key, fingerprint, reply, created_at) VALUES (%s, %s, %s, %s)",
+                                 (key, fingerprint, json.dumps(reply), created_at))
+                mydb.commit()
+                with self.lock:
+                    self.stored += 1
+                    purge = self.stored % IDEMPOTENCY_PURGE_EVERY == 0
+                if purge:
+                    mycursor.execute("DELETE FROM idempotency_keys WHERE created_at < %s", (created_at - self.ttl,))
+                    mydb.commit()
+        except Exception as e:
+            # the balance change already happened; still reply, replay from memory only
+            log.error("IDEMPOTENCY", "Could not store key %s: %s", key, e)
+        finally:
+            with self.lock:
+                if reply is not None:
+                    self._remember(key, fingerprint, reply, created_at)
+                waiter = self.pending.pop(key, None)
+            if waiter is not None:
+                waiter.set()
+
+    def stats(self):
+        with self.lock:
+            return {"entries": len(self.entries), "in_flight": len(self.pending), "stored": self.stored,
+                    "replays": self.replays, "conflicts": self.conflicts}
+
+idempotency = IdempotencyTable()
+
+def reply_once(conn, structured, key, request_text, execute):
+    """Send execute()'s reply, or replay the first successful reply sent for key"""
+    if not key:
+        send_reply(conn, structured, **execute())
+        return
+    if len(key) > IDEMPOTENCY_KEY_MAX:
+        send_reply(conn, structured, "IDEMPOTENCY_KEY_INVALID", f"Idempotency key longer than {IDEMPOTENCY_KEY_MAX} characters")
+        return
+    fingerprint = hashlib.sha256(request_text.encode(FORMAT)).hexdigest()
+    state, reply = idempotency.begin(key, fingerprint)
+    if state == "conflict":
+        send_reply(conn, structured, "IDEMPOTENCY_KEY_REUSED", "Idempotency key was already used for a different request")
+        return
+    if state == "replay":
+        data = dict(reply["data"] or {}, replayed=True)
+        send_reply(conn, structured, reply["status"], reply["message"], data=data, code=reply["code"])
+        return
+    reply = None
+    try:
+        reply = execute()
+        reply["code"] = reply.get("code") or STATUS_CODES.get(reply["status"], 500)
+    finally:
+        idempotency.complete(key, fingerprint, reply if reply is not None and reply["code"] < 400 else None)
+    send_reply(conn, structured, **reply)
 
 def shutdown_server():
     """Shutdown server when quit command is entered"""
@@ -626,16 +2798,353 @@ def shutdown_server():
             command = input()
             if command.strip().lower() == SHUTDOWN_MESSAGE:
                 server_running = False
-                print("[SHUTDOWN] Server is shutting down...")
+                log.info("SHUTDOWN", "Server is shutting down...")
                 break
         except:
             break
 
+def handle_message(conn, addr, msg, structured):
+    """Dispatch one framed message and send its reply; returns the reply mode, which PROTOCOL| may change"""
+    # Handle reply format negotiation
+    if msg.startswith("PROTOCOL|"):
+        mode = msg.split("PROTOCOL|", 1)[1].strip().upper()
+        if mode == "JSON":
+            structured = True
+            send_reply(conn, structured, "PROTOCOL_OK", "JSON", data={"protocol": "JSON"})
+        elif mode == "TEXT":
+            structured = False
+            send_reply(conn, structured, "PROTOCOL_OK", "TEXT")
+        else:
+            send_reply(conn, structured, "PROTOCOL_FAILED", f"Unknown protocol: {mode}")
+    
+    # Handle metrics requests
+    elif msg.startswith("METRICS"):
+        snapshot = metrics.snapshot()
+        send_reply(conn, structured, "METRICS", data=snapshot, legacy=json.dumps(snapshot))
+    
+    # Handle readiness checks
+    elif msg.startswith("STATUS"):
+        status = readiness.snapshot()
+        status["connections"] = len(connected_clients)
+        status["tip_block_id"] = blockchain[-1]['block_id'] if readiness.ready and len(blockchain) else None
+        send_reply(conn, structured, "STATUS", data=status, legacy=json.dumps(status))
+    
+    # Handle query statistics (QUERY_STATS, or QUERY_STATS|SLOW_MS|<ms> from localhost)
+    elif msg.startswith("QUERY_STATS"):
+        parts = msg.split("|")
+        if len(parts) >= 3 and parts[1].upper() == "SLOW_MS":
+            if addr[0] not in ADMIN_HOSTS:
+                send_reply(conn, structured, "FORBIDDEN", "Admin commands are only accepted from localhost")
+                return structured
+            try:
+                query_stats.slow_ms = float(parts[2])
+            except ValueError:
+                send_reply(conn, structured, "QUERY_STATS_FAILED", "Invalid threshold")
+                return structured
+        snapshot = query_stats.snapshot()
+        send_reply(conn, structured, "QUERY_STATS", data=snapshot, legacy=json.dumps(snapshot))
+    
+    # Handle balance inclusion proofs against the current state root
+    elif msg.startswith("STATE_PROOF|"):
+        if not readiness.ready:
+            send_reply(conn, structured, "NOT_READY", "State tree is still loading",
+                       data={"retry_after": readiness.retry_after()})
+            return structured
+        username = msg.split("|", 1)[1].strip()
+        proof = state_tree.proof(username)
+        if proof is None:
+            send_reply(conn, structured, "STATE_PROOF_FAILED", f"No account {username}")
+        else:
+            send_reply(conn, structured, "STATE_PROOF", data=proof, legacy=json.dumps(proof))
+    
+    # Handle block templates: tip, difficulty and the transaction root to mine on
+    elif msg.startswith("TEMPLATE|"):
+        if not readiness.ready:
+            send_reply(conn, structured, "NOT_READY", "Chain index is still loading",
+                       data={"retry_after": readiness.retry_after()})
+            return structured
+        template = block_template(msg.split("|", 1)[1].strip())
+        send_reply(conn, structured, "TEMPLATE", data=template, legacy=json.dumps(template))
+    
+    # Handle transaction inclusion proofs
+    elif msg.startswith("TX_PROOF|"):
+        transaction_id = msg.split("|", 1)[1].strip()
+        proof = transaction_proof(transaction_id)
+        if proof is None:
+            send_reply(conn, structured, "TX_PROOF_FAILED", f"Transaction {transaction_id} is not in a block")
+        else:
+            send_reply(conn, structured, "TX_PROOF", data=proof, legacy=json.dumps(proof))
+    
+    # Handle profiling admin commands
+    elif msg.startswith("PROFILE|"):
+        handle_profile_command(conn, addr, msg, structured)
+    
+    # Handle chain verification and block import admin commands
+    elif msg.startswith("CHAIN|"):
+        handle_chain_command(conn, addr, msg, structured)
+    
+    # Handle balance requests
+    elif "GET_BALANCE|" in msg:
+        try:
+            username = msg.split("GET_BALANCE|")[1].strip()
+            balance = get_user_balance(username)
+            data = {"balance": f"{balance:.8f}"}
+            send_reply(conn, structured, "BALANCE", data=data, legacy=json.dumps(data))
+            
+        except Exception as e:
+            send_reply(conn, structured, "BALANCE_ERROR", str(e))
+            log.error("ERROR", "BALANCE_ERROR: %s", e)
+    
+    # Handle transaction requests
+    elif "SEND_TRANSACTION|" in msg:
+        try:
+            payload = msg.split("SEND_TRANSACTION|", 1)[1]
+            parts = payload.split("|")
+            
+            if len(parts) >= 3:
+                from_user = parts[0]
+                to_user = parts[1]
+                amount = float(parts[2])
+                key = parts[3] if len(parts) > 3 else ""
+                
+                def execute():
+                    success, message, details = create_transaction(from_user, to_user, amount)
+                    if success:
+                        log.debug("CLIENT", "%s Transaction successful: %s -> %s : %s VNC", addr, from_user, to_user, amount)
+                        return {"status": "SEND_SUCCESS", "message": message, "data": details, "code": None}
+                    log.debug("CLIENT", "%s Transaction failed: %s", addr, message)
+                    code = 402 if "required" in details else None
+                    return {"status": "TRANSACTION_FAILED", "message": message, "data": details, "code": code}
+                
+                reply_once(conn, structured, key, f"SEND_TRANSACTION|{from_user}|{to_user}|{amount!r}", execute)
+            else:
+                send_reply(conn, structured, "TRANSACTION_FAILED", "Invalid transaction data")
+                
+        except Exception as e:
+            send_reply(conn, structured, "TRANSACTION_ERROR", str(e))
+            log.error("ERROR", "TRANSACTION_ERROR: %s", e)
+    
+    # Handle transaction history requests
+    elif "GET_HISTORY|" in msg:
+        try:
+            username = msg.split("GET_HISTORY|")[1].strip()
+            history = get_transaction_history(username)
+            send_reply(conn, structured, "HISTORY", data=history, legacy=json.dumps(history))
+            
+        except Exception as e:
+            send_reply(conn, structured, "HISTORY_ERROR", str(e))
+            log.error("ERROR", "HISTORY_ERROR: %s", e)
+    
+    # ---- NEW: Handle MINE command ----
+    elif "MINE|" in msg and not readiness.ready:
+        send_reply(conn, structured, "NOT_READY", "Chain index is still loading",
+                   data={"retry_after": readiness.retry_after()})
+    
+    elif "MINE|" in msg:
+        try:
+            payload = msg.split("MINE|", 1)[1]
+            parts = payload.split("|")
+            
+            if len(parts) >= 2:
+                username = parts[0]
+                seconds = float(parts[1])
+                
+                if not mydb or not mycursor:
+                    send_reply(conn, structured, "MINE_FAILED", "No database connection")
+                elif not 0 < seconds <= MINE_MAX_SECONDS:
+                    send_reply(conn, structured, "MINE_FAILED", f"Mining time must be between 0 and {MINE_MAX_SECONDS} seconds")
+                elif not username or "." in username or read_balance_version(username) is None:
+                    send_reply(conn, structured, "MINE_FAILED", f"Unknown miner: {username}")
+                else:
+                    report = mining_engine.run(username, seconds)
+                    send_reply(conn, structured, "MINE_SUCCESS",
+                               f"Mined {report['blocks_found']} blocks ({report['reward']} VNC) for {username} "
+                               f"at {report['hashrate']:.0f} H/s", data=report)
+            else:
+                send_reply(conn, structured, "MINE_FAILED", "Invalid mining data")
+                
+        except Exception as e:
+            send_reply(conn, structured, "MINE_ERROR", str(e))
+            log.error("ERROR", "MINE_ERROR: %s", e)
+    
+    # ---- NEW: Handle AIR_DROP command ----
+    elif "AIR_DROP|" in msg:
+        try:
+            payload = msg.split("AIR_DROP|", 1)[1]
+            parts = payload.split("|")
+            
+            if len(parts) >= 2:
+                to_user = parts[0]
+                amount = float(parts[1])
+                key = parts[2] if len(parts) > 2 else ""
+                
+                def execute():
+                    # Give coins directly (admin airdrop)
+                    if not credit_account(to_user, amount):
+                        return {"status": "AIR_DROP_FAILED", "message": f"Could not credit {to_user}", "data": None, "code": None}
+                    log.debug("AIRDROP", "%s VNC airdropped to %s", amount, to_user)
+                    return {"status": "AIR_DROP_SUCCESS", "message": f"{amount} VNC airdropped to {to_user}",
+                            "data": {"to": to_user, "amount": amount}, "code": None}
+                
+                reply_once(conn, structured, key, f"AIR_DROP|{to_user}|{amount!r}", execute)
+            else:
+                send_reply(conn, structured, "AIR_DROP_FAILED", "Invalid airdrop data")
+                
+        except Exception as e:
+            send_reply(conn, structured, "AIR_DROP_ERROR", str(e))
+            log.error("ERROR", "AIR_DROP_ERROR: %s", e)
+    
+    # Handle username availability check
+    elif "CHECK_USERNAME|" in msg:
+        try:
+            username = msg.split("CHECK_USERNAME|")[1].strip()
+            log.debug("CLIENT", "%s Checking username availability: %s", addr, username)
+            
+            if mydb and mycursor:
+                mycursor.execute("SELECT username FROM customer_info WHERE username = %s", (username,))
+                taken = mycursor.fetchone() is not None
+            else:
+                taken = os.path.exists(f"{username}_account.json")
+            
+            if taken:
+                send_reply(conn, structured, "USERNAME_TAKEN", f"{username} is already registered",
+                           data={"available": False})
+            else:
+                send_reply(conn, structured, "USERNAME_AVAILABLE", f"{username} is available",
+                           data={"available": True})
+            
+        except Exception as e:
+            send_reply(conn, structured, "USERNAME_CHECK_ERROR", str(e))
+            log.error("ERROR", "USERNAME_CHECK_ERROR: %s", e)
+    
+    # Handle user registration
+    elif "REGISTER|" in msg:
+        try:
+            payload = msg.split("REGISTER|", 1)[1]
+            parts = payload.split("|")
+
+            if len(parts) >= 3:
+                username = parts[0]
+                password = parts[1]
+
+                try:
+                    word_list = json.loads(parts[2])
+                except Exception as e:
+                    send_reply(conn, structured, "REGISTRATION_FAILED", "Invalid word list JSON")
+                    log.error("ERROR", "Registration word list parse: %s", e)
+                    return structured
+
+                hardware_info = None
+                if len(parts) >= 4 and parts[3].strip():
+                    try:
+                        hardware_info = json.loads(parts[3])
+                    except Exception as e:
+                        log.warning("REGISTER PARSE", "hardware JSON error: %s", e)
+
+                success, message = Add_User(
+                    username, password, None, None, None, word_list, hardware_info=hardware_info
+                )
+
+                if success:
+                    send_reply(conn, structured, "REGISTRATION_SUCCESS", message)
+                    log.debug("CLIENT", "%s User %s registered successfully", addr, username)
+                else:
+                    code = 409 if message == "Username already exists" else None
+                    send_reply(conn, structured, "REGISTRATION_FAILED", message, code=code)
+                    log.debug("CLIENT", "%s Registration failed for %s: %s", addr, username, message)
+            else:
+                send_reply(conn, structured, "REGISTRATION_FAILED", "Invalid registration data")
+
+        except Exception as e:
+            send_reply(conn, structured, "REGISTRATION_ERROR", str(e))
+            log.error("ERROR", "Registration error: %s", e)
+    
+    # Handle user login
+    elif "LOGIN|" in msg:
+        try:
+            payload = msg.split("LOGIN|", 1)[1]
+            parts = payload.split("|")
+
+            if len(parts) >= 2:
+                username = parts[0]
+                password = parts[1]
+
+                word_list = None
+                hardware_info = None
+
+                if len(parts) >= 3 and parts[2].strip():
+                    try:
+                        word_list = json.loads(parts[2])
+                    except Exception as e:
+                        log.warning("LOGIN PARSE", "word_list JSON error: %s", e)
+
+                if len(parts) >= 4 and parts[3].strip():
+                    try:
+                        hardware_info = json.loads(parts[3])
+                    except Exception as e:
+                        log.warning("LOGIN PARSE", "hardware JSON error: %s", e)
+
+                success, message = verify_user_login(username, password, word_list, hardware_info)
+
+                if success:
+                    send_reply(conn, structured, "LOGIN_SUCCESS", message)
+                    log.debug("CLIENT", "%s User %s logged in successfully", addr, username)
+                else:
+                    code = 403 if message == "HARDWARE_MISMATCH" else None
+                    send_reply(conn, structured, "LOGIN_FAILED", message, code=code)
+                    log.debug("CLIENT", "%s Login failed for %s: %s", addr, username, message)
+            else:
+                send_reply(conn, structured, "LOGIN_FAILED", "Invalid login data")
+
+        except Exception as e:
+            send_reply(conn, structured, "LOGIN_ERROR", str(e))
+            log.error("ERROR", "LOGIN_ERROR: %s", e)
+    
+    # Handle hardware ID messages
+    elif f"{ID_CODE}CPU ID:" in msg:
+        cpu_id = msg.split('CPU ID: ')[1]
+        log.debug("CLIENT", "%s CPU ID RECEIVED: %s", addr, cpu_id)
+        send_reply(conn, structured, "CPU INFO RECEIVED", legacy="CPU INFO RECEIVED")
+    
+    elif f"{ID_CODE}Disk Serial Number:" in msg:
+        disk_serial = msg.split('Disk Serial Number: ')[1]
+        log.debug("CLIENT", "%s DISK SERIAL NUMBER RECEIVED: %s", addr, disk_serial)
+        send_reply(conn, structured, "DISK INFO RECEIVED", legacy="DISK INFO RECEIVED")
+    
+    elif f"{ID_CODE}RAM ID:" in msg:
+        ram_id = msg.split('RAM ID: ')[1]
+        log.debug("CLIENT", "%s RAM ID RECEIVED: %s", addr, ram_id)
+        send_reply(conn, structured, "RAM INFO RECEIVED", legacy="RAM INFO RECEIVED")
+    
+    # Handle mined blocks
+    elif "|||" in msg and not readiness.ready:
+        retry_after = readiness.retry_after()
+        detail = f"Chain index is {readiness.phase}; retry in {retry_after}s"
+        send_reply(conn, structured, "NOT_READY", detail, data={"retry_after": retry_after},
+                   legacy=f"BLOCK REJECTED: {detail}")
+    
+    elif "|||" in msg:
+        try:
+            block_data, block_hash = msg.split("|||")
+            status, detail = submit_block(block_data, block_hash)
+            send_reply(conn, structured, status, detail)
+            log.debug("MINING", "%s: %s", status, detail)
+            
+        except Exception as e:
+            send_reply(conn, structured, "BLOCK PROCESSING ERROR", str(e))
+            log.error("ERROR", "BLOCK PROCESSING ERROR: %s", e)
+    
+    else:
+        send_reply(conn, structured, "UNKNOWN_COMMAND", msg, legacy=f"MSG received: {msg}")
+
+    return structured
+
 def handle_client(conn, addr):
     """Handle individual client connections"""
-    print(f"[NEW CONNECTION] {addr} connected.")
+    log.debug("NEW CONNECTION", "%s connected.", addr)
     connected_clients.append(conn)
     connected = True
+    structured = False  # switched on by PROTOCOL|JSON
     
     try:
         while connected and server_running:
@@ -647,7 +3156,7 @@ def handle_client(conn, addr):
             try:
                 msg_length = int(msg_length.strip())
             except ValueError:
-                print(f"[PROTOCOL ERROR] {addr} Invalid header: {msg_length[:20]}...")
+                log.warning("PROTOCOL ERROR", "%s Invalid header: %.20s...", addr, msg_length)
                 break
             
             msg = conn.recv(msg_length).decode(FORMAT)
@@ -656,288 +3165,51 @@ def handle_client(conn, addr):
                 connected = False
                 break
             
-            print(f"[{addr}] {msg}")
-            
-            # Handle balance requests
-            if "GET_BALANCE|" in msg:
-                try:
-                    username = msg.split("GET_BALANCE|")[1].strip()
-                    balance = get_user_balance(username)
-                    response = json.dumps({"balance": f"{balance:.8f}"})
-                    send_response(conn, response)
-                    
-                except Exception as e:
-                    error_msg = f"BALANCE_ERROR: {e}"
-                    send_response(conn, error_msg)
-                    print(f"[ERROR] {error_msg}")
-            
-            # Handle transaction requests
-            elif "SEND_TRANSACTION|" in msg:
-                try:
-                    payload = msg.split("SEND_TRANSACTION|", 1)[1]
-                    parts = payload.split("|")
-                    
-                    if len(parts) >= 3:
-                        from_user = parts[0]
-                        to_user = parts[1]
-                        amount = float(parts[2])
-                        
-                        success, message = create_transaction(from_user, to_user, amount)
-                        
-                        if success:
-                            response = f"SEND_SUCCESS: {message}"
-                            print(f"[{addr}] Transaction successful: {from_user} -> {to_user} : {amount} VNC")
-                        else:
-                            response = f"TRANSACTION_FAILED: {message}"
-                            print(f"[{addr}] Transaction failed: {message}")
-                        
-                        send_response(conn, response)
-                    else:
-                        send_response(conn, "TRANSACTION_FAILED: Invalid transaction data")
-                        
-                except Exception as e:
-                    error_msg = f"TRANSACTION_ERROR: {e}"
-                    send_response(conn, error_msg)
-                    print(f"[ERROR] {error_msg}")
-            
-            # Handle transaction history requests
-            elif "GET_HISTORY|" in msg:
-                try:
-                    username = msg.split("GET_HISTORY|")[1].strip()
-                    history = get_transaction_history(username)
-                    response = json.dumps(history)
-                    send_response(conn, response)
-                    
-                except Exception as e:
-                    error_msg = f"HISTORY_ERROR: {e}"
-                    send_response(conn, error_msg)
-                    print(f"[ERROR] {error_msg}")
-            
-            # ---- NEW: Handle MINE command ----
-            elif "MINE|" in msg:
-                try:
-                    payload = msg.split("MINE|", 1)[1]
-                    parts = payload.split("|")
-                    
-                    if len(parts) >= 2:
-                        username = parts[0]
-                        seconds = int(parts[1])
-                        
-                        # Simulate instant mining (give reward immediately)
-                        # In production, this would trigger actual mining
-                        balance = get_user_balance(username)
-                        new_balance = balance + BLOCK_REWARD
-                        update_user_balance(username, new_balance)
-                        
-                        response = f"MINE_SUCCESS: Mined {BLOCK_REWARD} VNC for {username}"
-                        print(f"[MINING] {username} mined {BLOCK_REWARD} VNC (simulated)")
-                        send_response(conn, response)
-                    else:
-                        send_response(conn, "MINE_FAILED: Invalid mining data")
-                        
-                except Exception as e:
-                    error_msg = f"MINE_ERROR: {e}"
-                    send_response(conn, error_msg)
-                    print(f"[ERROR] {error_msg}")
-            
-            # ---- NEW: Handle AIR_DROP command ----
-            elif "AIR_DROP|" in msg:
-                try:
-                    payload = msg.split("AIR_DROP|", 1)[1]
-                    parts = payload.split("|")
-                    
-                    if len(parts) >= 2:
-                        to_user = parts[0]
-                        amount = float(parts[1])
-                        
-                        # Give coins directly (admin airdrop)
-                        balance = get_user_balance(to_user)
-                        new_balance = balance + amount
-                        update_user_balance(to_user, new_balance)
-                        
-                        response = f"AIR_DROP_SUCCESS: {amount} VNC airdropped to {to_user}"
-                        print(f"[AIRDROP] {amount} VNC airdropped to {to_user}")
-                        send_response(conn, response)
-                    else:
-                        send_response(conn, "AIR_DROP_FAILED: Invalid airdrop data")
-                        
-                except Exception as e:
-                    error_msg = f"AIR_DROP_ERROR: {e}"
-                    send_response(conn, error_msg)
-                    print(f"[ERROR] {error_msg}")
-            
-            # Handle username availability check
-            elif "CHECK_USERNAME|" in msg:
-                try:
-                    username = msg.split("CHECK_USERNAME|")[1].strip()
-                    print(f"[{addr}] Checking username availability: {username}")
-                    
-                    if mydb and mycursor:
-                        mycursor.execute("SELECT username FROM customer_info WHERE username = %s", (username,))
-                        result = mycursor.fetchone()
-                        if result:
-                            response = f"USERNAME_TAKEN: {username} is already registered"
-                        else:
-                            response = f"USERNAME_AVAILABLE: {username} is available"
-                    else:
-                        if os.path.exists(f"{username}_account.json"):
-                            response = f"USERNAME_TAKEN: {username} is already registered"
-                        else:
-                            response = f"USERNAME_AVAILABLE: {username} is available"
-                    
-                    send_response(conn, response)
-                    
-                except Exception as e:
-                    error_msg = f"USERNAME_CHECK_ERROR: {e}"
-                    send_response(conn, error_msg)
-                    print(f"[ERROR] {error_msg}")
-            
-            # Handle user registration
-            elif "REGISTER|" in msg:
-                try:
-                    payload = msg.split("REGISTER|", 1)[1]
-                    parts = payload.split("|")
-
-                    if len(parts) >= 3:
-                        username = parts[0]
-                        password = parts[1]
-
-                        try:
-                            word_list = json.loads(parts[2])
-                        except Exception as e:
-                            send_response(conn, "REGISTRATION_FAILED: Invalid word list JSON")
-                            print(f"[ERROR] Registration word list parse: {e}")
-                            continue
-
-                        hardware_info = None
-                        if len(parts) >= 4 and parts[3].strip():
-                            try:
-                                hardware_info = json.loads(parts[3])
-                            except Exception as e:
-                                print(f"[REGISTER PARSE] hardware JSON error: {e}")
-
-                        success, message = Add_User(
-                            username, password, None, None, None, word_list, hardware_info=hardware_info
-                        )
-
-                        if success:
-                            response = f"REGISTRATION_SUCCESS: {message}"
-                            print(f"[{addr}] User {username} registered successfully")
-                        else:
-                            response = f"REGISTRATION_FAILED: {message}"
-                            print(f"[{addr}] Registration failed for {username}: {message}")
-
-                        send_response(conn, response)
-                    else:
-                        send_response(conn, "REGISTRATION_FAILED: Invalid registration data")
-
-                except Exception as e:
-                    error_msg = f"REGISTRATION_ERROR: {e}"
-                    send_response(conn, error_msg)
-                    print(f"[ERROR] Registration error: {e}")
-            
-            # Handle user login
-            elif "LOGIN|" in msg:
-                try:
-                    payload = msg.split("LOGIN|", 1)[1]
-                    parts = payload.split("|")
-
-                    if len(parts) >= 2:
-                        username = parts[0]
-                        password = parts[1]
-
-                        word_list = None
-                        hardware_info = None
-
-                        if len(parts) >= 3 and parts[2].strip():
-                            try:
-                                word_list = json.loads(parts[2])
-                            except Exception as e:
-                                print(f"[LOGIN PARSE] word_list JSON error: {e}")
-
-                        if len(parts) >= 4 and parts[3].strip():
-                            try:
-                                hardware_info = json.loads(parts[3])
-                            except Exception as e:
-                                print(f"[LOGIN PARSE] hardware JSON error: {e}")
-
-                        success, message = verify_user_login(username, password, word_list, hardware_info)
-
-                        if success:
-                            response = f"LOGIN_SUCCESS: {message}"
-                            print(f"[{addr}] User {username} logged in successfully")
-                        else:
-                            response = f"LOGIN_FAILED: {message}"
-                            print(f"[{addr}] Login failed for {username}: {message}")
-
-                        send_response(conn, response)
-                    else:
-                        send_response(conn, "LOGIN_FAILED: Invalid login data")
-
-                except Exception as e:
-                    error_msg = f"LOGIN_ERROR: {e}"
-                    send_response(conn, error_msg)
-                    print(f"[ERROR] {error_msg}")
-            
-            # Handle hardware ID messages
-            elif f"{ID_CODE}CPU ID:" in msg:
-                cpu_id = msg.split('CPU ID: ')[1]
-                print(f"[{addr}] CPU ID RECEIVED: {cpu_id}")
-                send_response(conn, "CPU INFO RECEIVED")
-            
-            elif f"{ID_CODE}Disk Serial Number:" in msg:
-                disk_serial = msg.split('Disk Serial Number: ')[1]
-                print(f"[{addr}] DISK SERIAL NUMBER RECEIVED: {disk_serial}")
-                send_response(conn, "DISK INFO RECEIVED")
-            
-            elif f"{ID_CODE}RAM ID:" in msg:
-                ram_id = msg.split('RAM ID: ')[1]
-                print(f"[{addr}] RAM ID RECEIVED: {ram_id}")
-                send_response(conn, "RAM INFO RECEIVED")
-            
-            # Handle mined blocks
-            elif "|||" in msg:
-                try:
-                    block_data, block_hash = msg.split("|||")
-                    
-                    miner_id = block_data.split("MinerPublicID: ")[1].split(".")[0]
-                    
-                    is_valid, validation_msg = validate_block(block_data, block_hash)
-                    
-                    if is_valid:
-                        if store_block(block_data, block_hash, miner_id):
-                            response = f"BLOCK ACCEPTED: {validation_msg}"
-                            broadcast_to_clients(f"NEW_BLOCK|||{msg}")
-                        else:
-                            response = "BLOCK REJECTED: Storage failed"
-                    else:
-                        response = f"BLOCK REJECTED: {validation_msg}"
-                    
-                    send_response(conn, response)
-                    print(f"[MINING] {response}")
-                    
-                except Exception as e:
-                    error_msg = f"BLOCK PROCESSING ERROR: {e}"
-                    send_response(conn, error_msg)
-                    print(f"[ERROR] {error_msg}")
+            if log.enabled(DEBUG):
+                log.debug("CLIENT", "%s %s", addr, redact_frame(msg), every=LOG_SAMPLE_EVERY)
             
+            command = command_name(msg)
+            metrics.begin(command)
+            started = time.perf_counter()
+            try:
+                session = profiler.session
+                if session is not None and session.profiles_requests and command != "PROFILE":
+                    structured = session.run(handle_message, conn, addr, msg, structured)
+                else:
+                    structured = handle_message(conn, addr, msg, structured)
+            finally:
+                metrics.end(command, time.perf_counter() - started)
+            if structured:
+                request_clients.add(conn)
             else:
-                send_response(conn, f"MSG received: {msg}")
+                request_clients.discard(conn)
                     
     except Exception as e:
-        print(f"[CONNECTION ERROR] {addr}: {e}")
+        log.warning("CONNECTION ERROR", "%s: %s", addr, e)
     finally:
         if conn in connected_clients:
             connected_clients.remove(conn)
+        request_clients.discard(conn)
         conn.close()
-        print(f"[DISCONNECTED] {addr} disconnected.")
+        release_database()
+        log.debug("DISCONNECTED", "%s disconnected.", addr)
 
 def start():
     """Start the server"""
-    print("[STARTING] Server is starting...")
+    global server, server_running
+    log.info("STARTING", "Server is starting...")
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    try:
+        server.bind(ADDR)
+    except OSError as e:
+        log.error("SERVER ERROR", "Cannot bind %s:%s: %s", SERVER, PORT, e)
+        server.close()
+        server_running = False
+        return
     server.listen()
-    print(f"[LISTENING] Server is listening on {SERVER}:{PORT}")
-    print(f"[INFO] Type '{SHUTDOWN_MESSAGE}' and press Enter to stop the server")
+    log.info("LISTENING", "Server is listening on %s:%s", SERVER, PORT)
+    log.info("INFO", "Type '%s' and press Enter to stop the server", SHUTDOWN_MESSAGE)
     
     while server_running:
         try:
@@ -946,39 +3218,45 @@ def start():
             thread = threading.Thread(target=handle_client, args=(conn, addr))
             thread.daemon = True
             thread.start()
-            print(f"[ACTIVE CONNECTIONS] {threading.active_count() - 2}")
+            log.debug("ACTIVE CONNECTIONS", "%s", threading.active_count() - 2)
         except socket.timeout:
             continue
         except Exception as e:
             if server_running:
-                print(f"[SERVER ERROR] {e}")
+                log.error("SERVER ERROR", "%s", e)
             break
+    server.close()
 
 def main():
     """Main function to initialize and start server"""
     global server_running
     
-    print("=== VANILLA COIN BLOCKCHAIN SERVER v3.0 ===")
-    print("Starting VanillaCoin blockchain server with transaction support...")
+    log.info("MAIN", "=== VANILLA COIN BLOCKCHAIN SERVER v3.0 ===")
+    log.info("MAIN", "Starting VanillaCoin blockchain server with transaction support...")
     
-    print("\nSetting up database...")
+    log.info("MAIN", "Setting up database...")
     if not setup_database():
-        print("Database setup failed! Server will run with limited functionality.")
-        print("Blocks will not be persisted and user accounts will not work.")
-        print("Please fix your MySQL connection and restart the server.")
+        log.warning("MAIN", "Database setup failed! Server will run with limited functionality.")
+        log.warning("MAIN", "Blocks will not be persisted and user accounts will not work.")
+        log.warning("MAIN", "Please fix your MySQL connection and restart the server.")
+        log.flush()
         
         response = input("\nDo you want to continue anyway? (y/n): ").strip().lower()
         if response != 'y' and response != 'yes':
-            print("Exiting server...")
+            log.info("MAIN", "Exiting server...")
             return
     
-    print("\nVerifying hash functions...")
+    log.info("MAIN", "Verifying hash functions...")
     if not verifyHash():
-        print("Hash verification failed! Exiting.")
+        log.error("MAIN", "Hash verification failed! Exiting.")
         return
     
-    print("\nLoading blockchain...")
-    load_blockchain()
+    log.info("MAIN", "Starting %s mining workers...", mining_engine.workers)
+    mining_engine.start()
+    
+    if not WARMUP:
+        log.info("MAIN", "Loading blockchain...")
+        load_blockchain()
     
     server_thread = threading.Thread(target=start)
     server_thread.daemon = True
@@ -989,22 +3267,53 @@ def main():
     shutdown_thread.start()
     
     try:
+        if WARMUP:
+            # Account commands are served meanwhile; block submissions get NOT_READY
+            log.info("MAIN", "Loading blockchain while accepting connections (warm-up)...")
+            load_blockchain()
         while server_running:
             time.sleep(1)
     except KeyboardInterrupt:
-        print("\n[SHUTDOWN] Server interrupted by user")
+        log.info("SHUTDOWN", "Server interrupted by user")
         server_running = False
     finally:
+        save_checkpoint()
         if mydb:
             try:
                 mycursor.close()
                 mydb.close()
-                print("[DATABASE] Database connection closed")
+                log.info("DATABASE", "Database connection closed")
             except:
                 pass
     
-    print("[SHUTDOWN] Server stopped")
-    print("Goodbye!")
+    log.info("SHUTDOWN", "Server stopped")
+    log.info("MAIN", "Goodbye!")
+    log.close()
+
+def verify_main(argv):
+    """python server.py verify [--resume] [--workers N]: check the stored chain without serving."""
+    parser = argparse.ArgumentParser(prog="server.py verify", description="Verify the stored block chain")
+    parser.add_argument("--resume", action="store_true", help=f"continue an interrupted run from {VERIFY_PROGRESS_FILE}")
+    parser.add_argument("--workers", type=int, default=None, help="verification processes (default: one per core)")
+    args = parser.parse_args(argv)
+    if not setup_database():
+        log.error("VERIFY", "Database setup failed")
+        log.close()
+        return 2
+    try:
+        summary = verify_stored_blocks(args.workers, resume=args.resume)
+    except KeyboardInterrupt:
+        # Before the first batch: nothing new to save
+        log.warning("VERIFY", "Interrupted")
+        log.close()
+        return 3
+    log.close()
+    print(json.dumps(summary, indent=2))
+    if not summary["complete"]:
+        return 3
+    return 1 if summary["error_count"] else 0
 
 if __name__ == "__main__":
+    if sys.argv[1:2] == ["verify"]:
+        sys.exit(verify_main(sys.argv[2:]))
     main()
\ No newline at end of file
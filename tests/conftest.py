@@ -0,0 +1,85 @@
+"""
+Fixtures for server.py on bench_server's sqlite stand-in for MySQL.
+
+node resets the server's module state (chain index, state tree, template
+and idempotency caches, difficulty) over a fresh in-memory database, and
+keeps checkpoint/progress files in the test's tmp_path.
+"""
+import json
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bench_server  # noqa: E402
+import chain_verify  # noqa: E402
+import hashing  # noqa: E402
+import server  # noqa: E402
+
+ADMIN_ADDR = ("127.0.0.1", 0)
+
+class FakeConn:
+    """Collects the structured replies handle_message sends."""
+    def __init__(self):
+        self.replies = []
+
+    def sendall(self, data):
+        self.replies.append(json.loads(data[server.HEADER:].decode(server.FORMAT)))
+
+@pytest.fixture
+def node(monkeypatch, tmp_path):
+    monkeypatch.setattr(server, "CHECKPOINT_FILE", str(tmp_path / "chain_checkpoint.bin"))
+    monkeypatch.setattr(server, "VERIFY_PROGRESS_FILE", str(tmp_path / "chain_verify.progress"))
+    monkeypatch.setattr(server, "state_tree", server.StateTree())
+    monkeypatch.setattr(server, "tx_templates", server.TxTemplates())
+    monkeypatch.setattr(server, "idempotency", server.IdempotencyTable())
+    monkeypatch.setattr(server, "_shards_ready", set())
+    monkeypatch.setattr(server, "current_difficulty", server.INITIAL_DIFFICULTY)
+    monkeypatch.setattr(server, "difficulty_adjusted_at", None)
+    server.use_database(bench_server.StandInDatabase())
+    server.load_blockchain()
+    return server
+
+@pytest.fixture
+def send(node):
+    """send(msg) -> the structured reply handle_message gives a localhost connection."""
+    def send(msg):
+        conn = FakeConn()
+        node.handle_message(conn, ADMIN_ADDR, msg, True)
+        return conn.replies[-1]
+    return send
+
+def add_users(*names, balance=0):
+    for name in names:
+        ok, message = server.Add_User(name, "pw", "cpu", "ram", "board", [])
+        assert ok, message
+        if balance:
+            assert server.credit_account(name, balance)
+
+def mine(block_id, previous_hash, miner_id, transactions=None, difficulty=None, seed=0):
+    """(block_data, block_hash) meeting difficulty (default: the server's current one)."""
+    difficulty = server.current_difficulty if difficulty is None else difficulty
+    transactions = transactions or f"{miner_id}+{server.BLOCK_REWARD}"
+    rng = random.Random(seed or block_id)
+    while True:
+        block_data = chain_verify.block_text(block_id, rng.getrandbits(62), previous_hash, miner_id, transactions)
+        block_hash = hashing.digest(block_data.encode(server.FORMAT)).hex()
+        if block_hash.startswith("0" * difficulty):
+            return block_data, block_hash
+
+def mine_next(miner_id, transactions=None):
+    """Mine and store a block on the current tip; returns its block_id."""
+    tip = server.blockchain[-1] if len(server.blockchain) else None
+    block_id = tip["block_id"] + 1 if tip else 1
+    block_data, block_hash = mine(block_id, tip["block_hash"] if tip else "0" * 64, miner_id, transactions,
+                                  server.get_current_difficulty())
+    status, detail = server.submit_block(block_data, block_hash)
+    assert status == "BLOCK ACCEPTED", detail
+    return block_id
+
+def total_balance():
+    server.mycursor.execute("SELECT username FROM customer_info")
+    return sum(server.get_user_balance(name) for (name,) in server.mycursor.fetchall())
@@ -0,0 +1,89 @@
+import pytest
+
+from conftest import add_users, mine, mine_next
+
+def chain(start_id, previous_hash, miners, stamps, difficulties=None):
+    """(block_data, block_hash, timestamp) records linked onto previous_hash."""
+    records = []
+    for i, (miner_id, stamp) in enumerate(zip(miners, stamps)):
+        difficulty = difficulties[i] if difficulties else None
+        block_data, block_hash = mine(start_id + i, previous_hash, miner_id, difficulty=difficulty)
+        records.append((block_data, block_hash, stamp))
+        previous_hash = block_hash
+    return records
+
+def exactly(block_id, previous_hash, miner_id, difficulty):
+    """A block whose hash has exactly difficulty leading zeros."""
+    seed = 1
+    while True:
+        block_data, block_hash = mine(block_id, previous_hash, miner_id, difficulty=difficulty, seed=seed)
+        if block_hash[difficulty] != "0":
+            return block_data, block_hash
+        seed += 1
+
+@pytest.fixture
+def miners(node):
+    add_users("alice", "bob")
+    return node
+
+def test_spaced_blocks_are_stored_with_state_roots(miners):
+    now = miners.now_epoch()
+    names = ["alice", "bob"] * 6
+    ok, message, details = miners.import_blocks(chain(1, "0" * 64, names, [now - 15 * (12 - i) for i in range(12)]))
+    assert ok, (message, details)
+    assert len(miners.blockchain) == 12 and miners.blockchain[-1]["block_id"] == 12
+    assert miners.get_user_balance("alice") == miners.get_user_balance("bob") == 6 * miners.BLOCK_REWARD
+    miners.mycursor.execute("SELECT state_root FROM blocks ORDER BY block_id")
+    roots = [root for (root,) in miners.mycursor.fetchall()]
+    assert None not in roots and len(set(roots)) == 12
+    assert roots[-1] == miners.state_tree.root_hex()
+    # Mining continues on the imported tip at the replayed difficulty
+    assert mine_next("alice") == 13
+
+def test_too_low_difficulty_is_rejected(miners):
+    now = miners.now_epoch()
+    # Ten blocks a second apart: the rule raises the difficulty for the eleventh
+    records = chain(1, "0" * 64, ["alice"] * 10, [now - 20 + i for i in range(10)])
+    block_data, block_hash = exactly(11, records[-1][1], "alice", miners.INITIAL_DIFFICULTY)
+    ok, _, details = miners.import_blocks(records + [(block_data, block_hash, now - 5)])
+    assert not ok
+    assert details["errors"] == [{"block_id": 11, "error": "Hash doesn't meet difficulty requirement: 000"}]
+    assert len(miners.blockchain) == 0 and miners.get_user_balance("alice") == 0
+
+def test_transaction_roots_are_refused(miners):
+    now = miners.now_epoch()
+    block_data, block_hash = mine(1, "0" * 64, "alice", f"alice+{miners.BLOCK_REWARD}, merkle={'ab' * 32}")
+    ok, _, details = miners.import_blocks([(block_data, block_hash, now)])
+    assert not ok and details["errors"][0]["error"] == "Blocks with transaction roots cannot be imported"
+
+@pytest.mark.parametrize("offsets", [(-30, -40), (-30, 3600)])
+def test_backward_or_future_timestamps_are_rejected(miners, offsets):
+    now = miners.now_epoch()
+    ok, _, details = miners.import_blocks(chain(1, "0" * 64, ["alice", "bob"], [now + offset for offset in offsets]))
+    assert not ok and details["errors"][0]["block_id"] == 2
+    assert "out of order or in the future" in details["errors"][0]["error"]
+
+def test_unknown_miner_rolls_back(miners):
+    now = miners.now_epoch()
+    root = miners.state_tree.root_hex()
+    ok, message, _ = miners.import_blocks(chain(1, "0" * 64, ["alice", "ghost"], [now - 30, now - 15]))
+    assert not ok and "unknown miner ghost" in message
+    assert miners.get_user_balance("alice") == 0
+    assert miners.state_tree.root_hex() == root
+    miners.mycursor.execute("SELECT COUNT(*) FROM blocks")
+    assert miners.mycursor.fetchone()[0] == 0 and len(miners.blockchain) == 0
+
+def test_import_must_link_to_tip(miners):
+    mine_next("alice")
+    now = miners.now_epoch()
+    ok, message, _ = miners.import_blocks(chain(2, "f" * 64, ["bob"], [now]))
+    assert not ok and message == "1 blocks do not link"
+
+def test_chain_import_command_reads_block_file(miners, send, tmp_path):
+    now = miners.now_epoch()
+    path = tmp_path / "blocks.txt"
+    path.write_text("".join(f"{data}|||{block_hash}|||{stamp}\n" for data, block_hash, stamp in
+                            chain(1, "0" * 64, ["bob"] * 3, [now - 45, now - 30, now - 15])))
+    reply = send(f"CHAIN|IMPORT|{path}")
+    assert reply["status"] == "CHAIN_IMPORTED" and reply["data"]["count"] == 3
+    assert miners.get_user_balance("bob") == 3 * miners.BLOCK_REWARD
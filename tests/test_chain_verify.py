@@ -0,0 +1,70 @@
+import os
+
+import pytest
+
+from conftest import add_users, mine_next
+
+@pytest.fixture
+def stored(node, monkeypatch):
+    monkeypatch.setattr(node, "VERIFY_BATCH", 4)
+    add_users("alice")
+    for _ in range(10):
+        mine_next("alice")
+    return node
+
+def interrupt_on(monkeypatch, node, call):
+    real_check = node.chain_verify.check_blocks
+    calls = []
+
+    def check_blocks(*args, **kwargs):
+        calls.append(1)
+        if len(calls) == call:
+            raise KeyboardInterrupt
+        return real_check(*args, **kwargs)
+    monkeypatch.setattr(node.chain_verify, "check_blocks", check_blocks)
+
+def test_clean_chain_verifies(stored):
+    summary = stored.verify_stored_blocks(workers=1)
+    assert summary["complete"] and summary["checked"] == 10 and summary["error_count"] == 0
+    assert summary["first_error"] is None
+
+def test_tampered_block_is_first_error(stored):
+    stored.mycursor.execute("UPDATE blocks SET nonce = %s WHERE block_id = 6", ("12345",))
+    stored.mydb.commit()
+    summary = stored.verify_stored_blocks(workers=1)
+    assert summary["error_count"] == 1 and summary["first_error"]["block_id"] == 6
+
+def test_interrupted_run_resumes_after_last_batch(stored, monkeypatch):
+    stored.mycursor.execute("UPDATE blocks SET nonce = %s WHERE block_id = 2", ("12345",))
+    stored.mydb.commit()
+    with monkeypatch.context() as patch:
+        interrupt_on(patch, stored, 3)
+        summary = stored.verify_stored_blocks(workers=1)
+    assert not summary["complete"]
+    assert summary["checked"] == 8 and summary["last_block_id"] == 8 and summary["error_count"] == 1
+    assert os.path.exists(stored.VERIFY_PROGRESS_FILE)
+
+    summary = stored.verify_stored_blocks(workers=1, resume=True)
+    assert summary["complete"] and summary["resumed_from"] == 8
+    assert summary["checked"] == 10 and summary["first_error"]["block_id"] == 2
+    assert not os.path.exists(stored.VERIFY_PROGRESS_FILE)
+
+def test_resume_without_progress_starts_over(stored):
+    summary = stored.verify_stored_blocks(workers=1, resume=True)
+    assert summary["complete"] and summary["resumed_from"] is None and summary["checked"] == 10
+
+def test_resume_ignores_progress_for_a_replaced_block(stored, monkeypatch):
+    with monkeypatch.context() as patch:
+        interrupt_on(patch, stored, 2)
+        stored.verify_stored_blocks(workers=1)
+    stored.mycursor.execute("UPDATE blocks SET block_hash = %s WHERE block_id = 4", ("f" * 64,))
+    stored.mydb.commit()
+    summary = stored.verify_stored_blocks(workers=1, resume=True)
+    assert summary["resumed_from"] is None and summary["checked"] == 10
+
+def test_cli_returns_3_on_ctrl_c(stored, monkeypatch):
+    monkeypatch.setattr(stored, "setup_database", lambda: True)
+    monkeypatch.setattr(stored.log, "close", lambda: None)
+    interrupt_on(monkeypatch, stored, 2)
+    assert stored.verify_main(["--workers", "1"]) == 3
+    assert stored.load_verify_progress()["block_id"] == 4
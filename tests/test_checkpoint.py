@@ -0,0 +1,46 @@
+from conftest import add_users, mine_next
+
+def index_rows(index):
+    return [index[i] for i in range(len(index))]
+
+def test_chain_index_round_trip(node, tmp_path):
+    index = node.ChainIndex()
+    for block_id in range(1, 6):
+        index.append(block_id, f"{block_id:064x}", 1_700_000_000 + block_id, 2 + block_id % 3)
+    header = index.save(str(tmp_path / "index.bin"))
+    assert header["count"] == 5 and header["tip_block_id"] == 5
+
+    loaded, loaded_header = node.ChainIndex.load(str(tmp_path / "index.bin"))
+    assert loaded_header == header
+    assert index_rows(loaded) == index_rows(index)
+
+def test_truncated_checkpoint_is_ignored(node, tmp_path):
+    index = node.ChainIndex()
+    index.append(1, "ab" * 32, 1_700_000_000, 2)
+    path = tmp_path / "index.bin"
+    index.save(str(path))
+    path.write_bytes(path.read_bytes()[:-5])
+    assert node.ChainIndex.load(str(path)) is None
+
+def test_reload_replays_blocks_after_checkpoint(node):
+    add_users("miner")
+    for _ in range(3):
+        mine_next("miner")
+    node.save_checkpoint()
+    for _ in range(2):
+        mine_next("miner")
+    before = index_rows(node.blockchain)
+
+    node.load_blockchain()
+    assert node.readiness.ready
+    assert index_rows(node.blockchain) == before
+
+def test_checkpoint_not_matching_database_is_rejected(node):
+    add_users("miner")
+    block_id = mine_next("miner")
+    node.save_checkpoint()
+    assert node.load_checkpoint() is not None
+
+    node.mycursor.execute("UPDATE blocks SET block_hash = %s WHERE block_id = %s", ("00" * 32, block_id))
+    node.mydb.commit()
+    assert node.load_checkpoint() is None
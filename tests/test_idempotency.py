@@ -0,0 +1,38 @@
+from conftest import add_users
+
+def test_replay_returns_first_reply_and_debits_once(node, send):
+    add_users("alice", "bob", balance=100)
+    first = send("SEND_TRANSACTION|alice|bob|10|key-1")
+    again = send("SEND_TRANSACTION|alice|bob|10|key-1")
+    assert first["status"] == again["status"] == "SEND_SUCCESS"
+    assert again["data"]["replayed"] and not first["data"].get("replayed")
+    assert again["data"]["transaction_id"] == first["data"]["transaction_id"]
+    assert node.get_user_balance("bob") == 110
+
+def test_replay_survives_restart(node, send, monkeypatch):
+    add_users("bob")
+    first = send("AIR_DROP|bob|5|drop-1")
+    monkeypatch.setattr(node, "idempotency", node.IdempotencyTable())
+    again = send("AIR_DROP|bob|5|drop-1")
+    assert again["status"] == first["status"] == "AIR_DROP_SUCCESS" and again["data"]["replayed"]
+    assert node.get_user_balance("bob") == 5
+
+def test_key_reused_for_different_request_conflicts(node, send):
+    add_users("alice", "bob", balance=100)
+    assert send("SEND_TRANSACTION|alice|bob|10|key-1")["status"] == "SEND_SUCCESS"
+    reply = send("SEND_TRANSACTION|alice|bob|20|key-1")
+    assert reply["status"] == "IDEMPOTENCY_KEY_REUSED" and reply["code"] == 409
+    assert node.get_user_balance("bob") == 110
+
+def test_overlong_key_is_rejected(node, send):
+    add_users("bob")
+    reply = send("AIR_DROP|bob|5|" + "k" * (node.IDEMPOTENCY_KEY_MAX + 1))
+    assert reply["status"] == "IDEMPOTENCY_KEY_INVALID" and reply["code"] == 400
+    assert node.get_user_balance("bob") == 0
+
+def test_failure_is_not_remembered(node, send):
+    add_users("alice", "bob")
+    assert send("SEND_TRANSACTION|alice|bob|10|key-1")["status"] == "TRANSACTION_FAILED"
+    node.credit_account("alice", 100)
+    reply = send("SEND_TRANSACTION|alice|bob|10|key-1")
+    assert reply["status"] == "SEND_SUCCESS" and not reply["data"].get("replayed")
@@ -0,0 +1,82 @@
+import sqlite3
+
+import pytest
+
+from conftest import add_users, total_balance
+
+@pytest.fixture
+def faucet(node, monkeypatch):
+    assert "FAUCET" in node.SHARDED_ACCOUNTS
+    monkeypatch.setattr(node, "cas_stats", node.CasStats())
+    monkeypatch.setattr(node, "cas_backoff", lambda attempt: None)
+    add_users("FAUCET", "alice", "bob", balance=100)
+    return node
+
+def set_home_balance(node, username, balance):
+    node.mycursor.execute("UPDATE customer_info SET balance = %s WHERE username = %s", (balance, username))
+    node.state_tree.refresh(username)
+
+def test_transfers_keep_total(faucet):
+    start = total_balance()
+    for sender, receiver, amount in [("FAUCET", "alice", 30), ("alice", "FAUCET", 12.5), ("bob", "FAUCET", 40),
+                                     ("FAUCET", "bob", 110), ("FAUCET", "alice", 5)]:
+        ok, message, _ = faucet.create_transaction(sender, receiver, amount)
+        assert ok, message
+    faucet.mycursor.execute("SELECT COALESCE(SUM(fee), 0) FROM transactions WHERE status = 'confirmed'")
+    fees = float(faucet.mycursor.fetchone()[0])
+    assert fees > 0 and total_balance() + fees == pytest.approx(start)
+    rebuilt = faucet.StateTree()
+    rebuilt.load(faucet.mydb)
+    assert rebuilt.root_hex() == faucet.state_tree.root_hex()
+
+def test_debit_reports_the_balance_it_read(faucet):
+    set_home_balance(faucet, "FAUCET", 20)
+    assert faucet.debit_account("FAUCET", 50) == ("ok", 120)
+    assert faucet.get_user_balance("FAUCET") == 70
+
+def test_uncovered_debit_is_declined(faucet):
+    assert faucet.debit_account("FAUCET", 1000) == ("declined", 100)
+    assert faucet.get_user_balance("FAUCET") == 100
+
+def test_unfinished_debit_puts_back_what_it_took(faucet, monkeypatch):
+    set_home_balance(faucet, "FAUCET", 50)
+    monkeypatch.setattr(faucet, "CAS_MAX_ATTEMPTS", 1)
+    monkeypatch.setattr(faucet, "cas_balance", lambda username, version, balance: False)
+    # The home row keeps conflicting, so only the 100 in the shards is taken before giving up
+    assert faucet.debit_account("FAUCET", 120) == ("conflict", 150)
+    assert faucet.get_user_balance("FAUCET") == 150
+    assert faucet.cas_stats.snapshot()["exhausted"] == 1
+
+def test_failed_put_back_is_logged(faucet, monkeypatch):
+    set_home_balance(faucet, "FAUCET", 50)
+    errors = []
+    monkeypatch.setattr(faucet, "CAS_MAX_ATTEMPTS", 1)
+    monkeypatch.setattr(faucet, "cas_balance", lambda username, version, balance: False)
+    monkeypatch.setattr(faucet, "shard_credit", lambda username, amount: False)
+    monkeypatch.setattr(faucet.log, "error", lambda tag, fmt, *args: errors.append(fmt % args))
+    assert faucet.debit_account("FAUCET", 120)[0] == "conflict"
+    assert any("Putting back 100.00000000 VNC to FAUCET" in line for line in errors)
+
+def test_failed_shard_credit_is_not_counted_as_success(faucet):
+    faucet.mycursor.execute("DELETE FROM balance_shards WHERE username = %s", ("FAUCET",))
+    before = faucet.cas_stats.snapshot()
+    assert not faucet.credit_account("FAUCET", 5)
+    after = faucet.cas_stats.snapshot()
+    assert after["updates"] == before["updates"] + 1 and after["exhausted"] == before["exhausted"] + 1
+
+@pytest.mark.parametrize("error, created", [(sqlite3.IntegrityError, True), (sqlite3.OperationalError, False)])
+def test_shard_creation_only_tolerates_duplicates(node, monkeypatch, error, created):
+    add_users("FAUCET")
+    real_execute = node.mycursor.execute
+
+    def execute(query, params=()):
+        if query.startswith("INSERT INTO balance_shards"):
+            raise error("simulated")
+        return real_execute(query, params)
+    monkeypatch.setattr(node.mycursor, "execute", execute)
+    if created:
+        assert node.ensure_balance_shards("FAUCET")
+    else:
+        with pytest.raises(sqlite3.OperationalError):
+            node.ensure_balance_shards("FAUCET")
+    assert ("FAUCET" in node._shards_ready) == created
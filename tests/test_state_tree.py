@@ -0,0 +1,47 @@
+import pytest
+
+from conftest import add_users
+
+@pytest.fixture
+def accounts(node):
+    add_users(*[f"user{i}" for i in range(20)], balance=3)
+    add_users("FAUCET", balance=50)
+    assert node.create_transaction("user1", "user2", 1.5)[0]
+    assert node.create_transaction("FAUCET", "user3", 4)[0]
+    return node
+
+def test_every_account_proves_its_balance(accounts, send):
+    root = accounts.state_tree.root_hex()
+    for username in ["FAUCET"] + [f"user{i}" for i in range(20)]:
+        reply = send(f"STATE_PROOF|{username}")
+        assert reply["status"] == "STATE_PROOF"
+        proof = reply["data"]
+        assert float(proof["balance"]) == pytest.approx(accounts.get_user_balance(username))
+        assert accounts.verify_state_proof(proof, root)
+
+def test_tampered_proofs_are_rejected(accounts):
+    proof = accounts.state_tree.proof("user2")
+    assert not accounts.verify_state_proof(dict(proof, balance="1000.00000000"))
+    assert not accounts.verify_state_proof(dict(proof, username="user3"))
+    assert not accounts.verify_state_proof(proof, "0" * 64)
+    sibling = proof["siblings"][-1]
+    flipped = ("1" if sibling[0] == "0" else "0") + sibling[1:]
+    assert not accounts.verify_state_proof(dict(proof, siblings=proof["siblings"][:-1] + [flipped]))
+
+def test_unknown_account_has_no_proof(accounts, send):
+    assert accounts.state_tree.proof("nobody") is None
+    assert send("STATE_PROOF|nobody")["status"] == "STATE_PROOF_FAILED"
+
+def test_rebuild_matches_incremental_root(accounts):
+    rebuilt = accounts.StateTree()
+    rebuilt.load(accounts.mydb)
+    assert rebuilt.accounts == accounts.state_tree.accounts == 21
+    assert rebuilt.root_hex() == accounts.state_tree.root_hex()
+
+def test_older_version_does_not_overwrite(accounts):
+    root = accounts.state_tree.root_hex()
+    balance, version = accounts.read_balance_state("user5")
+    accounts.state_tree.set("user5", balance + 10, version - 1)
+    assert accounts.state_tree.root_hex() == root
+    accounts.state_tree.set("user5", balance + 10, version - 1, force=True)
+    assert accounts.state_tree.root_hex() != root
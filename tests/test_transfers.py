@@ -0,0 +1,69 @@
+import pytest
+
+from conftest import add_users, mine, total_balance
+
+def confirmed_fees(node):
+    node.mycursor.execute("SELECT COALESCE(SUM(fee), 0) FROM transactions WHERE status = 'confirmed'")
+    return float(node.mycursor.fetchone()[0])
+
+@pytest.fixture(params=["optimistic", "locks"])
+def funded(request, node, monkeypatch):
+    monkeypatch.setattr(node, "BALANCE_MODE", request.param)
+    add_users("alice", "bob", "FAUCET", balance=100)
+    return node
+
+def test_transfers_keep_total(funded):
+    start = total_balance()
+    for sender, receiver, amount in [("alice", "bob", 10), ("bob", "alice", 3.5), ("FAUCET", "alice", 7),
+                                     ("alice", "FAUCET", 1.25)]:
+        ok, message, _ = funded.create_transaction(sender, receiver, amount)
+        assert ok, message
+    assert total_balance() + confirmed_fees(funded) == pytest.approx(start)
+
+def test_insufficient_funds_changes_nothing(funded):
+    ok, _, details = funded.create_transaction("alice", "bob", 1000)
+    assert not ok and details["available"] == 100
+    assert funded.get_user_balance("alice") == 100 and funded.get_user_balance("bob") == 100
+
+def test_failed_credit_refunds_sender(node, monkeypatch):
+    add_users("alice", "bob", balance=100)
+    real_credit = node.credit_account
+    monkeypatch.setattr(node, "credit_account", lambda username, amount:
+                        False if username == "bob" else real_credit(username, amount))
+    ok, message, _ = node.create_transaction("alice", "bob", 10)
+    assert not ok and "busy" in message
+    assert node.get_user_balance("alice") == 100
+    node.mycursor.execute("SELECT status FROM transactions")
+    assert node.mycursor.fetchall() == [("failed",)]
+
+def test_raising_credit_refunds_sender(node, monkeypatch):
+    add_users("alice", "bob", balance=100)
+    real_credit = node.credit_account
+
+    def credit(username, amount):
+        if username == "bob":
+            raise RuntimeError("connection lost")
+        return real_credit(username, amount)
+    monkeypatch.setattr(node, "credit_account", credit)
+    ok, message, _ = node.create_transaction("alice", "bob", 10)
+    assert not ok and message == "connection lost"
+    assert node.get_user_balance("alice") == 100 and node.get_user_balance("bob") == 100
+
+def test_failed_refund_is_logged_for_reconciliation(node, monkeypatch):
+    add_users("alice", "bob", balance=100)
+    errors = []
+    monkeypatch.setattr(node, "credit_account", lambda username, amount: False)
+    monkeypatch.setattr(node.log, "error", lambda tag, fmt, *args: errors.append(fmt % args))
+    ok, _, _ = node.create_transaction("alice", "bob", 10)
+    assert not ok
+    assert any("Refund of 10.10000000 VNC to alice" in line for line in errors)
+
+def test_unpaid_block_is_not_stored(node, monkeypatch):
+    add_users("miner")
+    root = node.state_tree.root_hex()
+    monkeypatch.setattr(node, "credit_account", lambda username, amount: False)
+    block_data, block_hash = mine(1, "0" * 64, "miner")
+    assert node.submit_block(block_data, block_hash) == ("BLOCK REJECTED", "Storage failed")
+    node.mycursor.execute("SELECT COUNT(*) FROM blocks")
+    assert node.mycursor.fetchone()[0] == 0 and len(node.blockchain) == 0
+    assert node.state_tree.root_hex() == root
@@ -0,0 +1,48 @@
+import pytest
+
+from conftest import add_users, mine_next
+
+def rows(count):
+    return [(f"tx{i}", f"user{i}", f"user{i + 1}", 1 + i / 4, 0.01) for i in range(count)]
+
+def tree_proof(tree, row):
+    transaction_id, from_user, to_user, amount, fee = row
+    return {"transaction": {"id": transaction_id, "from": from_user, "to": to_user,
+                            "amount": f"{amount:.8f}", "fee": f"{fee:.8f}"},
+            "tx_root": tree.root, "siblings": tree.proof(transaction_id)}
+
+@pytest.mark.parametrize("count", [1, 2, 5, 8, 13])
+def test_every_leaf_proves(node, count):
+    tree = node.TxMerkleTree(rows(count))
+    for row in rows(count):
+        assert node.verify_tx_proof(tree_proof(tree, row))
+
+def test_tampered_proofs_are_rejected(node):
+    tree = node.TxMerkleTree(rows(5))
+    proof = tree_proof(tree, rows(5)[2])
+    assert not node.verify_tx_proof(dict(proof, transaction=dict(proof["transaction"], amount="99.00000000")))
+    assert not node.verify_tx_proof(proof, node.TxMerkleTree(rows(4)).root)
+    swapped = [dict(step, side="right" if step["side"] == "left" else "left") for step in proof["siblings"]]
+    assert not node.verify_tx_proof(dict(proof, siblings=swapped))
+    assert tree.proof("tx-missing") is None
+
+def test_odd_leaf_is_not_paired_with_itself(node):
+    # Repeating the last row would give the same root if odd leaves were duplicated
+    assert node.TxMerkleTree(rows(3)).root != node.TxMerkleTree(rows(3) + rows(3)[-1:]).root
+
+def test_mined_template_proves_its_transactions(node, send):
+    add_users("alice", "bob", "miner", balance=100)
+    sent = [send(f"SEND_TRANSACTION|alice|bob|{amount}")["data"]["transaction_id"] for amount in (1, 2, 3)]
+    template = send("TEMPLATE|miner")["data"]
+    assert template["transaction_ids"] == sent
+    assert send(f"TX_PROOF|{sent[0]}")["status"] == "TX_PROOF_FAILED"
+
+    block_id = mine_next("miner", template["transactions"])
+    node.mycursor.execute("SELECT tx_root FROM blocks WHERE block_id = %s", (block_id,))
+    assert node.mycursor.fetchone()[0] == template["tx_root"]
+    node.tx_templates.blocks.clear()  # prove from the stored rows, not the cached tree
+    for transaction_id in sent:
+        reply = send(f"TX_PROOF|{transaction_id}")
+        assert reply["status"] == "TX_PROOF" and reply["data"]["block_id"] == block_id
+        assert node.verify_tx_proof(reply["data"], template["tx_root"])
+    assert send("TEMPLATE|miner")["data"]["tx_root"] is None
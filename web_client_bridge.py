@@ -1,12 +1,40 @@
-from flask import Flask, request, jsonify
+"""
+VanillaCoin web bridge: JSON API + wallet UI in front of the socket server.
+
+Development (single process, Flask reloader):
+    python web_client_bridge.py
+
+Production (pre-forked gunicorn workers, one upstream pool per worker):
+    python web_client_bridge.py --prod --workers 4 --threads 8 --bind 0.0.0.0:5000
+or point any WSGI server at the app object directly:
+    gunicorn -w 4 --threads 8 -b 0.0.0.0:5000 web_client_bridge:app
+
+Workers share nothing, so throughput scales with --workers up to the number
+of cores. Send SIGHUP to the master process for a graceful reload (new
+workers start, old ones finish in-flight requests) and SIGTERM to stop.
+The read cache is per worker, so invalidation only reaches the worker that
+performed the write; the short TTLs bound staleness across workers.
+"""
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
 import socket
+import os
+import queue
+import argparse
 import json
+import gzip
+import hashlib
 import threading
 import secrets
 import string
 import re
 import time
+from collections import OrderedDict, namedtuple
+
+try:
+    import brotli
+except ImportError:  # optional: gzip is always available
+    brotli = None
 
 app = Flask(__name__)
 CORS(app)
@@ -23,6 +51,46 @@ FORMAT = "utf-8"
 FAUCET_ACCOUNT = "FAUCET"   # auto-created / auto-mined if needed
 FAUCET_MINING_STEP_SECONDS = 2   # seconds per mining attempt during auto-fund
 FAUCET_MINING_MAX_STEPS   = 15  # upper bound (total ~30s) to avoid infinite loops
+MINE_REPLY_GRACE = 10  # seconds a MINE reply may take beyond the mining time (waiting for a worker, storing blocks)
+
+# Idempotency keys on SEND_TRANSACTION / AIR_DROP: the server replays the
+# first result for a repeated key, so a keyed write that got no reply can be resent.
+IDEMPOTENCY_KEY_MAX = 120  # server allows 128; leaves room for the ":faucet" suffix
+WRITE_RETRIES = 1
+
+# Read cache: seconds a server reply stays fresh, per endpoint.
+CACHE_TTLS = {
+    "balance": 2.0,
+    "history": 5.0,
+    "check_username": 10.0,
+}
+CACHE_MAX_ENTRIES = 4096
+
+# Upstream connections held open per worker process.
+UPSTREAM_POOL_SIZE = int(os.environ.get("BRIDGE_POOL_SIZE", "8"))
+
+# Production mode defaults (overridable by flags or environment).
+PROD_BIND = os.environ.get("BRIDGE_BIND", "127.0.0.1:5000")
+PROD_WORKERS = int(os.environ.get("BRIDGE_WORKERS", str(os.cpu_count() or 1)))
+PROD_THREADS = int(os.environ.get("BRIDGE_THREADS", str(UPSTREAM_POOL_SIZE)))
+PROD_GRACEFUL_TIMEOUT = 30
+
+# Wallet page caching: browsers keep the page but revalidate it with the ETag.
+WALLET_CACHE_CONTROL = "public, max-age=0, must-revalidate"
+
+# -----------------------------
+# Framing (shared by the sync and asyncio bridges)
+# -----------------------------
+def encode_frame(msg: str) -> bytes:
+    """Length header padded to HEADER bytes, followed by the payload."""
+    payload = msg.encode(FORMAT)
+    send_len = str(len(payload)).encode(FORMAT)
+    return send_len + b" " * (HEADER - len(send_len)) + payload
+
+def parse_frame_header(header_bytes: bytes):
+    """Payload length of a framed reply, or None if the server replied unframed."""
+    header_str = header_bytes.decode(FORMAT, errors="ignore").strip()
+    return int(header_str) if header_str.isdigit() else None
 
 # -----------------------------
 # Socket bridge (tolerant of framed/unframed)
@@ -44,7 +112,9 @@ class VanillaCoinBridge:
                 self.client.settimeout(5)
                 self.client.connect((self.server_host, self.server_port))
                 self.connected = True
-                return True
+                # Ask for structured replies; older servers keep answering in text.
+                self.send_message(PROTOCOL_REQUEST)
+                return self.connected
             except Exception as e:
                 print(f"Error connecting to server: {e}")
                 self.connected = False
@@ -77,24 +147,24 @@ class VanillaCoinBridge:
             self.client.settimeout(5)
         return bytes(data)
 
-    def send_message(self, msg: str):
+    def send_message(self, msg: str, timeout=None):
         if not self.connected:
             if not self.connect():
                 return None
         try:
-            payload = msg.encode(FORMAT)
-            send_len = str(len(payload)).encode(FORMAT)
-            send_len += b" " * (HEADER - len(send_len))
-            self.client.sendall(send_len)
-            self.client.sendall(payload)
+            self.client.sendall(encode_frame(msg))
 
-            header_bytes = self.client.recv(HEADER)
+            if timeout is not None:
+                self.client.settimeout(timeout)
+            try:
+                header_bytes = self.client.recv(HEADER)
+            finally:
+                self.client.settimeout(5)
             if not header_bytes:
                 return ""
 
-            header_str = header_bytes.decode(FORMAT, errors="ignore").strip()
-            if header_str.isdigit():
-                resp_len = int(header_str)
+            resp_len = parse_frame_header(header_bytes)
+            if resp_len is not None:
                 if resp_len <= 0:
                     return ""
                 data = self._recv_exact(resp_len)
@@ -116,11 +186,7 @@ class VanillaCoinBridge:
         if self.connected and self.client:
             try:
                 try:
-                    payload = "!DISCONNECT".encode(FORMAT)
-                    send_len = str(len(payload)).encode(FORMAT)
-                    send_len += b" " * (HEADER - len(send_len))
-                    self.client.sendall(send_len)
-                    self.client.sendall(payload)
+                    self.client.sendall(encode_frame("!DISCONNECT"))
                 except Exception:
                     pass
                 self.client.close()
@@ -129,55 +195,294 @@ class VanillaCoinBridge:
             self.connected = False
             self.client = None
 
-bridge = VanillaCoinBridge(VANILLACOIN_SERVER_HOST, VANILLACOIN_SERVER_PORT)
+class BridgePool:
+    """
+    Bounded pool of VanillaCoinBridge connections. Each request checks out
+    its own socket, so concurrent threads never interleave frames. The pool
+    is rebuilt empty the first time it is used in a forked child process.
+    """
+    def __init__(self, host="127.0.0.1", port=5050, size=8):
+        self.server_host = host
+        self.server_port = port
+        self.size = size
+        self._pid = os.getpid()
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def _check_fork(self):
+        if self._pid != os.getpid():
+            # Sockets inherited from the parent belong to the parent.
+            self._pid = os.getpid()
+            self._idle = queue.LifoQueue()
+            self._slots = threading.BoundedSemaphore(self.size)
+
+    def _checkout(self) -> VanillaCoinBridge:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return VanillaCoinBridge(self.server_host, self.server_port)
+
+    def connect(self) -> bool:
+        self._check_fork()
+        with self._slots:
+            conn = self._checkout()
+            try:
+                return conn.connect()
+            finally:
+                self._idle.put(conn)
+
+    def send_message(self, msg: str, timeout=None):
+        self._check_fork()
+        with self._slots:
+            conn = self._checkout()
+            try:
+                return conn.send_message(msg, timeout)
+            finally:
+                self._idle.put(conn)
+
+    def disconnect(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.disconnect()
+
+bridge = BridgePool(VANILLACOIN_SERVER_HOST, VANILLACOIN_SERVER_PORT, UPSTREAM_POOL_SIZE)
+
+# -----------------------------
+# Read cache (balance / history / check_username)
+# -----------------------------
+class _PendingFetch:
+    __slots__ = ("event", "value", "invalidated")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.invalidated = False
+
+class ResponseCache:
+    """
+    TTL + LRU cache of raw server replies keyed by (endpoint, username).
+    Concurrent misses on the same key share a single upstream call, and
+    writes made through this bridge invalidate the affected users.
+    """
+    def __init__(self, ttls, max_entries=4096):
+        self.ttls = dict(ttls)
+        self.max_entries = max_entries
+        self.entries = OrderedDict()   # key -> (expires_at, reply)
+        self.pending = {}              # key -> _PendingFetch
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _begin(self, key, new_pending):
+        """Returns ("hit", reply), ("lead", pending) or ("wait", pending)."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return "hit", entry[1]
+                del self.entries[key]
+            pending = self.pending.get(key)
+            if pending is None:
+                pending = self.pending[key] = new_pending()
+                self.misses += 1
+                return "lead", pending
+            self.coalesced += 1
+            return "wait", pending
+
+    def _finish(self, key, pending, value):
+        # Only successful replies are stored: an error or an unreachable
+        # server (None) is passed to the waiters but asked again next time.
+        cacheable = value is not None and parse_reply(value).ok
+        with self.lock:
+            del self.pending[key]
+            if cacheable and not pending.invalidated:
+                self.entries[key] = (time.monotonic() + self.ttls[key[0]], value)
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+                    self.evictions += 1
+
+    def get_or_fetch(self, endpoint: str, username: str, fetch):
+        key = (endpoint, username)
+        state, found = self._begin(key, _PendingFetch)
+        if state == "hit":
+            return found
+        if state == "wait":
+            found.event.wait()
+            return found.value
+
+        value = None
+        try:
+            value = fetch()
+        finally:
+            self._finish(key, found, value)
+            found.value = value
+            found.event.set()
+        return value
+
+    def invalidate(self, username: str, endpoints=("balance", "history")):
+        with self.lock:
+            for endpoint in endpoints:
+                key = (endpoint, username)
+                if self.entries.pop(key, None) is not None:
+                    self.invalidations += 1
+                pending = self.pending.get(key)
+                if pending is not None:
+                    pending.invalidated = True
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "entries": len(self.entries),
+                "max_entries": self.max_entries,
+                "hit_ratio": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+                "ttls": dict(self.ttls),
+            }
+
+response_cache = ResponseCache(CACHE_TTLS, CACHE_MAX_ENTRIES)
+
+# -----------------------------
+# Command channel (how cmd_* helpers reach the server)
+# -----------------------------
+class CommandChannel:
+    """
+    Plain calls, cached reads, and writes that invalidate the cached reads
+    of the users they touch. The asyncio bridge provides the same three
+    methods as coroutines, so the cmd_* helpers below serve both.
+    """
+    def __init__(self, pool, cache):
+        self.pool = pool
+        self.cache = cache
+
+    def call(self, msg: str):
+        return self.pool.send_message(msg)
+
+    def read(self, endpoint: str, username: str, msg: str):
+        return self.cache.get_or_fetch(endpoint, username, lambda: self.pool.send_message(msg))
+
+    def write(self, msg: str, users, endpoints=("balance", "history"), retries=0, timeout=None):
+        # Only retry writes the server deduplicates (idempotency key attached).
+        resp = self.pool.send_message(msg, timeout)
+        while resp is None and retries > 0:
+            retries -= 1
+            resp = self.pool.send_message(msg, timeout)
+        for username in users:
+            self.cache.invalidate(username, endpoints)
+        return resp
+
+channel = CommandChannel(bridge, response_cache)
 
 # -----------------------------
 # Socket command helpers
 # -----------------------------
-def cmd_check_username(username: str):
-    return bridge.send_message(f"CHECK_USERNAME|{username}")
+def cmd_check_username(username: str, via=None):
+    return (via or channel).read("check_username", username, f"CHECK_USERNAME|{username}")
 
-def cmd_register(username: str, password: str, word_list_json: str, hardware_json: str):
-    return bridge.send_message(f"REGISTER|{username}|{password}|{word_list_json}|{hardware_json}")
+def cmd_register(username: str, password: str, word_list_json: str, hardware_json: str, via=None):
+    return (via or channel).write(
+        f"REGISTER|{username}|{password}|{word_list_json}|{hardware_json}",
+        (username,), ("check_username", "balance", "history"))
 
-def cmd_login(username: str, password: str, word_list_json: str, hardware_json: str):
-    return bridge.send_message(f"LOGIN|{username}|{password}|{word_list_json}|{hardware_json}")
+def cmd_login(username: str, password: str, word_list_json: str, hardware_json: str, via=None):
+    return (via or channel).call(f"LOGIN|{username}|{password}|{word_list_json}|{hardware_json}")
 
-def cmd_get_balance(username: str):
-    return bridge.send_message(f"GET_BALANCE|{username}")
+def cmd_get_balance(username: str, via=None):
+    return (via or channel).read("balance", username, f"GET_BALANCE|{username}")
 
-def cmd_send_transaction(from_user: str, to_user: str, amount: float):
-    return bridge.send_message(f"SEND_TRANSACTION|{from_user}|{to_user}|{amount}")
+def cmd_send_transaction(from_user: str, to_user: str, amount: float, via=None, key=None):
+    if key:
+        return (via or channel).write(f"SEND_TRANSACTION|{from_user}|{to_user}|{amount}|{key}", (from_user, to_user),
+                                      retries=WRITE_RETRIES)
+    return (via or channel).write(f"SEND_TRANSACTION|{from_user}|{to_user}|{amount}", (from_user, to_user))
 
-def cmd_get_history(username: str):
-    return bridge.send_message(f"GET_HISTORY|{username}")
+def cmd_get_history(username: str, via=None):
+    return (via or channel).read("history", username, f"GET_HISTORY|{username}")
 
-def cmd_mine(username: str, seconds: int):
-    return bridge.send_message(f"MINE|{username}|{seconds}")
+def cmd_mine(username: str, seconds: int, via=None):
+    # The server mines for the whole time before it replies
+    return (via or channel).write(f"MINE|{username}|{seconds}", (username,), timeout=seconds + MINE_REPLY_GRACE)
 
-def cmd_airdrop(to_user: str, amount: float):
-    return bridge.send_message(f"AIR_DROP|{to_user}|{amount}")
+def cmd_airdrop(to_user: str, amount: float, via=None, key=None):
+    if key:
+        return (via or channel).write(f"AIR_DROP|{to_user}|{amount}|{key}", (to_user,), retries=WRITE_RETRIES)
+    return (via or channel).write(f"AIR_DROP|{to_user}|{amount}", (to_user,))
+
+def cmd_tx_proof(transaction_id: str, via=None):
+    return (via or channel).call(f"TX_PROOF|{transaction_id}")
+
+def cmd_metrics(via=None):
+    return (via or channel).call("METRICS")
+
+def idempotency_key(headers, data) -> str:
+    """
+    Key for a money-moving request: the Idempotency-Key header, else the
+    body's "idempotency_key", else a fresh one so at least our own retry
+    of this request is safe. Raises ValueError for keys the server can't take.
+    """
+    key = (headers.get("Idempotency-Key") or data.get("idempotency_key") or "").strip()
+    if not key:
+        return secrets.token_hex(16)
+    if len(key) > IDEMPOTENCY_KEY_MAX or "|" in key:
+        raise ValueError(f"Idempotency key must be at most {IDEMPOTENCY_KEY_MAX} characters without '|'")
+    return key
 
 # Utility: strong random password for auto-created accounts
 def _rand_password(n=24):
     alphabet = string.ascii_letters + string.digits + "!@#%^*-_=+"
     return "".join(secrets.choice(alphabet) for _ in range(n))
 
-# Utility: ensure username exists (create if missing)
-def ensure_user(username: str) -> bool:
-    resp = cmd_check_username(username) or ""
-    up = resp.upper()
-    if "USERNAME_AVAILABLE" in up or ("AVAILABLE" in up and "NOT" not in up):
-        pw = _rand_password()
-        reg = cmd_register(username, pw, json.dumps([]), json.dumps({})) or ""
-        return "REGISTER_SUCCESS" in reg.upper() or "CREATED" in reg.upper() or "REGISTERED" in reg.upper()
-    return "NOT FOUND" not in up and "DOES NOT EXIST" not in up
+# -----------------------------
+# Reply parsing (shared by the sync and asyncio bridges)
+# -----------------------------
+PROTOCOL_REQUEST = "PROTOCOL|JSON"
+
+class ServerReply(namedtuple("ServerReply", "code status message data")):
+    """One parsed server reply; code follows HTTP conventions."""
+    __slots__ = ()
+
+    @property
+    def ok(self) -> bool:
+        return 200 <= self.code < 300
+
+    @property
+    def text(self) -> str:
+        return f"{self.status}: {self.message}" if self.message else self.status
+
+UNREACHABLE_REPLY = ServerReply(503, "UNREACHABLE", "Server unreachable", None)
+UNREACHABLE = ({"success": False, "message": "Server unreachable"}, 503)
+
+# Codes for servers that still answer in "STATUS: message" text.
+LEGACY_STATUS_CODES = {
+    "SEND_SUCCESS": 200,
+    "MINE_SUCCESS": 200,
+    "AIR_DROP_SUCCESS": 200,
+    "USERNAME_AVAILABLE": 200,
+    "USERNAME_TAKEN": 200,
+    "REGISTRATION_SUCCESS": 200,
+    "LOGIN_SUCCESS": 200,
+    "BLOCK ACCEPTED": 200,
+}
 
 def parse_required_available(msg: str):
     """
     Parse strings like:
     'TRANSACTION_FAILED: Insufficient balance. Required: 10.10000000, Available: 0.00000000'
     Returns (required, available) as floats when found, else (None, None).
+    Only needed for servers without structured replies.
     """
     try:
         m = re.search(r"Required:\s*([0-9.]+)\s*,\s*Available:\s*([0-9.]+)", msg, re.IGNORECASE)
@@ -187,12 +492,203 @@ def parse_required_available(msg: str):
         pass
     return None, None
 
+def _parse_legacy_reply(text: str) -> ServerReply:
+    status, sep, message = text.partition(":")
+    if not sep:
+        try:
+            return ServerReply(200, "BALANCE", "", {"balance": float(text)})
+        except ValueError:
+            return ServerReply(400, text.upper(), "", None)
+    status = status.strip().upper()
+    message = message.strip()
+    code = LEGACY_STATUS_CODES.get(status, 500 if status.endswith("ERROR") else 400)
+    data = None
+    if status == "TRANSACTION_FAILED":
+        required, available = parse_required_available(message)
+        if required is not None:
+            code, data = 402, {"required": required, "available": available}
+    elif status == "LOGIN_FAILED":
+        code = 403 if message == "HARDWARE_MISMATCH" else 401
+    elif status == "REGISTRATION_FAILED" and message == "Username already exists":
+        code = 409
+    return ServerReply(code, status, message, data)
+
+def parse_reply(resp) -> ServerReply:
+    """
+    The one place server replies are classified. Structured replies
+    (negotiated with PROTOCOL|JSON) are read as-is; legacy text is matched
+    on its exact status tag, never by substring.
+    """
+    if resp is None:
+        return UNREACHABLE_REPLY
+    text = resp.strip()
+    if text[:1] in ("{", "["):
+        try:
+            body = json.loads(text)
+        except ValueError:
+            body = None
+        if isinstance(body, dict) and "code" in body and "status" in body:
+            return ServerReply(int(body["code"]), body["status"], body.get("message") or "", body.get("data"))
+        if isinstance(body, dict):
+            return ServerReply(200, "BALANCE", "", body)
+        if isinstance(body, list):
+            return ServerReply(200, "HISTORY", "", body)
+    return _parse_legacy_reply(text)
+
+def reply_balance(reply: ServerReply) -> float:
+    """Balance carried by a GET_BALANCE reply; 0.0 if there is none."""
+    try:
+        return float((reply.data or {}).get("balance", 0.0))
+    except (AttributeError, TypeError, ValueError):
+        return 0.0
+
+def check_username_reply(reply: ServerReply):
+    if reply is UNREACHABLE_REPLY:
+        return UNREACHABLE
+    if reply.status == "USERNAME_AVAILABLE":
+        return {"success": True, "available": True, "message": "Available"}, 200
+    if reply.status == "USERNAME_TAKEN":
+        return {"success": True, "available": False, "message": "Taken"}, 200
+    return {"success": False, "message": reply.text}, 400
+
+def register_reply(reply: ServerReply):
+    if reply is UNREACHABLE_REPLY:
+        return UNREACHABLE
+    if reply.status == "REGISTRATION_SUCCESS":
+        return {"success": True, "message": "Account created"}, 200
+    if reply.code == 409:
+        return {"success": False, "message": "Username already taken"}, 409
+    return {"success": False, "message": reply.text}, 400
+
+def login_reply(reply: ServerReply):
+    if reply is UNREACHABLE_REPLY:
+        return UNREACHABLE
+    if reply.status == "LOGIN_SUCCESS":
+        return {"success": True, "message": "Login successful"}, 200
+    if reply.code == 403:
+        return {"success": False, "message": "Hardware mismatch"}, 403
+    if reply.status == "LOGIN_FAILED":
+        return {"success": False, "message": "Invalid credentials or user not found"}, 401
+    if reply.code >= 500:
+        return {"success": False, "message": "Server error during login"}, 500
+    return {"success": False, "message": reply.text}, 400
+
+def balance_reply(reply: ServerReply):
+    if reply is UNREACHABLE_REPLY:
+        return UNREACHABLE
+    if reply.status == "BALANCE":
+        return {"success": True, "balance": reply_balance(reply)}, 200
+    return {"success": False, "message": reply.text}, 400
+
+def send_reply(reply: ServerReply):
+    if reply is UNREACHABLE_REPLY:
+        return UNREACHABLE
+    if reply.status == "SEND_SUCCESS":
+        return {"success": True, "message": "Transaction sent"}, 200
+    return {"success": False, "message": reply.text}, 400
+
+def history_reply(reply: ServerReply):
+    if reply is UNREACHABLE_REPLY:
+        return UNREACHABLE
+    if reply.status != "HISTORY" or not isinstance(reply.data, list):
+        return {"success": False, "message": reply.text}, 400
+    history = reply.data
+    for tx in history:
+        if "amount" in tx:
+            try:
+                tx["amount"] = float(tx["amount"])
+            except:
+                pass
+    return {"success": True, "history": history}, 200
+
+def tx_proof_reply(reply: ServerReply):
+    if reply is UNREACHABLE_REPLY:
+        return UNREACHABLE
+    if reply.status == "TX_PROOF":
+        return {"success": True, "proof": reply.data}, 200
+    if reply.code == 404:
+        return {"success": False, "message": reply.message or "Transaction is not in a block yet"}, 404
+    return {"success": False, "message": reply.text}, 400
+
+def mine_error_reply(reply: ServerReply, blocks_found: int):
+    """(body, status) for a MINE step that did not succeed; blocks found by earlier steps still count."""
+    status = reply.code if 400 <= reply.code < 600 else 502
+    return {"success": False, "message": reply.text, "blocks_found": blocks_found}, status
+
+# AIR_DROP replies after which the faucet may pay instead: the server does not
+# know the command, or says it credited nothing. No reply, or an error of
+# unknown outcome, may hide an applied airdrop, so those never fall back.
+AIRDROP_FALLBACK_STATUSES = ("AIR_DROP_FAILED", "UNKNOWN_COMMAND", "MSG RECEIVED")
+
+def airdrop_reply(reply: ServerReply, amount: float):
+    """(body, status) to answer with for an AIR_DROP reply, or None to fall back to the faucet."""
+    if reply.status == "AIR_DROP_SUCCESS":
+        return {"success": True, "message": f"Airdropped +{amount} VNC"}, 200
+    if reply is UNREACHABLE_REPLY:
+        return {"success": False, "message": "Server unreachable; retry with the same Idempotency-Key"}, 503
+    if reply.status in AIRDROP_FALLBACK_STATUSES:
+        return None
+    return {"success": False, "message": reply.text}, reply.code if 400 <= reply.code < 600 else 502
+
+def _prom_histogram(lines, name, command, hist, buckets):
+    # Server buckets are per-interval; Prometheus wants them cumulative, in seconds
+    running = 0
+    for bound, count in zip(buckets, hist["counts"]):
+        running += count
+        lines.append(f'{name}_bucket{{command="{command}",le="{bound / 1000:g}"}} {running}')
+    running += hist["counts"][-1]
+    lines.append(f'{name}_bucket{{command="{command}",le="+Inf"}} {running}')
+    lines.append(f'{name}_sum{{command="{command}"}} {hist["sum_ms"] / 1000:g}')
+    lines.append(f'{name}_count{{command="{command}"}} {running}')
+
+def render_metrics(reply: ServerReply, cache_stats: dict) -> str:
+    """Prometheus text exposition of the server's METRICS reply plus this bridge's cache."""
+    lines = []
+    snapshot = reply.data if reply.status == "METRICS" and isinstance(reply.data, dict) else None
+    lines.append("# TYPE vanillacoin_up gauge")
+    lines.append(f"vanillacoin_up {1 if snapshot else 0}")
+    if snapshot:
+        commands = snapshot["commands"]
+        buckets = snapshot["buckets_ms"]
+        lines.append("# TYPE vanillacoin_connections gauge")
+        lines.append(f"vanillacoin_connections {snapshot['connections']}")
+        for metric, key, kind in (
+            ("vanillacoin_requests_total", "count", "counter"),
+            ("vanillacoin_request_errors_total", "errors", "counter"),
+            ("vanillacoin_request_failures_total", "failures", "counter"),
+            ("vanillacoin_requests_in_flight", "in_flight", "gauge"),
+            ("vanillacoin_db_queries_total", "db_queries", "counter"),
+        ):
+            lines.append(f"# TYPE {metric} {kind}")
+            for command, stats in commands.items():
+                lines.append(f'{metric}{{command="{command}"}} {stats.get(key, 0)}')
+        for metric, key in (
+            ("vanillacoin_request_duration_seconds", "latency"),
+            ("vanillacoin_request_db_seconds", "db"),
+        ):
+            lines.append(f"# TYPE {metric} histogram")
+            for command, stats in commands.items():
+                _prom_histogram(lines, metric, command, stats[key], buckets)
+    for key in ("hits", "misses", "coalesced", "evictions", "invalidations"):
+        lines.append(f"# TYPE bridge_cache_{key}_total counter")
+        lines.append(f"bridge_cache_{key}_total {cache_stats[key]}")
+    lines.append("# TYPE bridge_cache_entries gauge")
+    lines.append(f"bridge_cache_entries {cache_stats['entries']}")
+    return "\n".join(lines) + "\n"
+
+# Utility: ensure username exists (create if missing)
+def ensure_user(username: str) -> bool:
+    reply = parse_reply(cmd_check_username(username))
+    if reply.status == "USERNAME_AVAILABLE":
+        pw = _rand_password()
+        reg = parse_reply(cmd_register(username, pw, json.dumps([]), json.dumps({})))
+        return reg.status == "REGISTRATION_SUCCESS"
+    return reply.status == "USERNAME_TAKEN"
+
 # -----------------------------
 # Minimal root
 # -----------------------------
-@app.route("/")
-def index():
-    return '''
+INDEX_HTML = '''
     <!doctype html>
     <html><head><meta charset="utf-8"><title>VanillaCoin</title>
     <style>body{font-family:system-ui;background:#eef2ff;padding:24px}
@@ -212,10 +708,23 @@ def index():
     </body></html>
     '''
 
+@app.route("/")
+def index():
+    return INDEX_HTML
+
 @app.route("/api/ping")
 def api_ping():
     return jsonify({"ok": True})
 
+@app.route("/api/cache/stats")
+def api_cache_stats():
+    return jsonify({"success": True, "cache": response_cache.stats()})
+
+@app.route("/metrics")
+def metrics():
+    text = render_metrics(parse_reply(cmd_metrics()), response_cache.stats())
+    return Response(text, mimetype="text/plain; version=0.0.4")
+
 # -----------------------------
 # JSON API
 # -----------------------------
@@ -228,19 +737,8 @@ def api_connect():
 def api_check_username(username):
     if not username:
         return jsonify({"success": False, "message": "Username required"}), 400
-    resp = cmd_check_username(username)
-    if resp is None:
-        return jsonify({"success": False, "message": "Server unreachable"}), 503
-    low = resp.strip().upper()
-    if "USERNAME_AVAILABLE" in low and "TAKEN" not in low:
-        return jsonify({"success": True, "available": True, "message": "Available"})
-    if "USERNAME_TAKEN" in low:
-        return jsonify({"success": True, "available": False, "message": "Taken"})
-    if "AVAILABLE" in low and "NOT" not in low:
-        return jsonify({"success": True, "available": True, "message": resp})
-    if "NOT FOUND" in low or "DOES NOT EXIST" in low:
-        return jsonify({"success": True, "available": True, "message": resp})
-    return jsonify({"success": False, "message": resp}), 400
+    body, status = check_username_reply(parse_reply(cmd_check_username(username)))
+    return jsonify(body), status
 
 @app.route("/api/register", methods=["POST"])
 def api_register():
@@ -254,15 +752,8 @@ def api_register():
             return jsonify({"success": False, "message": "Username and password required"}), 400
 
         resp = cmd_register(username, password, json.dumps(word_list), json.dumps(hardware_info))
-        if resp is None:
-            return jsonify({"success": False, "message": "Server unreachable"}), 503
-
-        low = resp.strip().upper()
-        if "REGISTER_SUCCESS" in low or "REGISTERED" in low or "CREATED" in low:
-            return jsonify({"success": True, "message": "Account created"})
-        if "USERNAME_TAKEN" in low or "ALREADY EXISTS" in low:
-            return jsonify({"success": False, "message": "Username already taken"}), 409
-        return jsonify({"success": False, "message": resp}), 400
+        body, status = register_reply(parse_reply(resp))
+        return jsonify(body), status
     except Exception as e:
         return jsonify({"success": False, "message": f"Error: {e}"}), 500
 
@@ -278,19 +769,8 @@ def api_login():
             return jsonify({"success": False, "message": "Username required"}), 400
 
         resp = cmd_login(username, password or "__HWID_ONLY__", json.dumps(word_list), json.dumps(hardware_info))
-        if resp is None:
-            return jsonify({"success": False, "message": "Server unreachable"}), 503
-
-        low = resp.strip().upper()
-        if "LOGIN_SUCCESS" in low or "SUCCESS" in low:
-            return jsonify({"success": True, "message": "Login successful"})
-        if "HARDWARE_MISMATCH" in low:
-            return jsonify({"success": False, "message": "Hardware mismatch"}), 403
-        if "LOGIN_FAILED" in low or "INVALID CREDENTIALS" in low or "USER NOT FOUND" in low:
-            return jsonify({"success": False, "message": "Invalid credentials or user not found"}), 401
-        if "ERROR" in low:
-            return jsonify({"success": False, "message": "Server error during login"}), 500
-        return jsonify({"success": False, "message": resp}), 400
+        body, status = login_reply(parse_reply(resp))
+        return jsonify(body), status
     except Exception as e:
         return jsonify({"success": False, "message": f"Error: {e}"}), 500
 
@@ -298,18 +778,8 @@ def api_login():
 def api_balance(username):
     if not username:
         return jsonify({"success": False, "message": "Username required"}), 400
-    resp = cmd_get_balance(username)
-    if resp is None:
-        return jsonify({"success": False, "message": "Server unreachable"}), 503
-    try:
-        j = json.loads(resp)
-        return jsonify({"success": True, "balance": float(j.get("balance", 0.0))})
-    except Exception:
-        try:
-            val = float(resp.strip())
-            return jsonify({"success": True, "balance": val})
-        except:
-            return jsonify({"success": False, "message": resp}), 400
+    body, status = balance_reply(parse_reply(cmd_get_balance(username)))
+    return jsonify(body), status
 
 @app.route("/api/send", methods=["POST"])
 def api_send():
@@ -320,15 +790,13 @@ def api_send():
         amount = float(data.get("amount", 0.0))
         if not from_user or not to_user or amount <= 0:
             return jsonify({"success": False, "message": "Invalid fields"}), 400
+        try:
+            key = idempotency_key(request.headers, data)
+        except ValueError as e:
+            return jsonify({"success": False, "message": str(e)}), 400
 
-        resp = cmd_send_transaction(from_user, to_user, amount)
-        if resp is None:
-            return jsonify({"success": False, "message": "Server unreachable"}), 503
-
-        low = resp.strip().upper()
-        if "SEND_SUCCESS" in low or "SENT" in low or "OK" in low:
-            return jsonify({"success": True, "message": "Transaction sent"})
-        return jsonify({"success": False, "message": resp}), 400
+        body, status = send_reply(parse_reply(cmd_send_transaction(from_user, to_user, amount, key=key)))
+        return jsonify(body), status
     except Exception as e:
         return jsonify({"success": False, "message": f"Error: {e}"}), 500
 
@@ -336,32 +804,14 @@ def api_send():
 def api_history(username):
     if not username:
         return jsonify({"success": False, "message": "Username required"}), 400
-    resp = cmd_get_history(username)
-    if resp is None:
-        return jsonify({"success": False, "message": "Server unreachable"}), 503
-    try:
-        history = json.loads(resp)
-        if not isinstance(history, list):
-            raise ValueError("History not list")
-        for tx in history:
-            if "amount" in tx:
-                try:
-                    tx["amount"] = float(tx["amount"])
-                except:
-                    pass
-        return jsonify({"success": True, "history": history})
-    except Exception:
-        lines = [ln.strip() for ln in resp.splitlines() if ln.strip()]
-        hist = []
-        for ln in lines:
-            low = ln.lower()
-            item = {"raw": ln}
-            if "sent" in low:
-                item["type"] = "sent"
-            elif "received" in low:
-                item["type"] = "received"
-            hist.append(item)
-        return jsonify({"success": True, "history": hist})
+    body, status = history_reply(parse_reply(cmd_get_history(username)))
+    return jsonify(body), status
+
+@app.route("/api/tx_proof/<transaction_id>")
+def api_tx_proof(transaction_id):
+    """Merkle inclusion proof of a transaction in its block, for wallets to check against the block's tx_root."""
+    body, status = tx_proof_reply(parse_reply(cmd_tx_proof(transaction_id)))
+    return jsonify(body), status
 
 @app.route("/api/airdrop", methods=["POST"])
 def api_airdrop():
@@ -377,14 +827,16 @@ def api_airdrop():
         amount = float(data.get("amount", 10.0))
         if not to_user or amount <= 0:
             return jsonify({"success": False, "message": "Invalid fields"}), 400
+        try:
+            key = idempotency_key(request.headers, data)
+        except ValueError as e:
+            return jsonify({"success": False, "message": str(e)}), 400
 
-        # First try native airdrop
-        resp = cmd_airdrop(to_user, amount)
-        if resp is not None:
-            low = resp.strip().upper()
-            if ("AIR_DROP_SUCCESS" in low) or ("AIRDROP_SUCCESS" in low) or ("OK" in low):
-                return jsonify({"success": True, "message": f"Airdropped +{amount} VNC"})
-            # if it's a hard non-unknown failure and not balance-related, fall through to faucet
+        # First try native airdrop; fall through to the faucet only if it surely credited nothing
+        answer = airdrop_reply(parse_reply(cmd_airdrop(to_user, amount, key=key)), amount)
+        if answer is not None:
+            body, status = answer
+            return jsonify(body), status
 
         # Faucet fallback: ensure accounts
         if not ensure_user(FAUCET_ACCOUNT):
@@ -392,26 +844,23 @@ def api_airdrop():
         ensure_user(to_user)
 
         # Try the transfer once
-        tr = cmd_send_transaction(FAUCET_ACCOUNT, to_user, amount)
-        if tr is None:
+        # Failed sends aren't remembered by the server, so the retry below can reuse this key
+        faucet_key = f"{key}:faucet"
+        tr = parse_reply(cmd_send_transaction(FAUCET_ACCOUNT, to_user, amount, key=faucet_key))
+        if tr is UNREACHABLE_REPLY:
             return jsonify({"success": False, "message": "Server unreachable"}), 503
-        tr_up = tr.strip().upper()
-        if "SEND_SUCCESS" in tr_up or "SENT" in tr_up or "OK" in tr_up:
+        if tr.status == "SEND_SUCCESS":
             return jsonify({"success": True, "message": f"Airdropped +{amount} VNC (faucet)"} )
 
-        # If insufficient balance, parse required and auto-mine FAUCET until enough
-        if "INSUFFICIENT" in tr_up or "REQUIRED:" in tr_up:
-            required, available = parse_required_available(tr)
+        # If insufficient balance, auto-mine FAUCET until it holds the required amount
+        if tr.code == 402:
+            required = (tr.data or {}).get("required")
             target = required if required is not None else (amount + 0.2)  # add cushion for fees if unknown
             # poll/mine loop
             steps = 0
             while steps < FAUCET_MINING_MAX_STEPS:
                 # check current balance
-                b = cmd_get_balance(FAUCET_ACCOUNT) or "0"
-                try:
-                    cur_bal = float(json.loads(b).get("balance")) if b.strip().startswith("{") else float(b.strip())
-                except:
-                    cur_bal = 0.0
+                cur_bal = reply_balance(parse_reply(cmd_get_balance(FAUCET_ACCOUNT)))
                 if cur_bal >= (target or amount):
                     break
                 # mine step
@@ -421,14 +870,13 @@ def api_airdrop():
                 steps += 1
 
             # try transfer again
-            tr2 = cmd_send_transaction(FAUCET_ACCOUNT, to_user, amount) or ""
-            up2 = tr2.strip().upper()
-            if "SEND_SUCCESS" in up2 or "SENT" in up2 or "OK" in up2:
+            tr2 = parse_reply(cmd_send_transaction(FAUCET_ACCOUNT, to_user, amount, key=faucet_key))
+            if tr2.status == "SEND_SUCCESS":
                 return jsonify({"success": True, "message": f"Airdropped +{amount} VNC (faucet)"} )
-            return jsonify({"success": False, "message": tr2}), 400
+            return jsonify({"success": False, "message": tr2.text}), 400
 
         # some other failure
-        return jsonify({"success": False, "message": tr}), 400
+        return jsonify({"success": False, "message": tr.text}), 400
 
     except Exception as e:
         return jsonify({"success": False, "message": f"Error: {e}"}), 500
@@ -461,17 +909,19 @@ def api_mine():
             remaining = end - time.time()
             this_step = step if remaining >= step else max(1, int(remaining))
 
-            resp = cmd_mine(username, this_step)
-            if resp is None:
+            resp = parse_reply(cmd_mine(username, this_step))
+            if resp is UNREACHABLE_REPLY:
                 return jsonify({"success": False, "message": "Server unreachable"}), 503
 
-            last_resp = resp
-            up = resp.strip().upper()
-
-            # Count blocks if your server output includes any of these keywords
-            # (adjust if your server uses different wording)
-            if ("BLOCK" in up and ("MINED" in up or "FOUND" in up)) or ("MINE_SUCCESS" in up):
+            last_resp = resp.text
+            if resp.status == "MINE_SUCCESS":
+                blocks_found += (resp.data or {}).get("blocks_found", 1)
+            elif resp.status == "BLOCK ACCEPTED":
                 blocks_found += 1
+            else:
+                # NOT_READY, MINE_FAILED, ...: retrying until the deadline would only repeat it
+                body, status = mine_error_reply(resp, blocks_found)
+                return jsonify(body), status
 
             # Tiny sleep to avoid hammering the socket loop; optional
             time.sleep(0.05)
@@ -1607,11 +2057,115 @@ $('btnConnect').onclick = async () => {
 </html>
 '''
 
+class PrecompressedPage:
+    """
+    A static HTML body encoded once at startup (identity, gzip and, when the
+    brotli module is installed, br), each variant with its own strong ETag.
+    """
+    def __init__(self, html: str, cache_control: str):
+        body = html.encode(FORMAT)
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        self.cache_control = cache_control
+        self.variants = {"identity": (body, f'"{digest}"')}
+        self.variants["gzip"] = (gzip.compress(body, compresslevel=9, mtime=0), f'"{digest}-gz"')
+        if brotli is not None:
+            self.variants["br"] = (brotli.compress(body, quality=11), f'"{digest}-br"')
+
+    def _pick_encoding(self, accept_encoding: str) -> str:
+        accepted = {}
+        for item in accept_encoding.split(","):
+            name, _, params = item.strip().partition(";")
+            name = name.strip().lower()
+            q = 1.0
+            params = params.strip()
+            if params.startswith("q="):
+                try:
+                    q = float(params[2:])
+                except ValueError:
+                    q = 0.0
+            if name:
+                accepted[name] = q
+        for encoding in ("br", "gzip"):
+            if encoding in self.variants and accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+                return encoding
+        return "identity"
+
+    def _not_modified(self, if_none_match: str, etag: str) -> bool:
+        """Whether If-None-Match names etag, the tag of the variant being served."""
+        for tag in if_none_match.split(","):
+            tag = tag.strip()
+            if tag == "*":
+                return True
+            if tag.startswith("W/"):
+                tag = tag[2:]
+            if tag == etag:
+                return True
+        return False
+
+    def select(self, headers):
+        """Returns (status, body, response headers) for the given request headers."""
+        encoding = self._pick_encoding(headers.get("Accept-Encoding", ""))
+        body, etag = self.variants[encoding]
+        out = {"ETag": etag, "Cache-Control": self.cache_control, "Vary": "Accept-Encoding"}
+
+        if self._not_modified(headers.get("If-None-Match", ""), etag):
+            return 304, b"", out
+        if encoding != "identity":
+            out["Content-Encoding"] = encoding
+        return 200, body, out
+
+    def response(self, headers) -> Response:
+        status, body, out = self.select(headers)
+        if status == 304:
+            resp = Response(status=304)
+        else:
+            resp = Response(body, mimetype="text/html")
+        resp.headers.update(out)
+        return resp
+
+wallet_page = PrecompressedPage(HTML_TEMPLATE, WALLET_CACHE_CONTROL)
+
 @app.route("/wallet")
 def wallet():
-    return HTML_TEMPLATE
+    return wallet_page.response(request.headers)
+
+# -----------------------------
+# Launch modes
+# -----------------------------
+def run_production(bind: str, workers: int, threads: int):
+    """Serve app with pre-forked gunicorn workers (graceful reload on SIGHUP)."""
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        raise SystemExit("Production mode needs gunicorn: pip install gunicorn")
+
+    class BridgeApplication(BaseApplication):
+        def load_config(self):
+            self.cfg.set("bind", bind)
+            self.cfg.set("workers", workers)
+            self.cfg.set("threads", threads)
+            self.cfg.set("worker_class", "gthread")
+            self.cfg.set("graceful_timeout", PROD_GRACEFUL_TIMEOUT)
+            self.cfg.set("worker_exit", lambda _arbiter, _worker: bridge.disconnect())
+
+        def load(self):
+            return app
+
+    print(f"Starting VanillaCoin Web Bridge (production): {workers} workers x {threads} threads on {bind}")
+    BridgeApplication().run()
+
+def main():
+    parser = argparse.ArgumentParser(description="VanillaCoin web bridge")
+    parser.add_argument("--prod", action="store_true", help="run under gunicorn instead of the Flask dev server")
+    parser.add_argument("--bind", default=PROD_BIND, help="host:port to listen on in production mode")
+    parser.add_argument("--workers", type=int, default=PROD_WORKERS, help="worker processes in production mode")
+    parser.add_argument("--threads", type=int, default=PROD_THREADS, help="threads per worker in production mode")
+    args = parser.parse_args()
+
+    if args.prod:
+        run_production(args.bind, max(1, args.workers), max(1, args.threads))
+        return
 
-if __name__ == "__main__":
     try:
         print("Starting VanillaCoin Web Bridge...")
         print("Open http://127.0.0.1:5000/wallet")
@@ -1621,3 +2175,6 @@ if __name__ == "__main__":
     finally:
         bridge.disconnect()
 
+if __name__ == "__main__":
+    main()
+
@@ -0,0 +1,473 @@
+"""
+VanillaCoin web bridge on asyncio (aiohttp).
+
+Same /api/* routes and JSON shapes as web_client_bridge.py, but every
+upstream call is a non-blocking asyncio stream, so thousands of wallet
+sessions can wait on the VanillaCoin server without holding a thread each.
+Framing, the cmd_* helpers, the read cache and reply interpretation all
+come from web_client_bridge; this module only supplies async transports.
+
+    python web_client_bridge_async.py --host 127.0.0.1 --port 5000
+"""
+from aiohttp import web
+import asyncio
+import argparse
+import json
+import os
+import time
+
+from web_client_bridge import (
+    VANILLACOIN_SERVER_HOST, VANILLACOIN_SERVER_PORT, HEADER, FORMAT,
+    FAUCET_ACCOUNT, FAUCET_MINING_STEP_SECONDS, FAUCET_MINING_MAX_STEPS,
+    CACHE_TTLS, CACHE_MAX_ENTRIES, INDEX_HTML, PROTOCOL_REQUEST, UNREACHABLE, UNREACHABLE_REPLY,
+    ResponseCache, encode_frame, parse_frame_header, wallet_page, _rand_password,
+    cmd_check_username, cmd_register, cmd_login, cmd_get_balance, cmd_send_transaction,
+    cmd_get_history, cmd_mine, cmd_airdrop, cmd_metrics, cmd_tx_proof, idempotency_key,
+    parse_reply, reply_balance, render_metrics,
+    check_username_reply, register_reply, login_reply, balance_reply, send_reply, history_reply, tx_proof_reply,
+    airdrop_reply, mine_error_reply,
+)
+
+# -----------------------------
+# Config
+# -----------------------------
+# Upstream sockets are cheap to wait on here, so the pool can be much larger
+# than the threaded bridge's; extra sessions queue on the semaphore.
+ASYNC_UPSTREAM_POOL_SIZE = int(os.environ.get("BRIDGE_ASYNC_POOL_SIZE", "64"))
+UPSTREAM_TIMEOUT = 5.0
+QUIET_TIMEOUT = 0.25
+
+# -----------------------------
+# Async socket bridge
+# -----------------------------
+class AsyncVanillaCoinConnection:
+    def __init__(self, host="127.0.0.1", port=5050):
+        self.server_host = host
+        self.server_port = port
+        self.reader = None
+        self.writer = None
+
+    async def connect(self) -> bool:
+        if self.writer is not None:
+            return True
+        try:
+            self.reader, self.writer = await asyncio.wait_for(
+                asyncio.open_connection(self.server_host, self.server_port), UPSTREAM_TIMEOUT)
+        except Exception as e:
+            print(f"Error connecting to server: {e}")
+            self.reader = self.writer = None
+            return False
+        # Ask for structured replies; older servers keep answering in text.
+        await self.send_message(PROTOCOL_REQUEST)
+        return self.writer is not None
+
+    async def _read_until_quiet(self, first_chunk: bytes, max_total=1_048_576) -> bytes:
+        data = bytearray(first_chunk)
+        while len(data) < max_total:
+            try:
+                chunk = await asyncio.wait_for(self.reader.read(4096), QUIET_TIMEOUT)
+            except asyncio.TimeoutError:
+                break
+            if not chunk:
+                break
+            data.extend(chunk)
+        return bytes(data)
+
+    async def send_message(self, msg: str, timeout=None):
+        if self.writer is None and not await self.connect():
+            return None
+        try:
+            self.writer.write(encode_frame(msg))
+            await self.writer.drain()
+
+            try:
+                header_bytes = await asyncio.wait_for(self.reader.readexactly(HEADER), timeout or UPSTREAM_TIMEOUT)
+            except asyncio.IncompleteReadError as e:
+                # Server closed after a short, unframed reply.
+                self._close()
+                return e.partial.decode(FORMAT, errors="replace")
+
+            resp_len = parse_frame_header(header_bytes)
+            if resp_len is not None:
+                if resp_len <= 0:
+                    return ""
+                data = await asyncio.wait_for(self.reader.readexactly(resp_len), UPSTREAM_TIMEOUT)
+                return data.decode(FORMAT, errors="replace")
+            data = await self._read_until_quiet(header_bytes)
+            return data.decode(FORMAT, errors="replace")
+        except Exception as e:
+            print(f"Error sending message: {e}")
+            self._close()
+            return None
+
+    def _close(self):
+        if self.writer is not None:
+            try:
+                self.writer.close()
+            except Exception:
+                pass
+        self.reader = self.writer = None
+
+    async def disconnect(self):
+        if self.writer is not None:
+            try:
+                self.writer.write(encode_frame("!DISCONNECT"))
+                await self.writer.drain()
+            except Exception:
+                pass
+            self._close()
+
+class AsyncBridgePool:
+    """Bounded pool of upstream connections; waiting sessions queue on a semaphore."""
+    def __init__(self, host="127.0.0.1", port=5050, size=64):
+        self.server_host = host
+        self.server_port = port
+        self.size = size
+        self._idle = []
+        self._slots = asyncio.Semaphore(size)
+
+    def _checkout(self) -> AsyncVanillaCoinConnection:
+        if self._idle:
+            return self._idle.pop()
+        return AsyncVanillaCoinConnection(self.server_host, self.server_port)
+
+    async def connect(self) -> bool:
+        async with self._slots:
+            conn = self._checkout()
+            try:
+                return await conn.connect()
+            finally:
+                self._idle.append(conn)
+
+    async def send_message(self, msg: str, timeout=None):
+        async with self._slots:
+            conn = self._checkout()
+            try:
+                return await conn.send_message(msg, timeout)
+            finally:
+                self._idle.append(conn)
+
+    async def disconnect(self):
+        idle, self._idle = self._idle, []
+        for conn in idle:
+            await conn.disconnect()
+
+# -----------------------------
+# Async read cache and command channel
+# -----------------------------
+class _AsyncPendingFetch:
+    __slots__ = ("future", "invalidated")
+
+    def __init__(self):
+        self.future = asyncio.get_running_loop().create_future()
+        self.invalidated = False
+
+class AsyncResponseCache(ResponseCache):
+    """ResponseCache whose coalesced waiters await a future instead of blocking."""
+    async def get_or_fetch(self, endpoint: str, username: str, fetch):
+        key = (endpoint, username)
+        state, found = self._begin(key, _AsyncPendingFetch)
+        if state == "hit":
+            return found
+        if state == "wait":
+            return await asyncio.shield(found.future)
+
+        value = None
+        try:
+            value = await fetch()
+        finally:
+            self._finish(key, found, value)
+            found.future.set_result(value)
+        return value
+
+class AsyncCommandChannel:
+    """Coroutine counterpart of web_client_bridge.CommandChannel."""
+    def __init__(self, pool, cache):
+        self.pool = pool
+        self.cache = cache
+
+    async def call(self, msg: str):
+        return await self.pool.send_message(msg)
+
+    async def read(self, endpoint: str, username: str, msg: str):
+        return await self.cache.get_or_fetch(endpoint, username, lambda: self.pool.send_message(msg))
+
+    async def write(self, msg: str, users, endpoints=("balance", "history"), retries=0, timeout=None):
+        resp = await self.pool.send_message(msg, timeout)
+        while resp is None and retries > 0:
+            retries -= 1
+            resp = await self.pool.send_message(msg, timeout)
+        for username in users:
+            self.cache.invalidate(username, endpoints)
+        return resp
+
+# Created inside the running loop by init_bridge().
+abridge = None
+achannel = None
+response_cache = AsyncResponseCache(CACHE_TTLS, CACHE_MAX_ENTRIES)
+
+async def init_bridge(_app):
+    global abridge, achannel
+    abridge = AsyncBridgePool(VANILLACOIN_SERVER_HOST, VANILLACOIN_SERVER_PORT, ASYNC_UPSTREAM_POOL_SIZE)
+    achannel = AsyncCommandChannel(abridge, response_cache)
+
+async def close_bridge(_app):
+    if abridge is not None:
+        await abridge.disconnect()
+
+async def ensure_user(username: str) -> bool:
+    reply = parse_reply(await cmd_check_username(username, via=achannel))
+    if reply.status == "USERNAME_AVAILABLE":
+        pw = _rand_password()
+        reg = parse_reply(await cmd_register(username, pw, json.dumps([]), json.dumps({}), via=achannel))
+        return reg.status == "REGISTRATION_SUCCESS"
+    return reply.status == "USERNAME_TAKEN"
+
+# -----------------------------
+# HTTP plumbing
+# -----------------------------
+def reply(body, status=200):
+    return web.json_response(body, status=status)
+
+async def read_json(request):
+    # Flask's get_json(force=True) ignores Content-Type; do the same.
+    return json.loads(await request.text() or "null")
+
+@web.middleware
+async def cors_middleware(request, handler):
+    if request.method == "OPTIONS":
+        resp = web.Response()
+        resp.headers["Access-Control-Allow-Methods"] = "GET, POST, OPTIONS"
+        resp.headers["Access-Control-Allow-Headers"] = request.headers.get("Access-Control-Request-Headers", "*")
+    else:
+        resp = await handler(request)
+    resp.headers["Access-Control-Allow-Origin"] = "*"
+    return resp
+
+routes = web.RouteTableDef()
+
+@routes.get("/")
+async def index(request):
+    return web.Response(text=INDEX_HTML, content_type="text/html")
+
+@routes.get("/wallet")
+async def wallet(request):
+    status, body, headers = wallet_page.select(request.headers)
+    if status == 304:
+        return web.Response(status=304, headers=headers)
+    return web.Response(body=body, content_type="text/html", charset=FORMAT, headers=headers)
+
+@routes.get("/api/ping")
+async def api_ping(request):
+    return reply({"ok": True})
+
+@routes.get("/api/cache/stats")
+async def api_cache_stats(request):
+    return reply({"success": True, "cache": response_cache.stats()})
+
+@routes.get("/metrics")
+async def metrics(request):
+    text = render_metrics(parse_reply(await cmd_metrics(via=achannel)), response_cache.stats())
+    return web.Response(text=text, content_type="text/plain")
+
+# -----------------------------
+# JSON API
+# -----------------------------
+@routes.post("/api/connect")
+async def api_connect(request):
+    return reply({"success": await abridge.connect()})
+
+@routes.get("/api/check_username/{username}")
+async def api_check_username(request):
+    username = request.match_info["username"]
+    if not username:
+        return reply({"success": False, "message": "Username required"}, 400)
+    return reply(*check_username_reply(parse_reply(await cmd_check_username(username, via=achannel))))
+
+@routes.post("/api/register")
+async def api_register(request):
+    try:
+        data = await read_json(request)
+        username = data.get("username", "").strip()
+        password = data.get("password", "")
+        word_list = data.get("word_list", [])
+        hardware_info = data.get("hardware_info", {})
+        if not username or not password:
+            return reply({"success": False, "message": "Username and password required"}, 400)
+
+        resp = await cmd_register(username, password, json.dumps(word_list), json.dumps(hardware_info), via=achannel)
+        return reply(*register_reply(parse_reply(resp)))
+    except Exception as e:
+        return reply({"success": False, "message": f"Error: {e}"}, 500)
+
+@routes.post("/api/login")
+async def api_login(request):
+    try:
+        data = await read_json(request)
+        username = data.get("username", "").strip()
+        password = data.get("password", "")
+        word_list = data.get("word_list", [])
+        hardware_info = data.get("hardware_info", {})
+        if not username:
+            return reply({"success": False, "message": "Username required"}, 400)
+
+        resp = await cmd_login(username, password or "__HWID_ONLY__", json.dumps(word_list),
+                               json.dumps(hardware_info), via=achannel)
+        return reply(*login_reply(parse_reply(resp)))
+    except Exception as e:
+        return reply({"success": False, "message": f"Error: {e}"}, 500)
+
+@routes.get("/api/balance/{username}")
+async def api_balance(request):
+    username = request.match_info["username"]
+    if not username:
+        return reply({"success": False, "message": "Username required"}, 400)
+    return reply(*balance_reply(parse_reply(await cmd_get_balance(username, via=achannel))))
+
+@routes.post("/api/send")
+async def api_send(request):
+    try:
+        data = await read_json(request)
+        from_user = data.get("from", "").strip()
+        to_user = data.get("to", "").strip()
+        amount = float(data.get("amount", 0.0))
+        if not from_user or not to_user or amount <= 0:
+            return reply({"success": False, "message": "Invalid fields"}, 400)
+        try:
+            key = idempotency_key(request.headers, data)
+        except ValueError as e:
+            return reply({"success": False, "message": str(e)}, 400)
+
+        resp = await cmd_send_transaction(from_user, to_user, amount, via=achannel, key=key)
+        return reply(*send_reply(parse_reply(resp)))
+    except Exception as e:
+        return reply({"success": False, "message": f"Error: {e}"}, 500)
+
+@routes.get("/api/history/{username}")
+async def api_history(request):
+    username = request.match_info["username"]
+    if not username:
+        return reply({"success": False, "message": "Username required"}, 400)
+    return reply(*history_reply(parse_reply(await cmd_get_history(username, via=achannel))))
+
+@routes.get("/api/tx_proof/{transaction_id}")
+async def api_tx_proof(request):
+    transaction_id = request.match_info["transaction_id"]
+    return reply(*tx_proof_reply(parse_reply(await cmd_tx_proof(transaction_id, via=achannel))))
+
+@routes.post("/api/airdrop")
+async def api_airdrop(request):
+    """Same flow as web_client_bridge.api_airdrop: native AIR_DROP, then faucet fallback."""
+    try:
+        data = await read_json(request)
+        to_user = data.get("to", "").strip()
+        amount = float(data.get("amount", 10.0))
+        if not to_user or amount <= 0:
+            return reply({"success": False, "message": "Invalid fields"}, 400)
+        try:
+            key = idempotency_key(request.headers, data)
+        except ValueError as e:
+            return reply({"success": False, "message": str(e)}, 400)
+
+        answer = airdrop_reply(parse_reply(await cmd_airdrop(to_user, amount, via=achannel, key=key)), amount)
+        if answer is not None:
+            return reply(*answer)
+
+        if not await ensure_user(FAUCET_ACCOUNT):
+            return reply({"success": False, "message": "Faucet account could not be created"}, 500)
+        await ensure_user(to_user)
+
+        faucet_key = f"{key}:faucet"
+        tr = parse_reply(await cmd_send_transaction(FAUCET_ACCOUNT, to_user, amount, via=achannel, key=faucet_key))
+        if tr is UNREACHABLE_REPLY:
+            return reply(*UNREACHABLE)
+        if tr.status == "SEND_SUCCESS":
+            return reply({"success": True, "message": f"Airdropped +{amount} VNC (faucet)"})
+
+        if tr.code == 402:
+            required = (tr.data or {}).get("required")
+            target = required if required is not None else (amount + 0.2)
+            steps = 0
+            while steps < FAUCET_MINING_MAX_STEPS:
+                cur_bal = reply_balance(parse_reply(await cmd_get_balance(FAUCET_ACCOUNT, via=achannel)))
+                if cur_bal >= (target or amount):
+                    break
+                await cmd_mine(FAUCET_ACCOUNT, FAUCET_MINING_STEP_SECONDS, via=achannel)
+                await asyncio.sleep(0.2)
+                steps += 1
+
+            tr2 = parse_reply(await cmd_send_transaction(FAUCET_ACCOUNT, to_user, amount, via=achannel, key=faucet_key))
+            if tr2.status == "SEND_SUCCESS":
+                return reply({"success": True, "message": f"Airdropped +{amount} VNC (faucet)"})
+            return reply({"success": False, "message": tr2.text}, 400)
+
+        return reply({"success": False, "message": tr.text}, 400)
+
+    except Exception as e:
+        return reply({"success": False, "message": f"Error: {e}"}, 500)
+
+@routes.post("/api/mine")
+async def api_mine(request):
+    """Same stepping loop as web_client_bridge.api_mine, without holding a thread."""
+    try:
+        data = await read_json(request)
+        username = data.get("username", "").strip()
+        seconds = int(data.get("seconds", 10))
+        if not username or seconds <= 0:
+            return reply({"success": False, "message": "Username and seconds required"}, 400)
+
+        step = int(data.get("step", 2))
+        step = max(1, min(step, 10))
+
+        start = time.time()
+        end = start + seconds
+        blocks_found = 0
+        last_resp = ""
+
+        while time.time() < end:
+            remaining = end - time.time()
+            this_step = step if remaining >= step else max(1, int(remaining))
+
+            resp = parse_reply(await cmd_mine(username, this_step, via=achannel))
+            if resp is UNREACHABLE_REPLY:
+                return reply(*UNREACHABLE)
+
+            last_resp = resp.text
+            if resp.status == "MINE_SUCCESS":
+                blocks_found += (resp.data or {}).get("blocks_found", 1)
+            elif resp.status == "BLOCK ACCEPTED":
+                blocks_found += 1
+            else:
+                return reply(*mine_error_reply(resp, blocks_found))
+            await asyncio.sleep(0.05)
+
+        elapsed = time.time() - start
+        return reply({
+            "success": True,
+            "message": f"Mined for {elapsed:.1f}s (requested {seconds}s). Blocks found: {blocks_found}.",
+            "blocks_found": blocks_found,
+            "last_response": last_resp
+        })
+
+    except Exception as e:
+        return reply({"success": False, "message": f"Error: {e}"}, 500)
+
+def create_app() -> web.Application:
+    app = web.Application(middlewares=[cors_middleware])
+    app.add_routes(routes)
+    app.on_startup.append(init_bridge)
+    app.on_cleanup.append(close_bridge)
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description="VanillaCoin web bridge (asyncio)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    args = parser.parse_args()
+
+    print("Starting VanillaCoin Web Bridge (asyncio)...")
+    print(f"Open http://{args.host}:{args.port}/wallet")
+    web.run_app(create_app(), host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()